@@ -1,700 +1,357 @@
-import requests
-from bs4 import BeautifulSoup
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, abort, g, request, jsonify
 import logging
+import time
+from contextlib import nullcontext
+
+from assets import get_asset
+from audit import AUDIT_MAX_URLS, AuditSummary, Sitemap, iter_audit
+from batch import BATCH_MAX_URLS, BATCH_STREAM_MAX_URLS, iter_batch, run_batch
+from cache import cache_key, get_cache
+from extractor import InvalidURLError, describe_error, extract, flights, normalize_url
+from fetcher import head_results
+from history import get_history
+from jobs import JOBS_MAX_URLS, describe_job, ensure_job_runner, get_job_store, submit_job
+from metrics import ERRORS, HTTP_IN_FLIGHT, HTTP_REQUESTS, PHASE_SECONDS, render as render_metrics, request_timings
+from payloads import JSONProvider, columnar, dumps, gzip_response
+from profiling import PROFILE_SAMPLE_INTERVAL, collect as collect_profile, profile_thread, profiled
+from projection import Fields, InvalidFieldsError
+from resolver import dns_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-app = Flask(__name__)
-
-# --- HTML Template (Updated) ---
-# See section 2 below for the new HTML/CSS/JS
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Meta Tag Verifier</title>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" integrity="sha512-9usAa10IRO0HhonpyAIVpjrylPvoDwiPUiKdWk5t3PyolY1cOd4DSE0Ga+ri4AuTroPR5aQvXU9xC6qOPnzFeg==" crossorigin="anonymous" referrerpolicy="no-referrer" />
-    <style>
-        :root {
-            --primary-color: #007bff;
-            --secondary-color: #6c757d;
-            --background-color: #f8f9fa;
-            --card-background: #ffffff;
-            --border-color: #dee2e6;
-            --text-color: #212529;
-            --light-text: #6c757d;
-            --error-color: #dc3545;
-            --success-color: #28a745;
-            --font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Oxygen, Ubuntu, Cantarell, "Open Sans", "Helvetica Neue", sans-serif;
-        }
-        body {
-            font-family: var(--font-family);
-            line-height: 1.6;
-            padding: 20px;
-            background-color: var(--background-color);
-            color: var(--text-color);
-            margin: 0;
-        }
-        .container {
-            max-width: 900px;
-            margin: 20px auto;
-            background-color: var(--card-background);
-            padding: 30px;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        h1 {
-            color: var(--primary-color);
-            text-align: center;
-            margin-bottom: 30px;
-            font-weight: 600;
-        }
-        #url-form {
-            display: flex;
-            gap: 10px;
-            margin-bottom: 30px;
-        }
-        #urlInput {
-            flex-grow: 1;
-            padding: 12px 15px;
-            border: 1px solid var(--border-color);
-            border-radius: 4px;
-            font-size: 1rem;
-        }
-        #submitButton {
-            padding: 12px 20px;
-            background-color: var(--primary-color);
-            color: white;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 1rem;
-            transition: background-color 0.2s ease-in-out;
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        #submitButton:hover:not(:disabled) {
-            background-color: #0056b3;
-        }
-        #submitButton:disabled {
-            background-color: var(--secondary-color);
-            cursor: not-allowed;
-        }
-        .spinner {
-            width: 16px;
-            height: 16px;
-            border: 2px solid rgba(255, 255, 255, 0.3);
-            border-radius: 50%;
-            border-top-color: #fff;
-            animation: spin 1s ease-in-out infinite;
-        }
-        @keyframes spin {
-            to { transform: rotate(360deg); }
-        }
-        #results-container {
-            margin-top: 20px;
-            padding-top: 20px;
-            border-top: 1px solid var(--border-color);
-        }
-        #results-status {
-            margin-bottom: 20px;
-            padding: 15px;
-            border-radius: 4px;
-            font-weight: 500;
-        }
-        #results-status.loading {
-            background-color: #e9ecef;
-            color: var(--light-text);
-            text-align: center;
-        }
-        #results-status.error {
-            background-color: #f8d7da;
-            color: var(--error-color);
-            border: 1px solid #f5c6cb;
-        }
-        #results-status.success {
-            background-color: #d4edda;
-            color: #155724;
-            border: 1px solid #c3e6cb;
-        }
-        #results-status a {
-            color: var(--primary-color);
-            text-decoration: none;
-            font-weight: bold;
-        }
-        #results-status a:hover {
-            text-decoration: underline;
-        }
-        .meta-section {
-            margin-bottom: 25px;
-            border: 1px solid var(--border-color);
-            border-radius: 5px;
-            overflow: hidden; /* Contain borders */
-        }
-        .meta-section h3 {
-            background-color: #e9ecef;
-            padding: 10px 15px;
-            margin: 0;
-            font-size: 1.1rem;
-            font-weight: 600;
-            border-bottom: 1px solid var(--border-color);
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        .meta-section h3 i {
-            color: var(--primary-color);
-        }
-        .meta-content {
-            padding: 15px;
-        }
-        .meta-item {
-            display: grid;
-            grid-template-columns: auto 1fr auto;
-            gap: 5px 15px; /* row-gap column-gap */
-            padding: 8px 0;
-            border-bottom: 1px dashed #eee;
-            align-items: start; /* Align items to the top */
-        }
-        .meta-item:last-child {
-            border-bottom: none;
-        }
-        .meta-key {
-            font-weight: bold;
-            color: var(--primary-color);
-            text-align: right;
-            white-space: nowrap;
-        }
-        .meta-value {
-            word-wrap: break-word;
-            white-space: pre-wrap; /* Preserve whitespace formatting */
-            font-family: monospace;
-            background-color: #f8f9fa;
-            padding: 3px 6px;
-            border-radius: 3px;
-            font-size: 0.9em;
-            line-height: 1.4;
-        }
-        .meta-value.missing {
-            color: var(--error-color);
-            font-style: italic;
-            background-color: transparent;
-            padding: 0;
-        }
-        .meta-value img {
-            max-width: 100%;
-            height: auto;
-            max-height: 150px; /* Limit preview height */
-            display: block;
-            margin-top: 5px;
-            border: 1px solid var(--border-color);
-            border-radius: 4px;
-        }
-        .copy-button {
-            background: none;
-            border: none;
-            color: var(--secondary-color);
-            cursor: pointer;
-            font-size: 0.9em;
-            padding: 5px;
-            line-height: 1; /* Ensure icon aligns well */
-            transition: color 0.2s;
-        }
-        .copy-button:hover {
-            color: var(--primary-color);
-        }
-        .raw-attributes {
-            font-size: 0.85em;
-            color: var(--light-text);
-            margin-top: 5px;
-            white-space: pre-wrap;
-            word-break: break-all;
-            background-color: #f8f9fa;
-            padding: 5px;
-            border-radius: 3px;
-        }
-        .char-count {
-            font-size: 0.85em;
-            color: var(--light-text);
-            margin-top: 6px;
-        }
-        /* (Loading bar removed) */
-        details { /* Style the collapsible raw section */
-            border: 1px solid var(--border-color);
-            border-radius: 5px;
-            margin-top: 15px;
-        }
-        details summary {
-            background-color: #e9ecef;
-            padding: 10px 15px;
-            cursor: pointer;
-            font-weight: 600;
-            outline: none; /* Remove focus outline */
-        }
-        details summary:hover {
-            background-color: #d8dde2;
-        }
-        .raw-tag-list {
-            padding: 15px;
-            max-height: 400px;
-            overflow-y: auto;
-            font-family: monospace;
-            font-size: 0.9em;
-            line-height: 1.5;
-        }
-        .raw-tag {
-            border-bottom: 1px dashed #eee;
-            padding-bottom: 8px;
-            margin-bottom: 8px;
-        }
-        .raw-tag:last-child {
-            border-bottom: none;
-            margin-bottom: 0;
-        }
-        .attr-name {
-            font-weight: bold;
-            color: #0056b3;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1><i class="fas fa-tags"></i> Meta Tag Verifier</h1>
-
-        <div id="url-form">
-            <input type="url" id="urlInput" placeholder="Enter website URL (e.g., https://www.example.com)" required>
-            <button id="submitButton">
-                <span id="button-text">Verify</span>
-                <div id="spinner" class="spinner" style="display: none;"></div>
-            </button>
-        </div>
-
-        <div id="results-container" style="display: none;">
-            <div id="results-status"></div>
-            <div id="canonical-box" style="display:none; margin-bottom:12px; padding:10px; border-radius:4px; border:1px solid var(--border-color); background-color: #fff;">
-                <strong>Canonical URL:</strong>
-                <a id="canonical-link" href="#" target="_blank" rel="noopener noreferrer" style="margin-left:8px;"></a>
-                <span id="canonical-message" style="margin-left:8px; color:var(--light-text);"></span>
-            </div>
-            <div id="results-content">
-                <!-- Results will be populated here -->
-            </div>
-        </div>
-         <div id="initial-message">
-             Enter a URL above and click "Verify" to see its metadata.
-         </div>
-    </div>
-
-    <script>
-        const urlInput = document.getElementById('urlInput');
-        const submitButton = document.getElementById('submitButton');
-        const buttonText = document.getElementById('button-text');
-        const spinner = document.getElementById('spinner');
-        const resultsContainer = document.getElementById('results-container');
-        const resultsStatus = document.getElementById('results-status');
-        const resultsContent = document.getElementById('results-content');
-        const initialMessage = document.getElementById('initial-message');
-        const canonicalBox = document.getElementById('canonical-box');
-        const canonicalLink = document.getElementById('canonical-link');
-        const canonicalMessage = document.getElementById('canonical-message');
-
-        // --- Helper Functions ---
-        function escapeHtml(unsafe) {
-            if (unsafe === null || unsafe === undefined) return '';
-            return unsafe
-                 .toString()
-                 .replace(/&/g, "&amp;")
-                 .replace(/</g, "&lt;")
-                 .replace(/>/g, "&gt;")
-                 .replace(/"/g, "&quot;")
-                 .replace(/'/g, "&#039;");
-        }
-
-        function createCopyButton(textToCopy) {
-            const button = document.createElement('button');
-            button.className = 'copy-button';
-            button.innerHTML = '<i class="far fa-copy"></i>';
-            button.title = 'Copy value';
-            button.onclick = () => {
-                navigator.clipboard.writeText(textToCopy).then(() => {
-                    button.innerHTML = '<i class="fas fa-check" style="color: var(--success-color);"></i>';
-                    setTimeout(() => { button.innerHTML = '<i class="far fa-copy"></i>'; }, 1500);
-                }).catch(err => {
-                    console.error('Failed to copy: ', err);
-                    alert('Failed to copy text.');
-                });
-            };
-            return button;
-        }
-
-        function createMetaItem(key, value, container, isImportant = false, isImage = false) {
-            const itemDiv = document.createElement('div');
-            itemDiv.className = 'meta-item';
-
-            const keySpan = document.createElement('span');
-            keySpan.className = 'meta-key';
-            keySpan.textContent = key + ':';
-            itemDiv.appendChild(keySpan);
-
-            const valueSpan = document.createElement('span');
-            valueSpan.className = 'meta-value';
-            if (value) {
-                valueSpan.textContent = value;
-                if (isImage) {
-                    const img = document.createElement('img');
-                    img.src = value;
-                    img.alt = `${key} preview`;
-                    img.onerror = () => { img.style.display = 'none'; }; // Hide if image fails to load
-                    valueSpan.appendChild(img);
-                }
-                // If the key is a description or title (page, og, twitter), show character count
-                try {
-                    const keyLower = (key || '').toString().toLowerCase();
-                    if (keyLower.includes('description') || keyLower.includes('title')) {
-                        const textVal = (typeof value === 'string') ? value : String(value || '');
-                        const countDiv = document.createElement('div');
-                        countDiv.className = 'char-count';
-                        countDiv.textContent = `${textVal.length} characters`;
-                        valueSpan.appendChild(countDiv);
-                    }
-                } catch (e) {
-                    // Defensive: if value is not convertible, skip counting
-                }
-            } else {
-                valueSpan.textContent = '(Not set or empty)';
-                valueSpan.classList.add('missing');
-            }
-            itemDiv.appendChild(valueSpan);
-
-            if (value && isImportant) {
-                itemDiv.appendChild(createCopyButton(value));
-            } else {
-                 itemDiv.appendChild(document.createElement('span')); // Placeholder for grid alignment
-            }
-
-            container.appendChild(itemDiv);
-        }
-
-        function displayResults(data, url) {
-            resultsContent.innerHTML = ''; // Clear previous results
-            initialMessage.style.display = 'none';
-            resultsContainer.style.display = 'block';
-
-            const { title, metadata, canonical } = data;
-
-            // --- Status Message ---
-            const safeUrl = escapeHtml(url);
-            resultsStatus.className = 'success';
-            resultsStatus.innerHTML = `Successfully fetched metadata for: <a href="${safeUrl}" target="_blank" rel="noopener noreferrer">${safeUrl}</a>`;
-
-            // Display canonical URL or a friendly message when missing
-            if (canonical) {
-                const safeCanonical = escapeHtml(canonical);
-                canonicalLink.href = safeCanonical;
-                canonicalLink.textContent = safeCanonical;
-                canonicalMessage.textContent = '';
-                canonicalBox.style.display = 'block';
-            } else {
-                canonicalLink.href = '#';
-                canonicalLink.textContent = '';
-                canonicalMessage.textContent = 'No canonical link found in the page head.';
-                canonicalBox.style.display = 'block';
-            }
-
-            // --- Prepare Data Structures ---
-            const generalMeta = {};
-            const ogMeta = {};
-            const twitterMeta = {};
-            const otherMeta = []; // Keep raw structure for 'other'
-
-            // --- Extract Title ---
-            generalMeta['page_title'] = title || null; // Use a distinct key
-
-            // --- Process Meta Tags ---
-            const metaMap = new Map(); // Use map to easily find tags by name/property
-            metadata.forEach(tag => {
-                const attrs = tag.attributes;
-                if (attrs.name) metaMap.set(attrs.name.toLowerCase(), attrs.content);
-                if (attrs.property) metaMap.set(attrs.property.toLowerCase(), attrs.content);
-                if (attrs.charset) metaMap.set('charset', attrs.charset); // Handle charset separately
-                if (attrs.hasOwnProperty('http-equiv')) metaMap.set(`http-equiv-${attrs['http-equiv'].toLowerCase()}`, attrs.content);
-
-                // Categorize for display
-                if (attrs.property?.startsWith('og:')) {
-                    ogMeta[attrs.property] = attrs.content;
-                } else if (attrs.name?.startsWith('twitter:')) {
-                    twitterMeta[attrs.name] = attrs.content;
-                } else if (attrs.name && ['description', 'keywords', 'author', 'viewport'].includes(attrs.name.toLowerCase())) {
-                    generalMeta[attrs.name.toLowerCase()] = attrs.content;
-                } else if (attrs.charset) {
-                     generalMeta['charset'] = attrs.charset;
-                } else {
-                    otherMeta.push(tag); // Keep the original structure for the raw list
-                }
-            });
-
-             // Ensure common general tags are present, even if null
-            ['description', 'keywords', 'author', 'viewport', 'charset'].forEach(key => {
-                if (!generalMeta.hasOwnProperty(key)) {
-                    generalMeta[key] = null;
-                }
-            });
-             // Ensure common OG tags are present
-            ['og:title', 'og:description', 'og:image', 'og:url', 'og:type', 'og:site_name'].forEach(key => {
-                 if (!ogMeta.hasOwnProperty(key)) {
-                    ogMeta[key] = null;
-                 }
-            });
-             // Ensure common Twitter tags are present
-            ['twitter:card', 'twitter:title', 'twitter:description', 'twitter:image', 'twitter:site'].forEach(key => {
-                 if (!twitterMeta.hasOwnProperty(key)) {
-                    twitterMeta[key] = null;
-                 }
-            });
-
-
-            // --- Build HTML Sections ---
-
-            // 1. General Section
-            const generalSection = document.createElement('div');
-            generalSection.className = 'meta-section';
-            generalSection.innerHTML = '<h3><i class="fas fa-info-circle"></i> General</h3>';
-            const generalContent = document.createElement('div');
-            generalContent.className = 'meta-content';
-            createMetaItem('Page Title', generalMeta.page_title, generalContent, true);
-            createMetaItem('Description', generalMeta.description, generalContent, true);
-            createMetaItem('Keywords', generalMeta.keywords, generalContent, false); // Less important now
-            createMetaItem('Author', generalMeta.author, generalContent, false);
-            createMetaItem('Viewport', generalMeta.viewport, generalContent, false);
-            createMetaItem('Charset', generalMeta.charset, generalContent, false);
-            generalSection.appendChild(generalContent);
-            resultsContent.appendChild(generalSection);
-
-            // 2. Open Graph Section
-            const ogSection = document.createElement('div');
-            ogSection.className = 'meta-section';
-            ogSection.innerHTML = '<h3><i class="fab fa-facebook-square"></i> Open Graph (Facebook, LinkedIn, etc.)</h3>';
-            const ogContent = document.createElement('div');
-            ogContent.className = 'meta-content';
-            createMetaItem('og:title', ogMeta['og:title'], ogContent, true);
-            createMetaItem('og:description', ogMeta['og:description'], ogContent, true);
-            createMetaItem('og:image', ogMeta['og:image'], ogContent, true, true); // Mark as image
-            createMetaItem('og:url', ogMeta['og:url'], ogContent, true);
-            createMetaItem('og:type', ogMeta['og:type'], ogContent, false);
-            createMetaItem('og:site_name', ogMeta['og:site_name'], ogContent, false);
-            // Add any other found OG tags
-            for (const [key, value] of Object.entries(ogMeta)) {
-                if (!['og:title', 'og:description', 'og:image', 'og:url', 'og:type', 'og:site_name'].includes(key)) {
-                     createMetaItem(key, value, ogContent, false, key.endsWith(':image'));
-                }
-            }
-            ogSection.appendChild(ogContent);
-            resultsContent.appendChild(ogSection);
-
-            // 3. Twitter Card Section
-            const twitterSection = document.createElement('div');
-            twitterSection.className = 'meta-section';
-            twitterSection.innerHTML = '<h3><i class="fab fa-twitter-square"></i> Twitter Card</h3>';
-            const twitterContent = document.createElement('div');
-            twitterContent.className = 'meta-content';
-            createMetaItem('twitter:card', twitterMeta['twitter:card'], twitterContent, true);
-            createMetaItem('twitter:title', twitterMeta['twitter:title'], twitterContent, true);
-            createMetaItem('twitter:description', twitterMeta['twitter:description'], twitterContent, true);
-            createMetaItem('twitter:image', twitterMeta['twitter:image'], twitterContent, true, true); // Mark as image
-            createMetaItem('twitter:site', twitterMeta['twitter:site'], twitterContent, false);
-             // Add any other found Twitter tags
-            for (const [key, value] of Object.entries(twitterMeta)) {
-                if (!['twitter:card', 'twitter:title', 'twitter:description', 'twitter:image', 'twitter:site'].includes(key)) {
-                     createMetaItem(key, value, twitterContent, false, key.endsWith(':image'));
-                }
-            }
-            twitterSection.appendChild(twitterContent);
-            resultsContent.appendChild(twitterSection);
-
-            // 4. All Raw Meta Tags Section (Collapsible)
-            if (metadata.length > 0) {
-                const details = document.createElement('details');
-                const summary = document.createElement('summary');
-                summary.textContent = `All Raw Meta Tags (${metadata.length})`;
-                details.appendChild(summary);
-
-                const rawListDiv = document.createElement('div');
-                rawListDiv.className = 'raw-tag-list';
-                metadata.forEach(tag => {
-                    const tagDiv = document.createElement('div');
-                    tagDiv.className = 'raw-tag';
-                    let attributesHTML = '';
-                    for (const [key, value] of Object.entries(tag.attributes)) {
-                        attributesHTML += `<span class="attr-name">${escapeHtml(key)}</span>: "${escapeHtml(value)}"<br>`;
-                    }
-                    tagDiv.innerHTML = attributesHTML || '<i>(Empty meta tag)</i>';
-                    rawListDiv.appendChild(tagDiv);
-                });
-                details.appendChild(rawListDiv);
-                resultsContent.appendChild(details);
-            }
-        }
-
-        // --- Event Listener ---
-        submitButton.addEventListener('click', async () => {
-            const url = urlInput.value.trim();
-            if (!url) {
-                resultsContainer.style.display = 'block';
-                initialMessage.style.display = 'none';
-                resultsStatus.className = 'error';
-                resultsStatus.textContent = 'Please enter a URL.';
-                resultsContent.innerHTML = '';
-                return;
-            }
-
-            // --- Update UI for Loading State ---
-            resultsContainer.style.display = 'block';
-            initialMessage.style.display = 'none';
-            resultsStatus.className = 'loading';
-            resultsStatus.textContent = 'Fetching and extracting metadata...';
-            resultsContent.innerHTML = ''; // Clear previous results
-            // (loading bar removed)
-            submitButton.disabled = true;
-            spinner.style.display = 'inline-block';
-            buttonText.textContent = 'Verifying...';
-
-            try {
-                const response = await fetch('/extract', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ url: url }),
-                });
-
-                const data = await response.json();
-
-                if (!response.ok) {
-                    throw new Error(data.error || `HTTP error! Status: ${response.status}`);
-                }
-
-                displayResults(data, url); // Pass URL for display
-
-            } catch (error) {
-                console.error('Error:', error);
-                resultsStatus.className = 'error';
-                resultsStatus.textContent = `Error: ${error.message}`;
-                resultsContent.innerHTML = ''; // Clear content area on error
-              } finally {
-                 // --- Restore UI from Loading State ---
-                 submitButton.disabled = false;
-                 spinner.style.display = 'none';
-                 buttonText.textContent = 'Verify';
-            }
-        });
-
-        // Optional: Allow pressing Enter in the input field
-        urlInput.addEventListener('keypress', (event) => {
-            if (event.key === 'Enter') {
-                event.preventDefault();
-                submitButton.click();
-            }
-        });
-    </script>
-</body>
-</html>
-"""
+app = Flask(__name__, static_folder=None)  # static/ is served by assets.py
+app.json = JSONProvider(app)  # orjson when installed
+
+@app.before_request
+def start_jobs():
+    """Starts this worker's background job runners on its first request, so interrupted jobs resume after a restart.
+
+    Not at import: a process forking workers after importing the app (gunicorn --preload) would
+    start threads that do not survive the fork.
+    """
+    ensure_job_runner()
+
+@app.before_request
+def count_in_flight():
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    HTTP_IN_FLIGHT.inc(g.metrics_endpoint)
+
+@app.after_request
+def count_response(response):
+    HTTP_REQUESTS.inc(g.metrics_endpoint, str(response.status_code))
+    g.metrics_counted = True
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzips JSON, NDJSON and text responses for clients that accept it (static assets come precompressed)."""
+    return gzip_response(response, request)
+
+@app.teardown_request
+def count_finished(exc):
+    if 'metrics_endpoint' in g:
+        if exc is not None and not g.get('metrics_counted'):
+            # An unhandled error skips after_request, unless Flask turned it into a 500 response (not propagated)
+            HTTP_REQUESTS.inc(g.metrics_endpoint, '500')
+        HTTP_IN_FLIGHT.dec(g.metrics_endpoint)
 
 @app.route('/')
 def index():
-    """Serves the main HTML page."""
-    return render_template_string(HTML_TEMPLATE)
+    """Serves the main HTML page (static/index.html, precompressed and cached)."""
+    return get_asset('index.html').response(request)
+
+@app.route('/static/<name>')
+def static_asset(name):
+    """Serves the page's CSS and JS with long-lived cache headers."""
+    asset = get_asset(name)
+    if asset is None:
+        abort(404)
+    return asset.response(request)
 
 @app.route('/extract', methods=['POST'])
 def extract_meta():
-    """API endpoint to extract metadata and title from a given URL."""
+    """API endpoint to extract metadata and title from a given URL.
+
+    `fields` (in the body or the query string, e.g. `title,canonical,og:*`) limits the result to
+    those parts and meta tags; see projection.py. With `?timings=1` the result also carries a
+    `timings` breakdown (fetch, decode, parse and serialize time, and every redirect hop), mirrored
+    in a Server-Timing header. With `?profile=1` it carries a sampled `profile` of the request's
+    thread (see profiling.py).
+    """
+    started = time.perf_counter()
     data = request.get_json()
     if not data or 'url' not in data:
         return jsonify({'error': 'URL parameter is missing'}), 400
 
-    url = data['url']
-    # Basic validation/fixing for URL
-    if not url.startswith(('http://', 'https://')):
-        # Check if it looks like a domain before prepending https://
-        if '.' in url and not url.startswith('/'):
-             url = 'https://' + url
-        else:
-             return jsonify({'error': f'Invalid URL format: {url}'}), 400
-
+    try:
+        url = normalize_url(data['url'])
+        fields = _requested_fields(data)
+    except InvalidURLError as e:
+        ERRORS.inc('invalid_url')
+        return jsonify({'error': str(e)}), 400
+    except InvalidFieldsError as e:
+        return jsonify({'error': str(e)}), 400
 
     app.logger.info(f"Attempting to fetch URL: {url}")
 
+    show_timings = request.args.get('timings') == '1'
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 MetaVerifierBot/1.1'
-        }
-        response = requests.get(url, headers=headers, timeout=15, allow_redirects=True) # Increased timeout slightly
-        response.raise_for_status()
-
-        content_type = response.headers.get('content-type', '').lower()
-        if 'text/html' not in content_type:
-             app.logger.warning(f"URL {url} returned non-HTML content-type: {content_type}")
-             # Proceeding anyway, but could return an error here if strict HTML is required
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extract <title> tag
-        title_tag = soup.find('title')
-        page_title = title_tag.string.strip() if title_tag else None
-
-        # Find all <meta> tags
-        meta_tags = soup.find_all('meta')
-        # Find canonical <link rel="canonical" href="..."> in the head
-        canonical_url = None
-        link_tags = soup.find_all('link', href=True)
-        for lt in link_tags:
-            rel = lt.get('rel')
-            if rel:
-                # `rel` may be a list (BeautifulSoup) or a string
-                if isinstance(rel, list):
-                    rels = [r.lower() for r in rel if isinstance(r, str)]
-                    if 'canonical' in rels:
-                        canonical_url = lt['href'].strip()
-                        break
-                else:
-                    if 'canonical' == rel.lower() or 'canonical' in rel.lower():
-                        canonical_url = lt['href'].strip()
-                        break
-        extracted_data = []
-        for tag in meta_tags:
-            if tag.attrs:
-                extracted_data.append({'attributes': tag.attrs})
-
-        app.logger.info(f"Successfully extracted title and {len(extracted_data)} meta tags from {url}")
-        # Return title, metadata and canonical (if found)
-        return jsonify({'title': page_title, 'metadata': extracted_data, 'canonical': canonical_url})
-
-    except requests.exceptions.Timeout:
-        app.logger.error(f"Timeout occurred while fetching {url}")
-        return jsonify({'error': f'Request timed out fetching URL: {url}'}), 504
-    except requests.exceptions.RequestException as e:
-        app.logger.error(f"Error fetching URL {url}: {e}")
-        error_message = f'Could not fetch or process URL: {url}. Error: {str(e)}'
-        status_code = 500
-        if isinstance(e, requests.exceptions.ConnectionError):
-            error_message = f'Could not connect to URL: {url}. Check the address and network.'
-            status_code = 400
-        elif isinstance(e, requests.exceptions.HTTPError):
-            error_message = f'Server returned error {e.response.status_code} for URL: {url}.'
-            status_code = 400 # Treat client/server errors from target as bad request for our service
-        elif isinstance(e, requests.exceptions.InvalidURL):
-             error_message = f'Invalid URL format provided: {url}'
-             status_code = 400
-
+        with profiled(), (profile_thread() if request.args.get('profile') == '1' else nullcontext()) as profile:
+            with request_timings() as timings:
+                extracted, cache_status = extract(url, fresh=request.args.get('fresh') == '1', fields=fields)
+            app.logger.info(f"Successfully extracted {len(extracted.get('metadata', ()))} meta tags from {url}")
+            # Return title, metadata and canonical (if found), plus whether it came from the result cache
+            serialize_started = time.perf_counter()
+            response = jsonify({**extracted, 'cache': cache_status})
+            timings.add('serialize', time.perf_counter() - serialize_started)
+        PHASE_SECONDS.observe(timings.phases['serialize'], 'serialize')
+        if show_timings or profile is not None:
+            # Serialized again with the extras; serialize_ms is the time the result alone took
+            total = time.perf_counter() - started
+            extras = {'timings': timings.to_dict(total)} if show_timings else {}
+            if profile is not None:
+                extras['profile'] = profile.to_dict()
+            response = jsonify({**extracted, 'cache': cache_status, **extras})
+            if show_timings:
+                response.headers['Server-Timing'] = timings.server_timing(total)
+        return response
+    except Exception as e:
+        error_message, status_code = describe_error(e, url)
         return jsonify({'error': error_message}), status_code
+
+def _requested_fields(data):
+    """The `fields` projection from the JSON body, or else the query string; None for everything."""
+    spec = data.get('fields') if isinstance(data, dict) else None
+    return Fields.parse(spec if spec is not None else request.args.get('fields'))
+
+@app.route('/extract/batch', methods=['POST'])
+def extract_batch():
+    """API endpoint to extract metadata for a list of URLs fetched concurrently.
+
+    With `Accept: application/x-ndjson` (or `?stream=1`) each result is streamed as one JSON line
+    as soon as it finishes, instead of one JSON body at the end. Otherwise `?format=columnar`
+    returns the results as one array per field (see payloads.columnar). `fields` projects every
+    result, as for /extract.
+    """
+    data = request.get_json()
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'urls parameter must be a non-empty list'}), 400
+    try:
+        fields = _requested_fields(data)
+    except InvalidFieldsError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fresh = request.args.get('fresh') == '1'
+    streaming = request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+    max_urls = BATCH_STREAM_MAX_URLS if streaming else BATCH_MAX_URLS
+    if len(urls) > max_urls:
+        return jsonify({'error': f'Too many URLs: {len(urls)} (maximum is {max_urls})'}), 400
+
+    app.logger.info(f"Starting {'streaming ' if streaming else ''}batch extraction of {len(urls)} URLs")
+    if streaming:
+        return Response(_stream_batch(urls, fresh, fields), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    results = run_batch(urls, fresh=fresh, fields=fields)
+    failed = sum(1 for r in results if 'error' in r)
+    app.logger.info(f"Finished batch extraction of {len(urls)} URLs ({failed} failed)")
+    # Each item has either title/metadata/canonical or error/status, in the order the URLs were given
+    if request.args.get('format') == 'columnar':
+        return jsonify(columnar(results))
+    return jsonify({'results': results})
+
+def _stream_batch(urls, fresh, fields):
+    """Yields one NDJSON line per finished URL; nothing is kept once it has been sent."""
+    failed = 0
+    for index, result in iter_batch(urls, fresh=fresh, fields=fields):
+        failed += 'error' in result
+        yield dumps({'index': index, **result}) + b'\n'
+    app.logger.info(f"Finished streaming batch extraction of {len(urls)} URLs ({failed} failed)")
+
+@app.route('/audit', methods=['POST'])
+def audit_site():
+    """API endpoint to extract and summarize every page listed in a sitemap or sitemap index.
+
+    Supports the same `?stream=1` / NDJSON mode as /extract/batch; the last line is then
+    {"summary": {...}}.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict) or 'sitemap' not in data:
+        return jsonify({'error': 'sitemap parameter is missing'}), 400
+    limit = data.get('limit', AUDIT_MAX_URLS)
+    if not isinstance(limit, int) or not 0 < limit <= AUDIT_MAX_URLS:
+        return jsonify({'error': f'limit must be between 1 and {AUDIT_MAX_URLS}'}), 400
+
+    try:
+        sitemap_url = normalize_url(data['sitemap'])
+    except InvalidURLError as e:
+        return jsonify({'error': str(e)}), 400
+
+    app.logger.info(f"Starting audit of sitemap {sitemap_url} (limit {limit})")
+    try:
+        sitemap = Sitemap(sitemap_url)
     except Exception as e:
-        app.logger.error(f"An unexpected error occurred processing {url}: {e}", exc_info=True) # Log traceback
-        return jsonify({'error': f'An unexpected server error occurred while processing the URL.'}), 500
+        error_message, status_code = describe_error(e, sitemap_url)
+        return jsonify({'error': error_message}), status_code
+
+    fresh = request.args.get('fresh') == '1'
+    summary = AuditSummary(sitemap_url)
+    results = iter_audit(sitemap, limit=limit, fresh=fresh, summary=summary)
+    if request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson':
+        return Response(_stream_audit(results, summary), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    for _ in results:
+        pass  # Only the summary is returned; per-URL results are folded into it as they finish
+    app.logger.info(f"Finished audit of {sitemap_url}: {summary.total} URLs ({summary.failed} failed)")
+    return jsonify(summary.to_dict())
+
+def _stream_audit(results, summary):
+    """Yields one NDJSON line per audited page, then a final line with the summary."""
+    for index, result in results:
+        yield dumps({'index': index, **result}) + b'\n'
+    app.logger.info(f"Finished audit of {summary.sitemap_url}: {summary.total} URLs ({summary.failed} failed)")
+    yield dumps({'summary': summary.to_dict()}) + b'\n'
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """API endpoint to queue a batch (`{"urls": [...]}`) or audit (`{"sitemap": ..., "limit": ...}`) as a background job.
+
+    Returns 202 with the job's id and status right away; progress is polled from /jobs/<id>.
+    A batch job may carry a `fields` projection, applied to each result as for /extract.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'urls or sitemap parameter is missing'}), 400
+    fresh = request.args.get('fresh') == '1'
+
+    if 'sitemap' in data:
+        limit = data.get('limit', AUDIT_MAX_URLS)
+        if not isinstance(limit, int) or not 0 < limit <= AUDIT_MAX_URLS:
+            return jsonify({'error': f'limit must be between 1 and {AUDIT_MAX_URLS}'}), 400
+        try:
+            sitemap_url = normalize_url(data['sitemap'])
+        except InvalidURLError as e:
+            return jsonify({'error': str(e)}), 400
+        job = submit_job('audit', {'sitemap': sitemap_url, 'limit': limit, 'fresh': fresh})
+    else:
+        urls = data.get('urls')
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+            return jsonify({'error': 'urls parameter must be a non-empty list of strings'}), 400
+        if len(urls) > JOBS_MAX_URLS:
+            return jsonify({'error': f'Too many URLs: {len(urls)} (maximum is {JOBS_MAX_URLS})'}), 400
+        try:
+            fields = _requested_fields(data)
+        except InvalidFieldsError as e:
+            return jsonify({'error': str(e)}), 400
+        params = {'fresh': fresh} if fields is None else {'fresh': fresh, 'fields': fields.key}
+        job = submit_job('batch', params, urls)
+
+    return jsonify(job), 202, {'Location': f"/jobs/{job['id']}"}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Reports a job's status and progress (and, for a finished audit, its summary)."""
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(describe_job(job))
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """Returns a job's finished results in the order they completed, a page at a time.
+
+    Pass the previous page's `next_after` as `?after=` to continue; `?limit=` sets the page size.
+    Each result carries the `index` of its URL in the submitted list. With `?stream=1` (or
+    `Accept: application/x-ndjson`) every result is streamed instead; adding `&follow=1` keeps the
+    stream open and sends new results as they finish, until the job ends. `?format=columnar`
+    returns a page's results as one array per field (see payloads.columnar).
+    """
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        after = int(request.args.get('after', 0))
+        limit = min(int(request.args.get('limit', 1000)), 10000)
+    except ValueError:
+        return jsonify({'error': 'after and limit must be integers'}), 400
+
+    if request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson':
+        return Response(_stream_job_results(store, job_id, after, request.args.get('follow') == '1'),
+                        mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    results = []
+    for seq, index, result in store.iter_results(job_id, after=after, limit=limit):
+        results.append({'index': index, **result})
+        after = seq
+    if request.args.get('format') == 'columnar':
+        return jsonify({'status': job['status'], **columnar(results), 'next_after': after})
+    return jsonify({'status': job['status'], 'results': results, 'next_after': after})
+
+def _stream_job_results(store, job_id, after, follow):
+    """Yields one NDJSON line per finished result; with `follow`, polls for more until the job ends."""
+    while True:
+        # Read the status first: results stored before a job was marked done are then all picked up below
+        finished = store.get(job_id)['status'] in ('done', 'failed')
+        for seq, index, result in store.iter_results(job_id, after=after):
+            yield dumps({'index': index, **result}) + b'\n'
+            after = seq
+        if finished or not follow:
+            return
+        time.sleep(1)
+
+@app.route('/history/changes')
+def history_changes():
+    """Returns recorded changes between successive snapshots, newest first (requires HISTORY_ENABLED=1).
+
+    Filter with `?url=` (then the URL's current snapshot is included too) and `?since=<unix time>`;
+    `?limit=` caps the number of changes (default 50).
+    """
+    history = get_history()
+    if history is None:
+        return jsonify({'error': 'History is not enabled on this server'}), 404
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+        limit = min(int(request.args.get('limit', 50)), 1000)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be numbers'}), 400
+
+    url = request.args.get('url')
+    if url is None:
+        return jsonify({'changes': history.changes(since=since, limit=limit)})
+    try:
+        key = cache_key(normalize_url(url))  # History is keyed like the result cache
+    except InvalidURLError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'current': history.summary(key), 'changes': history.changes(key, since=since, limit=limit)})
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Reports this worker's result cache size, hit/miss counters, coalesced requests, reused parses and DNS cache."""
+    return jsonify({**get_cache().stats(), **flights.stats(), **head_results.stats(), **dns_cache.stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for the whole server, summed over every worker process (see metrics.py)."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/profile')
+def continuous_profile():
+    """Samples of the extraction path from every worker (PROFILE_SAMPLE_INTERVAL), as collapsed stacks.
+
+    The plain-text body feeds straight into flamegraph.pl or speedscope; `?format=json` returns the
+    sample counts per component (network, decode, charset, parse, serialize) and the stacks.
+    """
+    profile = collect_profile()
+    if profile is None:
+        message = 'No samples yet' if PROFILE_SAMPLE_INTERVAL else 'Continuous profiling is off (set PROFILE_SAMPLE_INTERVAL)'
+        return jsonify({'error': message}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(profile.to_dict())
+    return Response('\n'.join(profile.collapsed()) + '\n', content_type='text/plain; charset=utf-8')
 
 
 if __name__ == '__main__':
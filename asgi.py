@@ -0,0 +1,226 @@
+"""ASGI entry point that serves /extract on an async HTTP client.
+
+One process can hold hundreds of outbound fetches in flight instead of one per sync worker.
+Every other route is handed to the Flask app unchanged. Run it with, for example:
+
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 --bind 0.0.0.0:5000 asgi:application
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import parse_qs
+
+import httpx
+import requests
+from a2wsgi import WSGIMiddleware
+
+from app import app
+from connections import CachedDNSBackend
+from extractor import (USER_AGENT, InvalidURLError, cache_lookup, cache_store, conditional_headers,
+                       describe_error, normalize_url, validators_of, with_charset)
+from fetcher import fetch_head_async
+from head_parser import create_extractor
+from jobs import start_job_runner
+from metrics import (CACHE_RESULTS, ERRORS, HTTP_IN_FLIGHT, HTTP_REQUESTS, PHASE_SECONDS, request_timings,
+                     track_extraction)
+from payloads import dumps, gzip_body
+from profiling import profiled
+from projection import Fields, InvalidFieldsError
+from singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 500))
+ASYNC_MAX_KEEPALIVE = int(os.environ.get('ASYNC_MAX_KEEPALIVE', 100))
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))  # Threads serving the Flask routes concurrently
+
+flights = AsyncSingleFlight()
+
+
+def _as_requests_error(e):
+    """Translates an httpx exception into its requests equivalent so describe_error maps it the same way."""
+    if isinstance(e, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(e))
+    if isinstance(e, httpx.HTTPStatusError):
+        return requests.exceptions.HTTPError(str(e), response=e.response)
+    if isinstance(e, (httpx.InvalidURL, httpx.UnsupportedProtocol)):
+        return requests.exceptions.InvalidURL(str(e))
+    if isinstance(e, httpx.TransportError):
+        return requests.exceptions.ConnectionError(str(e))
+    if isinstance(e, httpx.HTTPError):
+        return requests.exceptions.RequestException(str(e))
+    return e
+
+
+async def extract_url_async(client, url, extra_headers=None, fields=None):
+    """Async counterpart of extractor.extract_url; raises requests exceptions for fetch failures."""
+    headers = {'User-Agent': USER_AGENT, **(extra_headers or {})}
+    try:
+        with track_extraction():
+            response, head = await fetch_head_async(client, url, headers=headers, parser=create_extractor(fields=fields))
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
+        raise _as_requests_error(e) from e
+    if head is None:
+        logger.info(f"{url} not modified since it was cached")
+        return None, validators_of(response)
+
+    content_type = response.headers.get('content-type', '').lower()
+    if 'text/html' not in content_type:
+        logger.warning(f"URL {url} returned non-HTML content-type: {content_type}")
+
+    logger.info(f"Read {head.bytes_read} bytes of {url} (hit byte cap: {head.truncated}, "
+                f"unchanged head: {head.parse_skipped})")
+    return with_charset(head, fields), validators_of(response)
+
+
+async def extract_async(client, url, fresh=False, fields=None):
+    """Async counterpart of extractor.extract, sharing the same result cache.
+
+    Identical requests are coalesced within this process's event loop only; blocking on the
+    cross-worker file lock would stall every other request on the loop. Cache reads and writes
+    (and the history record) go through SQLite, so they run on a thread for the same reason.
+    """
+    key, entry, payload = await asyncio.to_thread(cache_lookup, url, fresh, fields)
+    if payload is not None:
+        CACHE_RESULTS.inc('hit')
+        return payload, 'hit'
+
+    async def fetch():
+        started = time.monotonic()
+        payload, validators = await extract_url_async(client, url, conditional_headers(entry) if entry else None,
+                                                      fields)
+        return await asyncio.to_thread(cache_store, key, entry, payload, validators, fresh,
+                                       time.monotonic() - started, projected=fields is not None)
+
+    (payload, status), shared = await flights.do(key, fetch)
+    status = 'coalesced' if shared else status
+    CACHE_RESULTS.inc(status)
+    return payload, status
+
+
+class AsyncExtractApp:
+    """ASGI app handling POST /extract natively and delegating all other requests to Flask.
+
+    A profiled /extract (?profile=1) goes to Flask too: the profiler samples the thread serving one
+    request, and on the event loop that thread serves every request at once.
+    """
+
+    def __init__(self, flask_app):
+        self.fallback = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+        self.client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == '/extract' and scope['method'] == 'POST':
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            if query.get('profile') == ['1']:
+                await self.fallback(scope, receive, send)
+                return
+            accept_encoding = next((value.decode('latin-1') for name, value in scope['headers']
+                                    if name == b'accept-encoding'), None)
+            started = time.perf_counter()
+            # The event loop's thread counts as profiled while any /extract is in progress on it
+            with HTTP_IN_FLIGHT.track('extract_meta'), profiled(), request_timings() as timings:
+                status, payload = await self.extract(await self._read_body(receive), query.get('fresh') == ['1'],
+                                                     query.get('fields', [None])[0])
+                await self._send_json(send, status, payload, timings,
+                                      started if query.get('timings') == ['1'] else None, accept_encoding)
+            HTTP_REQUESTS.inc('extract_meta', str(status))
+        else:
+            await self.fallback(scope, receive, send)
+
+    def _get_client(self):
+        # Created lazily so it binds to the event loop of the worker that serves requests
+        if self.client is None:
+            limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_KEEPALIVE)
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+            # httpx has no public way to pass httpcore a network backend; resolve through the shared DNS cache
+            transport._pool._network_backend = CachedDNSBackend()
+            self.client = httpx.AsyncClient(transport=transport)
+            # Shared by every check on this worker: no site's cookies reach the next one (see fetch_head_async)
+            self.client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return self.client
+
+    async def extract(self, body, fresh=False, fields=None):
+        """Same contract as the Flask /extract view: returns (status, JSON payload).
+
+        `fields` is the query string's projection, used when the body has none.
+        """
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'url' not in data:
+            return 400, {'error': 'URL parameter is missing'}
+
+        try:
+            url = normalize_url(data['url'])
+            fields = Fields.parse(data['fields'] if data.get('fields') is not None else fields)
+        except InvalidURLError as e:
+            ERRORS.inc('invalid_url')
+            return 400, {'error': str(e)}
+        except InvalidFieldsError as e:
+            return 400, {'error': str(e)}
+
+        logger.info(f"Attempting to fetch URL: {url}")
+        try:
+            extracted, cache_status = await extract_async(self._get_client(), url, fresh, fields)
+            logger.info(f"Successfully extracted {len(extracted.get('metadata', ()))} meta tags from {url}")
+            return 200, {**extracted, 'cache': cache_status}
+        except Exception as e:
+            error_message, status_code = describe_error(e, url)
+            return status_code, {'error': error_message}
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_job_runner()  # Interrupted jobs resume without waiting for a request to reach Flask
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    @staticmethod
+    async def _send_json(send, status, payload, timings=None, report_since=None, accept_encoding=None):
+        """Sends `payload`, gzipped if large enough and accepted. For a result, its serialize time is added to
+        `timings`; with `report_since` (when the request started) the breakdown is included, as the Flask view
+        does for ?timings=1.
+        """
+        serialize_started = time.perf_counter()
+        body = dumps(payload)
+        headers = [(b'vary', b'Accept-Encoding')]
+        if status == 200 and timings is not None:
+            timings.add('serialize', time.perf_counter() - serialize_started)
+            PHASE_SECONDS.observe(timings.phases['serialize'], 'serialize')  # Like the Flask view: results only
+            if report_since is not None:
+                total = time.perf_counter() - report_since
+                body = dumps({**payload, 'timings': timings.to_dict(total)})
+                headers.append((b'server-timing', timings.server_timing(total).encode()))
+        body, compressed = gzip_body(body, accept_encoding)
+        if compressed:
+            headers.append((b'content-encoding', b'gzip'))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + headers,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = AsyncExtractApp(app)
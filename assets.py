@@ -0,0 +1,97 @@
+"""Precompressed, ETagged static assets for the frontend.
+
+Each file under static/ is read, hashed and compressed once per worker, on first request, so
+serving it afterwards (or answering 304 to a repeat visitor) costs no template rendering and
+nothing at import time. app.css and app.js are referenced from index.html with their content
+hash in the URL, which lets browsers cache them for a year.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always offered
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+_MIMETYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+}
+# Files index.html links to; their URLs get a ?v=<hash> suffix so they can be cached as immutable
+_VERSIONED = ('app.css', 'app.js')
+
+
+class StaticAsset:
+    """One file held in memory with identity, gzip and (when available) brotli variants."""
+
+    def __init__(self, name, content, cache_control):
+        self.name = name
+        self.mimetype = _MIMETYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(content).hexdigest()[:20]
+        # encoding -> (body, strong ETag); each representation gets its own ETag
+        self.variants = {'identity': (content, self.digest)}
+        self.variants['gzip'] = (gzip.compress(content, compresslevel=9, mtime=0), f'{self.digest}-gz')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(content, quality=11), f'{self.digest}-br')
+
+    def response(self, request):
+        """Builds the response for `request`: 304 if the client's copy is current, else the best encoding."""
+        accepted = request.accept_encodings
+        encoding = next((e for e in ('br', 'gzip') if e in self.variants and accepted[e]), 'identity')
+        body, etag = self.variants[encoding]
+
+        headers = {'Cache-Control': self.cache_control, 'Vary': 'Accept-Encoding'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        # Any of our variants' tags means the client already holds the current content
+        if any(request.if_none_match.contains(tag) for _, tag in self.variants.values()):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(body, content_type=self.mimetype, headers=headers)
+        response.set_etag(etag)
+        return response
+
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def _read(name):
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def _load():
+    assets = {}
+    for name in _VERSIONED:
+        assets[name] = StaticAsset(name, _read(name), 'public, max-age=31536000, immutable')
+
+    index = _read('index.html').decode('utf-8')
+    for name in _VERSIONED:
+        index = index.replace(f'/static/{name}"', f'/static/{name}?v={assets[name].digest}"')
+    # The page itself must be revalidated on every visit (cheap: a 304) so new deploys show up
+    assets['index.html'] = StaticAsset('index.html', index.encode('utf-8'), 'no-cache')
+    logger.info(f"Loaded {len(assets)} static assets (brotli: {brotli is not None})")
+    return assets
+
+
+def get_asset(name):
+    """Returns the StaticAsset for `name`, or None if it is not one of ours."""
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = _load()
+    return _assets.get(name)
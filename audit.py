@@ -0,0 +1,178 @@
+"""Sitemap-driven site audits: stream-parse a sitemap (or sitemap index) and extract every page it lists."""
+import logging
+import os
+from collections import Counter
+from xml.etree import ElementTree
+
+from batch import iter_batch
+from content_coding import BoundedDecoder
+from extractor import REQUEST_TIMEOUT, USER_AGENT
+from fetcher import CHUNK_SIZE, get_session
+
+logger = logging.getLogger(__name__)
+
+AUDIT_MAX_URLS = int(os.environ.get('AUDIT_MAX_URLS', 50000))
+AUDIT_MAX_SITEMAPS = int(os.environ.get('AUDIT_MAX_SITEMAPS', 100))  # Child sitemaps followed from an index
+AUDIT_MAX_ISSUES = int(os.environ.get('AUDIT_MAX_ISSUES', 200))  # Per-URL issues listed in the summary
+
+# Tags a page is expected to have; the summary counts pages where each one is missing or empty
+EXPECTED_META = ('description', 'og:title', 'og:description', 'og:image', 'twitter:card')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class Sitemap:
+    """A sitemap whose response is already open, so fetch errors surface before any URL is read."""
+
+    def __init__(self, url):
+        self.url = url
+        self.response = get_session().get(url, headers={'User-Agent': USER_AGENT}, timeout=REQUEST_TIMEOUT, stream=True)
+        try:
+            self.response.raise_for_status()
+        except Exception:
+            self.response.close()
+            raise
+
+    def iter_locs(self):
+        """Yields ('url' | 'sitemap', loc) pairs while the XML streams in; elements are discarded as we go."""
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        # .xml.gz sitemaps are usually served as application/gzip rather than Content-Encoding: gzip.
+        # They are decoded a bounded piece at a time, so a small compressed chunk cannot expand all at once.
+        gunzip = BoundedDecoder('gzip') if self.url.endswith('.gz') else None
+        root = None
+        with self.response:
+            for chunk in self.response.iter_content(chunk_size=CHUNK_SIZE):
+                for piece in gunzip.pieces(chunk) if gunzip else (chunk,):
+                    parser.feed(piece)
+                    for event, element in parser.read_events():
+                        if event == 'start':
+                            if root is None:
+                                root = element
+                            continue
+                        name = _local_name(element.tag)
+                        if name == 'loc' and element.text:
+                            kind = 'sitemap' if _local_name(root.tag) == 'sitemapindex' else 'url'
+                            yield kind, element.text.strip()
+                        elif name in ('url', 'sitemap'):
+                            root.remove(element)  # Keep the parsed tree from growing with the document
+        parser.close()
+
+
+def iter_sitemap_urls(sitemap, limit=AUDIT_MAX_URLS):
+    """Yields page URLs from an open Sitemap, following a sitemap index one level deep, up to `limit`."""
+    count = 0
+    children = 0
+    try:
+        for kind, loc in sitemap.iter_locs():
+            if kind == 'url':
+                yield loc
+                count += 1
+            elif children < AUDIT_MAX_SITEMAPS:
+                children += 1
+                try:
+                    child = Sitemap(loc)
+                except Exception as e:
+                    logger.warning(f"Skipping child sitemap {loc}: {e}")
+                    continue
+                try:
+                    for child_kind, child_loc in child.iter_locs():
+                        if child_kind != 'url':
+                            continue  # Nested indexes beyond one level are not followed
+                        yield child_loc
+                        count += 1
+                        if count >= limit:
+                            break
+                finally:
+                    child.response.close()
+            if count >= limit:
+                logger.info(f"Stopped reading {sitemap.url} at the {limit} URL limit")
+                return
+    finally:
+        sitemap.response.close()
+
+
+def _meta_values(metadata):
+    values = {}
+    for tag in metadata:
+        attrs = tag['attributes']
+        key = (attrs.get('property') or attrs.get('name') or '').lower()
+        if key:
+            values.setdefault(key, attrs.get('content'))
+    return values
+
+
+class AuditSummary:
+    """Accumulates per-URL results into counts; only capped samples of individual pages are kept."""
+
+    def __init__(self, sitemap_url):
+        self.sitemap_url = sitemap_url
+        self.total = 0
+        self.failed = 0
+        self.errors = Counter()
+        self.missing = Counter()
+        self.titles = Counter()
+        self.canonical_elsewhere = 0
+        self.issues = []
+        self.sitemap_error = None  # Set when the sitemap stops parsing part-way through
+
+    def add(self, result):
+        self.total += 1
+        if 'error' in result:
+            self.failed += 1
+            self.errors[str(result['status'])] += 1
+            self._issue(result['url'], [result['error']])
+            return
+
+        missing = []
+        if result['title']:
+            self.titles[result['title']] += 1
+        else:
+            missing.append('title')
+        if not result['canonical']:
+            missing.append('canonical')
+        elif result['canonical'].rstrip('/') != result['url'].rstrip('/'):
+            self.canonical_elsewhere += 1
+        values = _meta_values(result['metadata'])
+        missing += [name for name in EXPECTED_META if not values.get(name)]
+
+        self.missing.update(missing)
+        if missing:
+            self._issue(result['url'], [f'missing {name}' for name in missing])
+
+    def _issue(self, url, problems):
+        if len(self.issues) < AUDIT_MAX_ISSUES:
+            self.issues.append({'url': url, 'problems': problems})
+
+    def to_dict(self):
+        return {
+            'sitemap': self.sitemap_url,
+            'urls': self.total,
+            'ok': self.total - self.failed,
+            'failed': self.failed,
+            'errors_by_status': dict(self.errors),
+            'missing': {name: self.missing[name] for name in ('title', 'canonical') + EXPECTED_META},
+            'canonical_points_elsewhere': self.canonical_elsewhere,
+            'duplicate_titles': {title: n for title, n in self.titles.most_common(20) if n > 1},
+            'issues': self.issues,
+            'sitemap_error': self.sitemap_error,
+        }
+
+
+def iter_audit(sitemap, limit=AUDIT_MAX_URLS, fresh=False, summary=None):
+    """Extracts every page listed in an open Sitemap, yielding (index, result) as each finishes.
+
+    Fetches go through the batch scheduler, so the global and per-host concurrency caps apply.
+    Results are folded into `summary` (an AuditSummary) when one is given. Malformed XML ends
+    the audit early with the error recorded in the summary; pages already read are kept.
+    """
+    try:
+        for index, result in iter_batch(iter_sitemap_urls(sitemap, limit), fresh=fresh):
+            if summary is not None:
+                summary.add(result)
+            yield index, result
+    except ElementTree.ParseError as e:
+        logger.error(f"Could not parse sitemap {sitemap.url}: {e}")
+        if summary is not None:
+            summary.sitemap_error = f"Could not parse sitemap: {e}"
@@ -0,0 +1,130 @@
+"""Concurrent extraction of many URLs with a bounded worker pool and per-host limits."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from extractor import InvalidURLError, describe_error, extract, normalize_url
+from metrics import ERRORS
+from politeness import RobotsDisallowed, politeness
+from resolver import dns_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 16))
+BATCH_PER_HOST = int(os.environ.get('BATCH_PER_HOST', 4))
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 1000))
+# Streamed batches hold no results in memory, so they can be much larger
+BATCH_STREAM_MAX_URLS = int(os.environ.get('BATCH_STREAM_MAX_URLS', 10000))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns this worker process's fetch pool, creating it on first use (i.e. after gunicorn forks)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+        return _executor
+
+
+def extract_one(url, fresh=False, polite=True, fields=None):
+    """Extracts a single batch item; errors become part of the result instead of being raised."""
+    try:
+        url = normalize_url(url)
+        if polite:
+            politeness.check(url)
+        payload, cache_status = extract(url, fresh=fresh, fields=fields)
+        return {'url': url, **payload, 'cache': cache_status}
+    except InvalidURLError as e:
+        ERRORS.inc('invalid_url')
+        return {'url': url, 'error': str(e), 'status': 400}
+    except RobotsDisallowed as e:
+        return {'url': url, 'error': str(e), 'status': 403}
+    except Exception as e:
+        message, status = describe_error(e, url)
+        return {'url': url, 'error': message, 'status': status}
+
+
+def _host_of(url):
+    try:
+        return urlsplit(normalize_url(url)).netloc.lower()
+    except (InvalidURLError, ValueError):
+        return ''
+
+
+def iter_batch(urls, fresh=False, max_workers=BATCH_WORKERS, per_host=BATCH_PER_HOST, polite=True, fields=None):
+    """Extracts `urls` concurrently, yielding (index, result) pairs in completion order.
+
+    At most `max_workers` fetches run at once and at most `per_host` of them target the same host.
+    With `polite`, each host is also rate limited by its token bucket and robots.txt is honoured;
+    a host waiting for a token is simply skipped, so other hosts keep the pool busy meanwhile.
+    `urls` may be any iterable; it is consumed lazily so only a small window is held in memory.
+    `fresh` bypasses the result cache for every URL; `fields` (a projection.Fields) trims every result.
+    """
+    executor = get_executor()
+    source = enumerate(urls)
+    exhausted = False
+    queued = OrderedDict()  # host -> deque of (index, url) waiting for a free slot
+    queued_count = 0
+    active = {}  # host -> running fetches
+    in_flight = {}  # future -> (index, host)
+    lookahead = max_workers * 4
+
+    while True:
+        # Pull a bounded window from the source so hosts that are at their limit don't stall the rest
+        while not exhausted and queued_count < lookahead:
+            try:
+                index, url = next(source)
+            except StopIteration:
+                exhausted = True
+                break
+            host = _host_of(url)
+            if host not in queued and not active.get(host):
+                dns_cache.prefetch(host)  # Resolved while the URL waits for a slot
+            queued.setdefault(host, deque()).append((index, url))
+            queued_count += 1
+
+        next_ready = None  # Seconds until the soonest rate-limited host gets a token
+        for host in list(queued):
+            if len(in_flight) >= max_workers:
+                break
+            pending = queued[host]
+            while pending and len(in_flight) < max_workers and active.get(host, 0) < per_host:
+                delay = politeness.reserve(host) if polite else 0
+                if delay:
+                    next_ready = delay if next_ready is None else min(next_ready, delay)
+                    break
+                index, url = pending.popleft()
+                queued_count -= 1
+                active[host] = active.get(host, 0) + 1
+                in_flight[executor.submit(extract_one, url, fresh, polite, fields)] = (index, host)
+            if not pending:
+                del queued[host]
+
+        if not in_flight:
+            if exhausted and not queued:
+                return
+            if next_ready is not None:
+                time.sleep(next_ready)  # Every queued host is rate limited and there is nothing else to do
+            continue
+
+        # Wake up when a fetch finishes, or when a rate-limited host can be scheduled again
+        done, _ = wait(in_flight, timeout=next_ready, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, host = in_flight.pop(future)
+            active[host] -= 1
+            yield index, future.result()
+
+
+def run_batch(urls, fresh=False, fields=None):
+    """Extracts every URL and returns the results in input order."""
+    results = [None] * len(urls)
+    for index, result in iter_batch(urls, fresh=fresh, fields=fields):
+        results[index] = result
+    return results
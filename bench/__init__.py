@@ -0,0 +1 @@
+"""Offline benchmark harness for the extraction pipeline; see bench/run.py."""
@@ -0,0 +1,71 @@
+"""Compares two bench.run result files and flags regressions.
+
+    python -m bench.compare baseline.json candidate.json [--threshold 10]
+
+Prints every metric present in both files with its relative change. Exits with status 1 if
+any latency, parse time or peak RSS grew (or any throughput fell) by more than the threshold
+percentage, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+def _metrics(results):
+    """Flattens a result file into {metric path: (value, True if higher is better)}."""
+    flat = {}
+    for page, stats in results.get('latency', {}).items():
+        for key in ('p50_ms', 'p90_ms', 'p99_ms'):
+            if key in stats:
+                flat[f'latency.{page}.{key}'] = (stats[key], False)
+    for level, stats in results.get('throughput', {}).items():
+        flat[f'throughput.x{level}.requests_per_second'] = (stats['requests_per_second'], True)
+        if 'p99_ms' in stats['latency']:
+            flat[f'throughput.x{level}.p99_ms'] = (stats['latency']['p99_ms'], False)
+    for backend, pages in results.get('parse', {}).items():
+        for page, stats in pages.items():
+            flat[f'parse.{backend}.{page}.best_us'] = (stats['best_us'], False)
+    for process, kb in results.get('peak_rss_kb', {}).items():
+        flat[f'peak_rss_kb.{process}'] = (kb, False)
+    return flat
+
+
+def compare(baseline, candidate, threshold):
+    """Returns (report lines, regressed metric names)."""
+    old, new = _metrics(baseline), _metrics(candidate)
+    lines, regressions = [], []
+    for name in sorted(old.keys() & new.keys()):
+        (before, higher_is_better), (after, _) = old[name], new[name]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif -worse > threshold:
+            flag = '  improved'
+        lines.append(f'{name:<60} {before:>12} -> {after:>12} ({change:+.1f}%){flag}')
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    lines, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{baseline['meta'].get('revision')} -> {candidate['meta'].get('revision')}")
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) over {args.threshold}%', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""The benchmark corpus and the local HTTP server that serves it.
+
+Every page is generated deterministically, so two runs (or two versions of the app) are
+measured against byte-identical input without any network access.
+"""
+import gzip
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = ('meta', 'verifier', 'open', 'graph', 'card', 'preview', 'share', 'title', 'search', 'index',
+          'canonical', 'image', 'site', 'article', 'product', 'review', 'news', 'update', 'guide', 'release')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _meta_tags(rng, count):
+    """A realistic mix of general, Open Graph and Twitter tags, `count` in total."""
+    fixed = [
+        f'<meta name="description" content="{_text(rng, 25)}">',
+        '<meta name="viewport" content="width=device-width, initial-scale=1">',
+        f'<meta property="og:title" content="{_text(rng, 6)}">',
+        f'<meta property="og:description" content="{_text(rng, 20)}">',
+        '<meta property="og:image" content="https://cdn.example.com/images/cover.jpg">',
+        '<meta property="og:type" content="article">',
+        '<meta name="twitter:card" content="summary_large_image">',
+        f'<meta name="twitter:title" content="{_text(rng, 6)}">',
+    ]
+    extra = [f'<meta name="x-{i}" content="{_text(rng, 4)}">' for i in range(max(0, count - len(fixed)))]
+    return '\n'.join(fixed + extra)
+
+
+def _page(rng, title, meta_count=12, head_extra='', body_bytes=2000, charset='utf-8', meta_charset=True):
+    head = (f'<!doctype html>\n<html><head>\n' + (f'<meta charset="{charset}">\n' if meta_charset else '')
+            + f'<title>{title}</title>\n{_meta_tags(rng, meta_count)}\n'
+            '<link rel="canonical" href="https://www.example.com/page">\n'
+            f'{head_extra}</head>\n<body>')
+    body = f'<p>{_text(rng, 30)}</p>\n'
+    repeat = body_bytes // len(body) + 1
+    return (head + body * repeat + '</body></html>').encode(charset, 'replace')
+
+
+def _big_script(rng, size):
+    # Inline JS that mentions "</head>" and "<body>" in strings, as bundlers and analytics snippets do
+    line = 'var s{0} = "</head><body>" + {1!r};\n'
+    out, n = [], 0
+    while n < size:
+        chunk = line.format(len(out), _text(rng, 8))
+        out.append(chunk)
+        n += len(chunk)
+    return '<script>\n' + ''.join(out) + '</script>\n'
+
+
+class Page:
+    """One corpus entry: a body and how to serve it, or a redirect chain of `hops` leading to `redirect_to`."""
+
+    def __init__(self, body=b'', content_type='text/html; charset=utf-8', compress=False,
+                 drip_bytes=None, drip_delay=0.0, redirect_to=None, hops=0):
+        self.body = gzip.compress(body, 6) if compress else body
+        # For parse-only benchmarks; split at the real end of head, not a "</head>" inside a script
+        self.head = body.split(b'</head>\n<body>', 1)[0] + b'</head>' if body else b''
+        self.content_type = content_type
+        self.encoding = 'gzip' if compress else None
+        self.drip_bytes = drip_bytes
+        self.drip_delay = drip_delay
+        self.redirect_to = redirect_to
+        self.hops = hops
+
+
+def build_corpus():
+    """Returns {name: Page}. Names are stable: results are compared between runs by them."""
+    rng = random.Random(1234)
+    pages = {
+        'tiny': Page(_page(rng, 'Tiny page', meta_count=6, body_bytes=500)),
+        'typical': Page(_page(rng, 'Typical article', meta_count=40, body_bytes=60_000)),
+        'large_5mb': Page(_page(rng, 'Five megabyte page', meta_count=40, body_bytes=5 * 1024 * 1024)),
+        'many_meta': Page(_page(rng, 'Hundreds of meta tags', meta_count=600, body_bytes=20_000)),
+        'head_script_900k': Page(_page(rng, 'Huge inline script', meta_count=30,
+                                      head_extra=_big_script(rng, 900 * 1024), body_bytes=20_000)),
+        'slow_drip': Page(_page(rng, 'Slow drip', meta_count=20, body_bytes=20_000), drip_bytes=1024, drip_delay=0.02),
+        'gzip_5mb': Page(_page(rng, 'Compressed five megabyte page', meta_count=40, body_bytes=5 * 1024 * 1024),
+                         compress=True),
+        'cp1252_header': Page(_page(rng, 'Café crème – naïve', charset='cp1252', meta_charset=False),
+                              content_type='text/html; charset=windows-1252'),
+        'shift_jis_meta': Page(_page(rng, '日本語のページ', charset='shift_jis'), content_type='text/html'),
+        'cp1251_undeclared': Page(_page(rng, 'Русская страница о метаданных', charset='cp1251', meta_charset=False),
+                                  content_type='text/html'),
+    }
+    pages['redirect_chain_3'] = Page(redirect_to='/page/tiny', hops=3)
+    return pages
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle's algorithm and delayed
+        # ACKs add ~40 ms to every response, which would swamp what we are measuring
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        # /page/<name> serves a page; /page/<name>/<n> is hop n of a redirect chain
+        parts = self.path.strip('/').split('/')
+        page = self.server.corpus.get(parts[1]) if len(parts) >= 2 and parts[0] == 'page' else None
+        if page is None:
+            self._send(404, b'not found', 'text/plain')
+        elif page.redirect_to:
+            hop = int(parts[2]) if len(parts) > 2 else 0
+            location = page.redirect_to if hop + 1 >= page.hops else f'/page/{parts[1]}/{hop + 1}'
+            self._send(301, b'', 'text/plain', {'Location': location})
+        else:
+            headers = {'Content-Encoding': page.encoding} if page.encoding else {}
+            self._send(200, page.body, page.content_type, headers, page.drip_bytes, page.drip_delay)
+
+    def _send(self, status, body, content_type, headers=None, drip_bytes=None, drip_delay=0.0):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            if drip_bytes is None:
+                self.wfile.write(body)
+                return
+            for start in range(0, len(body), drip_bytes):
+                self.wfile.write(body[start:start + drip_bytes])
+                self.wfile.flush()
+                time.sleep(drip_delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The extractor hung up once it had the head, as intended
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # Clients hang up early on purpose
+            super().handle_error(request, client_address)
+
+
+class FixtureServer:
+    """Serves the corpus on 127.0.0.1 from a background thread. Use as a context manager."""
+
+    def __init__(self, corpus=None):
+        self.corpus = corpus if corpus is not None else build_corpus()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.corpus = self.corpus
+
+    def url(self, name):
+        return f'http://127.0.0.1:{self._server.server_port}/page/{name}'
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, name='bench-fixtures', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,218 @@
+"""Benchmarks /extract against the local fixture corpus and writes the results as JSON.
+
+    python -m bench.run --out results.json                          # App served in this process
+    python -m bench.run --server http://127.0.0.1:5000 --pid 1234   # A server you started (gunicorn, uvicorn)
+    python -m bench.compare old.json new.json
+
+Measures per-page latency percentiles, throughput at several concurrency levels, peak RSS and
+parse-only timings for each head parser backend. Everything runs offline: the corpus is served
+from 127.0.0.1, and /extract is called with ?fresh=1. The in-process app also runs with
+CACHE_BACKEND=none and HEAD_HASH_CACHE_SIZE=0, so every request fetches and parses; start a
+--server with the same settings for numbers that compare.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Before the app is imported: measure fetching and parsing, not the result cache or the parsed-head cache
+os.environ.setdefault('CACHE_BACKEND', 'none')
+os.environ.setdefault('HEAD_HASH_CACHE_SIZE', '0')
+
+import requests
+
+from bench.corpus import FixtureServer, build_corpus
+
+DEFAULT_LEVELS = (1, 4, 16, 64)
+
+
+def summarize(seconds):
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+    return {'count': len(ordered), 'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+            'min_ms': round(ordered[0] * 1000, 2), 'p50_ms': pct(50), 'p90_ms': pct(90), 'p99_ms': pct(99),
+            'max_ms': round(ordered[-1] * 1000, 2)}
+
+
+def _post_extract(session, server, url):
+    started = time.perf_counter()
+    try:
+        ok = session.post(f'{server}/extract?fresh=1', json={'url': url}, timeout=60).status_code == 200
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def bench_latency(server, fixtures, requests_per_page):
+    """Sequential requests per page (after one warm-up), so each page's latency is measured alone."""
+    results = {}
+    with requests.Session() as session:
+        for name in fixtures.corpus:
+            url = fixtures.url(name)
+            _post_extract(session, server, url)
+            samples = [_post_extract(session, server, url) for _ in range(requests_per_page)]
+            results[name] = {**summarize([s for s, ok in samples if ok]), 'errors': sum(not ok for _, ok in samples)}
+            print(f"latency {name:<20} p50 {results[name].get('p50_ms')} ms", file=sys.stderr)
+    return results
+
+
+def bench_throughput(server, fixtures, levels, requests_per_level):
+    """The whole corpus round-robin at each concurrency level; one keep-alive session per client thread."""
+    urls = [fixtures.url(name) for name in fixtures.corpus]
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return _post_extract(local.session, server, urls[i % len(urls)])
+
+    results = {}
+    for level in levels:
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            started = time.perf_counter()
+            samples = list(pool.map(one, range(requests_per_level)))
+            elapsed = time.perf_counter() - started
+        results[str(level)] = {
+            'requests_per_second': round(len(samples) / elapsed, 2),
+            'latency': summarize([s for s, ok in samples if ok]),
+            'errors': sum(not ok for _, ok in samples),
+        }
+        print(f"throughput x{level:<3} {results[str(level)]['requests_per_second']} req/s", file=sys.stderr)
+    return results
+
+
+def bench_parse(corpus, repeats):
+    """Parse-only timings: each page's decoded head fed to a fresh extractor, per available backend."""
+    from charset import sniff_encoding
+    from head_parser import create_extractor, etree
+
+    backends = ['html.parser'] + (['lxml'] if etree is not None else [])
+    results = {backend: {} for backend in backends}
+    for name, page in corpus.items():
+        if not page.head:
+            continue  # A redirect
+        header_charset = page.content_type.partition('charset=')[2] or None
+        text = page.head.decode(sniff_encoding(page.head, header_charset)[0], 'replace')
+        for backend in backends:
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                parser = create_extractor(backend)
+                parser.feed(text)
+                parser.close()
+                parser.result()
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            results[backend][name] = {'head_bytes': len(page.head), 'best_us': round(best * 1e6, 1),
+                                      'mean_us': round(sum(timings) / len(timings) * 1e6, 1),
+                                      'mb_per_s': round(len(page.head) / best / 1e6, 2)}
+    return results
+
+
+def peak_rss_kb(pids=()):
+    """Peak resident set size: of this process (and its children), or of the given server processes."""
+    if pids:
+        peaks = {}
+        for pid in pids:
+            with open(f'/proc/{pid}/status') as f:  # Linux only
+                peaks[str(pid)] = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        return peaks
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale}
+
+
+@contextmanager
+def in_process_server():
+    """Serves the Flask app from a threaded WSGI server in this process; yields its base URL."""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    from app import app
+    for name in ('', 'werkzeug'):
+        logging.getLogger(name).setLevel(logging.WARNING)  # Both log every request at INFO
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='bench-app', daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+
+
+@contextmanager
+def external_server(url):
+    yield url.rstrip('/')
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', help='write the JSON results here (default: stdout)')
+    parser.add_argument('--server', help='base URL of a running server; default serves the app in this process')
+    parser.add_argument('--pid', type=int, action='append', default=[],
+                        help='with --server, a server process whose peak RSS to report (repeatable)')
+    parser.add_argument('--requests', type=int, default=20, help='requests per page for latency (default 20)')
+    parser.add_argument('--levels', default=','.join(map(str, DEFAULT_LEVELS)),
+                        help='comma-separated concurrency levels for throughput')
+    parser.add_argument('--throughput-requests', type=int, default=200, help='requests per concurrency level')
+    parser.add_argument('--parse-repeats', type=int, default=20, help='repetitions per parse-only measurement')
+    parser.add_argument('--skip', action='append', default=[], choices=['latency', 'throughput', 'parse'],
+                        help='leave out a benchmark (repeatable)')
+    args = parser.parse_args(argv)
+
+    results = {'meta': {
+        'revision': _git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'server': args.server or 'in-process',
+        'env': {name: os.environ[name] for name in ('CACHE_BACKEND', 'HEAD_HASH_CACHE_SIZE', 'HEAD_PARSER',
+                                                    'PARSE_POOL_SIZE') if name in os.environ},
+        'options': {k: v for k, v in vars(args).items() if k not in ('out', 'pid')},
+    }}
+    with FixtureServer(build_corpus()) as fixtures:
+        with (external_server(args.server) if args.server else in_process_server()) as server:
+            if 'latency' not in args.skip:
+                results['latency'] = bench_latency(server, fixtures, args.requests)
+            if 'throughput' not in args.skip:
+                levels = [int(level) for level in args.levels.split(',')]
+                results['throughput'] = bench_throughput(server, fixtures, levels, args.throughput_requests)
+        if 'parse' not in args.skip:
+            results['parse'] = bench_parse(fixtures.corpus, args.parse_repeats)
+    results['peak_rss_kb'] = peak_rss_kb(args.pid if args.server else ())
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Wrote {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Result cache for extracted metadata, keyed on the normalized URL.
+
+Two backends share one interface: an in-process LRU (the default) and a SQLite file that every
+gunicorn worker on the host can open, so a hit in one worker is a hit in all of them.
+
+Each entry is {'payload', 'etag', 'last_modified'}. Entries whose page sent an ETag or
+Last-Modified header are kept for CACHE_STALE_TTL after they expire, so they can be revalidated
+with a conditional request instead of being fetched and parsed again.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+from storage import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')  # 'memory', 'sqlite' or 'none'
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))
+# How long an expired entry with validators is kept around for conditional revalidation
+CACHE_STALE_TTL = float(os.environ.get('CACHE_STALE_TTL', 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'metaverifier-cache.sqlite3'))
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def cache_key(url):
+    """Normalizes a URL so trivially different spellings share a cache entry.
+
+    Raises ValueError for a URL urlsplit() cannot take apart (normalize_url rejects those first).
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'  # IPv6 literal
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    if parts.username is not None or parts.password is not None:
+        # A page fetched with credentials must never be served to a request without them (or with
+        # others). The key keeps a digest, so no password is written to the cache or history files
+        userinfo = parts.netloc.rpartition('@')[0]
+        host = f"{hashlib.sha256(userinfo.encode('utf-8', 'surrogatepass')).hexdigest()[:32]}@{host}"
+    # The fragment never reaches the server, so it cannot change the page
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def _retain_until(expires_at, entry, stale_ttl):
+    """Entries that can be revalidated outlive their TTL; the rest are useless once expired."""
+    if entry.get('etag') or entry.get('last_modified'):
+        return expires_at + stale_ttl
+    return expires_at
+
+
+class BaseCache:
+    """Outcome counters shared by all backends; subclasses implement _get, _set and __len__."""
+
+    name = 'base'
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, stale_ttl=CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.counts = {'hit': 0, 'revalidated': 0, 'miss': 0}
+        self._counter_lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (entry, is_fresh) for `key`, or None if nothing usable is cached.
+
+        A stale entry (is_fresh False) is only returned when it carries validators.
+        """
+        return self._get(key)
+
+    def set(self, key, entry):
+        """Stores `entry` for `key` and restarts its TTL (also used after a 304 revalidation)."""
+        self._set(key, entry)
+
+    def record(self, outcome):
+        """Counts one lookup outcome: 'hit', 'revalidated' or 'miss'."""
+        with self._counter_lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        hits, revalidated, misses = self.counts['hit'], self.counts['revalidated'], self.counts['miss']
+        lookups = hits + revalidated + misses
+        return {
+            'backend': self.name,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'hits': hits,
+            'revalidated': revalidated,
+            'misses': misses,
+            'hit_ratio': round((hits + revalidated) / lookups, 4) if lookups else None,
+        }
+
+
+class NullCache(BaseCache):
+    """Used when CACHE_BACKEND=none: every lookup misses and nothing is stored."""
+
+    name = 'none'
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, entry):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(BaseCache):
+    """In-process TTL cache with LRU eviction once max_entries is reached."""
+
+    name = 'memory'
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, stale_ttl=CACHE_STALE_TTL):
+        super().__init__(ttl, max_entries, stale_ttl)
+        self._entries = OrderedDict()  # key -> (expires_at, retain_until, entry), least recently used first
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, retain_until, entry = item
+            if retain_until <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry, expires_at > now
+
+    def _set(self, key, entry):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, _retain_until(expires_at, entry, self.stale_ttl), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(BaseCache):
+    """TTL + LRU cache in a SQLite file shared by every worker process on the host."""
+
+    name = 'sqlite'
+
+    def __init__(self, path=CACHE_SQLITE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, stale_ttl=CACHE_STALE_TTL):
+        super().__init__(ttl, max_entries, stale_ttl)
+        self.path = path
+        self._db = LocalConnections(path)
+        with self._db.connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                         'key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires_at REAL NOT NULL, '
+                         'retain_until REAL NOT NULL, last_access REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_last_access ON cache_entries (last_access)')
+
+    def _get(self, key):
+        conn = self._db.connect()
+        now = time.time()
+        row = conn.execute('SELECT entry, expires_at, retain_until FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[2] <= now:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND retain_until <= ?', (key, now))
+            return None
+        conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1] > now
+
+    def _set(self, key, entry):
+        conn = self._db.connect()
+        now = time.time()
+        expires_at = now + self.ttl
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, entry, expires_at, retain_until, last_access) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (key, json.dumps(entry), expires_at, _retain_until(expires_at, entry, self.stale_ttl), now))
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            conn.execute('DELETE FROM cache_entries WHERE key IN '
+                         '(SELECT key FROM cache_entries ORDER BY last_access LIMIT ?)', (overflow,))
+
+    def __len__(self):
+        return self._db.connect().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the configured cache backend for this process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if CACHE_BACKEND == 'sqlite':
+                _cache = SQLiteCache()
+            elif CACHE_BACKEND == 'none':
+                _cache = NullCache()
+            else:
+                _cache = MemoryCache()
+            logger.info(f"Using {_cache.name} result cache (ttl={_cache.ttl}s, max_entries={_cache.max_entries})")
+        return _cache
@@ -0,0 +1,98 @@
+"""Picks the character encoding of a page from its headers and first bytes, as browsers do.
+
+Only the prefix the head reader holds back is examined, so detection never decodes, or guesses
+over, the whole document. The order follows the HTML spec's encoding sniffing algorithm: byte
+order mark, Content-Type charset, a <meta> prescan of the first 1024 bytes, and only then a
+heuristic guess (charset_normalizer, when installed) on that prefix.
+"""
+import codecs
+import logging
+import re
+
+try:
+    import charset_normalizer
+except ImportError:  # Optional; without it, non-UTF-8 pages without a declared charset get windows-1252
+    charset_normalizer = None
+
+logger = logging.getLogger(__name__)
+
+PRESCAN_BYTES = 1024  # How far the HTML spec's prescan looks for a <meta> charset declaration
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),  # Decoded with -sig so the BOM itself is dropped
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+)
+# Comments are matched first so a <meta> inside one is skipped
+_PRESCAN_RE = re.compile(rb'<!--.*?-->|<meta[\s/]([^>]*)>', re.IGNORECASE | re.DOTALL)
+_ATTR_RE = re.compile(rb'''([^\s/>=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+_CONTENT_CHARSET_RE = re.compile(rb'''charset\s*=\s*["']?([^"';\s]+)''', re.IGNORECASE)
+# Labels browsers treat as another encoding (the WHATWG Encoding Standard's mappings)
+_WHATWG_OVERRIDES = {'iso8859-1': 'cp1252', 'ascii': 'cp1252'}
+
+
+def resolve_label(label, from_meta=False):
+    """Maps a charset label to a Python codec name, or None if it is unknown."""
+    try:
+        name = codecs.lookup(label.strip()).name
+    except LookupError:
+        logger.debug(f"Ignoring unknown charset {label!r}")
+        return None
+    if from_meta and name.startswith('utf-16'):
+        return 'utf-8'  # A page that could declare UTF-16 in ASCII is not UTF-16
+    return _WHATWG_OVERRIDES.get(name, name)
+
+
+def prescan_meta_charset(prefix):
+    """The spec's prescan: the first <meta charset> or http-equiv Content-Type charset in `prefix`."""
+    for match in _PRESCAN_RE.finditer(prefix[:PRESCAN_BYTES]):
+        if match.group(1) is None:
+            continue  # A comment
+        attrs = {}
+        for attr in _ATTR_RE.finditer(match.group(1)):
+            value = next((v for v in attr.group(2, 3, 4) if v is not None), b'')
+            attrs.setdefault(attr.group(1).lower(), value)
+        label = attrs.get(b'charset')
+        if label is None and attrs.get(b'http-equiv', b'').lower() == b'content-type':
+            found = _CONTENT_CHARSET_RE.search(attrs.get(b'content', b''))
+            label = found.group(1) if found else None
+        if label:
+            name = resolve_label(label.decode('ascii', 'replace'), from_meta=True)
+            if name:
+                return name
+    return None
+
+
+def _guess(prefix):
+    """Heuristic detection on the prefix; returns (codec, source)."""
+    if prefix.isascii():
+        return 'utf-8', 'default'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix)  # Not final: a split character at the end is fine
+        return 'utf-8', 'detected'
+    except UnicodeDecodeError:
+        pass
+    if charset_normalizer is not None:
+        best = charset_normalizer.from_bytes(prefix).best()
+        name = best and resolve_label(best.encoding)
+        if name:
+            return name, 'detected'
+    return 'cp1252', 'default'
+
+
+def sniff_encoding(prefix, header_charset=None):
+    """Picks the codec for a body starting with `prefix`. Returns (codec name, source).
+
+    The source is 'bom', 'header', 'meta', 'detected' or 'default'.
+    """
+    for bom, name in _BOMS:
+        if prefix.startswith(bom):
+            return name, 'bom'  # A BOM wins even over the Content-Type header, as in browsers
+    if header_charset:
+        name = resolve_label(header_charset)
+        if name:
+            return name, 'header'
+    name = prescan_meta_charset(prefix)
+    if name:
+        return name, 'meta'
+    return _guess(prefix)
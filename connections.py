@@ -0,0 +1,181 @@
+"""urllib3 connection classes for the shared session that time each phase of a request.
+
+DNS resolution, TCP connect, the TLS handshake and the wait for response headers (time to first
+byte) are reported to metrics.record_phase, which adds them to the extraction running on the
+calling thread. Reused keep-alive connections skip the first three phases, which is the point.
+Host names are resolved through the process-wide cache in resolver.py, for both the sync
+session and the async client (CachedDNSBackend).
+
+Requests made inside an aborting() block can be cut short from another thread with Abort.abort().
+"""
+import asyncio
+import contextvars
+import socket
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import httpcore
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+
+from metrics import record_phase
+from resolver import dns_cache
+
+_abort = contextvars.ContextVar('metaverifier_abort', default=None)
+
+
+class Abort:
+    """Lets one thread stop the requests another makes inside aborting(abort).
+
+    abort() shuts down the socket of each of them that is waiting on its origin (for the response
+    headers, or the next body bytes through blocking_read), so the wait ends at once with a
+    connection error instead of at its read timeout. Later waits fail straight away. A connect
+    in progress is not interrupted; it is bounded by its connect timeout.
+    """
+
+    def __init__(self):
+        self.aborted = False
+        self._sockets = set()
+        self._lock = threading.Lock()
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            for sock in self._sockets:
+                _shut_down(sock)
+
+    @contextmanager
+    def _waiting(self, sock):
+        # Only a socket in the middle of a wait is shut down: outside one, it may be back in the pool
+        with self._lock:
+            if self.aborted:
+                _shut_down(sock)
+            self._sockets.add(sock)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sockets.discard(sock)
+
+
+def _shut_down(sock):
+    try:
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)  # The plain socket's: an SSLSocket would drop its state too
+    except OSError:
+        pass  # Already closed
+
+
+@contextmanager
+def aborting(abort):
+    """Makes `abort` able to stop the requests made in this block (see Abort)."""
+    token = _abort.set(abort)
+    try:
+        yield abort
+    finally:
+        _abort.reset(token)
+
+
+def blocking_read(sock):
+    """Wrap a blocking read from `sock` in this, so the enclosing aborting() block's Abort can end it."""
+    abort = _abort.get()
+    return abort._waiting(sock) if abort is not None and sock is not None else nullcontext()
+
+
+class _TimedConnectionMixin:
+    _connect_seconds = 0.0
+
+    def _new_conn(self):
+        # Resolve here, separately timed and cached, then let urllib3 connect to each address in turn
+        started = time.perf_counter()
+        try:
+            addresses = dns_cache.resolve(self._dns_host)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        finally:
+            resolved = time.perf_counter()
+            record_phase('dns', resolved - started)
+
+        host, error = self._dns_host, None
+        try:
+            for address in addresses:
+                self._dns_host = address  # A literal IP: urllib3 will not look it up again
+                try:
+                    return super()._new_conn()
+                except (ConnectTimeoutError, NewConnectionError) as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = host
+            self._connect_seconds = time.perf_counter() - started
+            record_phase('connect', time.perf_counter() - resolved)
+
+    def getresponse(self):
+        started = time.perf_counter()
+        try:
+            with blocking_read(self.sock):
+                return super().getresponse()
+        finally:
+            record_phase('ttfb', time.perf_counter() - started)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        # Everything connect() does after _new_conn() is the TLS handshake (and certificate checks)
+        started = time.perf_counter()
+        super().connect()
+        record_phase('tls', time.perf_counter() - started - self._connect_seconds)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connections report their phase timings."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+class CachedDNSBackend(httpcore.AsyncNetworkBackend):
+    """An httpcore network backend that resolves through the DNS cache, then connects to each address in turn.
+
+    Cache misses are resolved on the event loop's default executor, as asyncio's own getaddrinfo() is.
+    """
+
+    def __init__(self):
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = dns_cache.cached(host)
+            if addresses is None:
+                addresses = await asyncio.get_running_loop().run_in_executor(None, dns_cache.lookup, host)
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(str(e)) from e
+        error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address,
+                                                       socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
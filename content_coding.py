@@ -0,0 +1,126 @@
+"""Compressed transfer for head fetches, decoded incrementally in bounded pieces.
+
+We only advertise codings we can decompress with a cap on the output of each step (zlib's
+max_length, brotli's output_buffer_limit, zstd's max_length), so one small compressed chunk
+can never expand into a huge buffer: a decompression bomb costs at most one piece at a time,
+and the head reader stops asking for more once it has seen the head or hit HEAD_MAX_BYTES.
+"""
+import zlib
+
+from requests.exceptions import ContentDecodingError
+
+try:
+    import brotli
+    if not hasattr(brotli.Decompressor(), 'can_accept_more_data'):
+        brotli = None  # Older releases cannot bound their output
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+PIECE_SIZE = 16 * 1024  # Most decoded bytes produced per decompression step
+
+ACCEPT_ENCODING = ', '.join(['gzip', 'deflate'] + (['br'] if brotli else []) + (['zstd'] if zstd else []))
+
+
+class _ZlibDecoder:
+    def __init__(self, wbits):
+        self._wbits = wbits
+        self._obj = None
+
+    def pieces(self, data):
+        if self._obj is None:
+            if self._wbits == 0:
+                # 'deflate' should be zlib-wrapped, but some servers send a raw deflate stream
+                zlib_header = len(data) >= 2 and data[0] & 0x0F == 8 and (data[0] << 8 | data[1]) % 31 == 0
+                self._wbits = zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS
+            self._obj = zlib.decompressobj(self._wbits)
+        while True:
+            out = self._obj.decompress(data, PIECE_SIZE)
+            data = self._obj.unconsumed_tail
+            if out:
+                yield out
+            if self._obj.eof:
+                data = self._obj.unused_data
+                if self._wbits != 16 + zlib.MAX_WBITS or not data.startswith(b'\x1f\x8b'):
+                    return  # Trailing bytes after the stream are ignored, as urllib3 does
+                self._obj = zlib.decompressobj(self._wbits)  # Another gzip member follows
+            elif not data and len(out) < PIECE_SIZE:
+                return  # Everything fed so far has been decoded
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def pieces(self, data):
+        out = self._obj.process(data, output_buffer_limit=PIECE_SIZE)
+        # Output held back by the limit is drained with empty input, as the brotli API requires. Once
+        # the input is used up can_accept_more_data() is True even with output still pending, so keep
+        # going until a call produces nothing.
+        while out:
+            yield out
+            if self._obj.is_finished():
+                return
+            out = self._obj.process(b'', output_buffer_limit=PIECE_SIZE)
+
+
+class _ZstdDecoder:
+    def __init__(self):
+        self._obj = zstd.ZstdDecompressor()
+
+    def pieces(self, data):
+        while True:
+            out = self._obj.decompress(data, PIECE_SIZE)
+            data = b''
+            if out:
+                yield out
+            if self._obj.eof:
+                data = self._obj.unused_data
+                if not data:
+                    return
+                self._obj = zstd.ZstdDecompressor()  # Another frame follows
+            elif self._obj.needs_input:
+                return
+
+
+class _IdentityDecoder:
+    def pieces(self, data):
+        if data:
+            yield data
+
+
+class BoundedDecoder:
+    """Decodes a body with the given Content-Encoding, yielding pieces of at most PIECE_SIZE bytes."""
+
+    def __init__(self, content_encoding):
+        coding = (content_encoding or 'identity').strip().lower()
+        if coding in ('identity', ''):
+            self._decoder = _IdentityDecoder()
+        elif coding in ('gzip', 'x-gzip'):
+            self._decoder = _ZlibDecoder(16 + zlib.MAX_WBITS)
+        elif coding == 'deflate':
+            self._decoder = _ZlibDecoder(0)  # Decided on the first bytes
+        elif coding == 'br' and brotli is not None:
+            self._decoder = _BrotliDecoder()
+        elif coding == 'zstd' and zstd is not None:
+            self._decoder = _ZstdDecoder()
+        else:
+            # Includes stacked codings ("gzip, br"), which we never ask for
+            raise ContentDecodingError(f'Unsupported Content-Encoding: {content_encoding}')
+        self.coding = coding
+        self.bytes_in = 0
+
+    def pieces(self, chunk):
+        """Yields the decoded bytes of `chunk` a piece at a time; stop iterating to stop decoding."""
+        self.bytes_in += len(chunk)
+        try:
+            yield from self._decoder.pieces(chunk)
+        except Exception as e:  # zlib.error, brotli.error, zstd.ZstdError
+            raise ContentDecodingError(f'Could not decode {self.coding} body: {e}') from e
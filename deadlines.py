@@ -0,0 +1,130 @@
+"""Time limits for page fetches: connect, read and total deadlines, adapted to each host.
+
+A single 15 s timeout applied to every socket operation, so a slow origin could hold a sync
+worker far longer: each body chunk was allowed another 15 s. Every fetch now gets a Deadline:
+
+- FETCH_CONNECT_TIMEOUT for opening each connection,
+- a read timeout for each wait on the origin (response headers or the next body chunk), which is
+  FETCH_READ_TIMEOUT, or less for a host whose recent responses were fast (see HostLatency),
+- FETCH_REDIRECT_TIMEOUT for the redirect chain: the final response's headers must arrive within it,
+- FETCH_TOTAL_TIMEOUT for everything, body included.
+
+No wait extends past the deadline that applies, nor does the backoff before a retry (see
+fetcher._get_retrying). Running out raises requests.exceptions.Timeout,
+which describe_error reports as a 504.
+
+With HEDGE_FETCHES=1, a fetch still waiting after its host's recent p95 response time is raced
+by a second attempt, and whichever finishes first is used (see fetcher.fetch_head).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+FETCH_CONNECT_TIMEOUT = float(os.environ.get('FETCH_CONNECT_TIMEOUT', 5))
+FETCH_READ_TIMEOUT = float(os.environ.get('FETCH_READ_TIMEOUT', 10))
+FETCH_REDIRECT_TIMEOUT = float(os.environ.get('FETCH_REDIRECT_TIMEOUT', 10))
+FETCH_TOTAL_TIMEOUT = float(os.environ.get('FETCH_TOTAL_TIMEOUT', 15))
+
+# Adaptive read timeouts: a multiple of the host's recent p95, within [ADAPTIVE_TIMEOUT_MIN, FETCH_READ_TIMEOUT]
+ADAPTIVE_TIMEOUTS = os.environ.get('ADAPTIVE_TIMEOUTS', '1') == '1'
+ADAPTIVE_TIMEOUT_FACTOR = float(os.environ.get('ADAPTIVE_TIMEOUT_FACTOR', 4))
+ADAPTIVE_TIMEOUT_MIN = float(os.environ.get('ADAPTIVE_TIMEOUT_MIN', 2))
+LATENCY_MIN_SAMPLES = int(os.environ.get('LATENCY_MIN_SAMPLES', 20))  # Below this, a host gets the fixed timeouts
+LATENCY_WINDOW = 100  # Most recent response times kept per host
+LATENCY_MAX_HOSTS = 4096
+
+HEDGE_FETCHES = os.environ.get('HEDGE_FETCHES') == '1'
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', 0.05))  # Never hedge sooner than this
+HEDGE_WORKERS = int(os.environ.get('HEDGE_WORKERS', 32))  # Threads per worker running hedged sync fetches
+
+
+class _Host:
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.p95 = None  # Cached until the next sample
+
+
+class HostLatency:
+    """Recent response times per host: from sending a request to receiving its headers, connect included."""
+
+    def __init__(self, max_hosts=LATENCY_MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds):
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = _Host()
+            self._hosts.move_to_end(host)
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+            entry.samples.append(seconds)
+            entry.p95 = None
+
+    def p95(self, host):
+        """The host's 95th percentile response time in seconds, or None until it has LATENCY_MIN_SAMPLES."""
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or len(entry.samples) < LATENCY_MIN_SAMPLES:
+                return None
+            if entry.p95 is None:
+                ordered = sorted(entry.samples)
+                entry.p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+            return entry.p95
+
+    def read_timeout(self, host):
+        p95 = self.p95(host) if ADAPTIVE_TIMEOUTS else None
+        if p95 is None:
+            return FETCH_READ_TIMEOUT
+        return min(max(p95 * ADAPTIVE_TIMEOUT_FACTOR, ADAPTIVE_TIMEOUT_MIN), FETCH_READ_TIMEOUT)
+
+    def hedge_delay(self, host):
+        """Seconds after which a fetch from `host` should be hedged, or None to never hedge it."""
+        p95 = self.p95(host) if HEDGE_FETCHES else None
+        return None if p95 is None else max(p95, HEDGE_MIN_DELAY)
+
+
+host_latency = HostLatency()
+
+
+class Deadline:
+    """The time limits of one fetch, counted from its creation."""
+
+    def __init__(self, total=FETCH_TOTAL_TIMEOUT, redirects=FETCH_REDIRECT_TIMEOUT):
+        now = time.monotonic()
+        self.total = total
+        self.redirects = min(redirects, total)
+        self.expires = now + total
+        self.headers_expire = now + self.redirects
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def request_timeouts(self, host):
+        """(connect, read, total) timeouts for one request of the redirect chain, in seconds.
+
+        `total` is what is left of the chain's budget; connecting and waiting for headers together
+        must fit in it.
+        """
+        left = self._left(self.headers_expire, f'No final response within {self.redirects:g} s')
+        return min(FETCH_CONNECT_TIMEOUT, left), min(host_latency.read_timeout(host), left), left
+
+    def allows_wait(self, seconds):
+        """True if, after waiting `seconds` (say, before a retry), there is still time left for a request."""
+        return time.monotonic() + seconds < self.headers_expire
+
+    def read_timeout(self, host_timeout):
+        """Seconds to wait for the next body chunk, given the host's read timeout."""
+        return min(host_timeout, self._left(self.expires, f'Fetch took longer than {self.total:g} s'))
+
+    @staticmethod
+    def _left(expires, message):
+        left = expires - time.monotonic()
+        if left <= 0:
+            raise requests.exceptions.Timeout(message)
+        return left
@@ -0,0 +1,226 @@
+"""Fetch-and-extract pipeline shared by the single-URL and batch endpoints."""
+import logging
+import socket
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from cache import CACHE_BACKEND, cache_key, get_cache
+from fetcher import fetch_head
+from head_parser import create_extractor
+from history import get_history
+from metrics import CACHE_RESULTS, ERRORS, track_extraction
+from profiling import profiled
+from singleflight import SingleFlight, shared_lock
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 MetaVerifierBot/1.1'
+REQUEST_TIMEOUT = 15  # For sitemaps; page fetches use the limits in deadlines.py
+
+# Coalesce across workers only when they share a cache to find each other's results in
+SHARED_COALESCING = CACHE_BACKEND == 'sqlite'
+
+flights = SingleFlight()
+
+
+class InvalidURLError(ValueError):
+    """Raised when user input cannot be turned into an http(s) URL."""
+
+
+def normalize_url(url):
+    """Basic validation/fixing for URL: prepends https:// to bare domains."""
+    if not isinstance(url, str):
+        raise InvalidURLError(f'Invalid URL format: {url}')
+    if not url.startswith(('http://', 'https://')):
+        # Check if it looks like a domain before prepending https://
+        if '.' in url and not url.startswith('/'):
+            url = 'https://' + url
+        else:
+            raise InvalidURLError(f'Invalid URL format: {url}')
+    try:
+        urlsplit(url).port  # Raises for a broken IPv6 literal or a port that is not a number from 0 to 65535
+    except ValueError as e:
+        raise InvalidURLError(f'Invalid URL format: {url}') from e
+    return url
+
+
+def conditional_headers(entry):
+    """Request headers that let the origin answer 304 if the cached page is unchanged."""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def validators_of(response):
+    return {'etag': response.headers.get('etag'), 'last_modified': response.headers.get('last-modified')}
+
+
+def with_charset(head, fields=None):
+    """The HeadReader's result plus the charset the head was decoded with and how it was chosen, projected to `fields`."""
+    payload = {**head.result(), 'charset': head.encoding, 'charset_source': head.encoding_source}
+    return fields.project(payload) if fields is not None else payload
+
+
+def extract_url(url, extra_headers=None, fields=None):
+    """Fetches `url` and returns ({'title', 'metadata', 'canonical', 'charset', 'charset_source'}, validators).
+
+    With `fields` (a projection.Fields), the payload holds only the selected parts and meta tags.
+    The payload is None when `extra_headers` made the request conditional and the origin
+    answered 304 Not Modified. Network and HTTP failures propagate as requests exceptions;
+    see describe_error.
+    """
+    headers = {'User-Agent': USER_AGENT, **(extra_headers or {})}
+    # Streams the body and stops at </head> (or the HEAD_MAX_BYTES cap) instead of downloading the whole page
+    with profiled(), track_extraction():
+        response, head = fetch_head(url, headers=headers, parser=create_extractor(fields=fields))
+    if head is None:
+        logger.info(f"{url} not modified since it was cached")
+        return None, validators_of(response)
+
+    content_type = response.headers.get('content-type', '').lower()
+    if 'text/html' not in content_type:
+        logger.warning(f"URL {url} returned non-HTML content-type: {content_type}")
+        # Proceeding anyway, but could return an error here if strict HTML is required
+
+    logger.info(f"Read {head.bytes_read} bytes of {url} (hit byte cap: {head.truncated}, "
+                f"unchanged head: {head.parse_skipped})")
+    # Title, meta tags and canonical were collected in one pass while the head streamed in
+    return with_charset(head, fields), validators_of(response)
+
+
+def cache_lookup(url, fresh=False, fields=None):
+    """First half of a cached extraction. Returns (key, cached entry or None, payload if it is a fresh hit).
+
+    With `fields`, a fresh full result is projected; otherwise the projection is cached (and
+    coalesced) under a key of its own, as it was parsed from the page.
+    """
+    cache = get_cache()
+    key = cache_key(url)
+    if fields is not None:
+        full = None if fresh else cache.get(key)
+        if full is not None and full[1]:
+            cache.record('hit')
+            logger.info(f"Cache hit for {url}")
+            return key, full[0], fields.project(full[0]['payload'])
+        key = fields.cache_key(key)
+    cached = None if fresh else cache.get(key)
+    if cached is None:
+        return key, None, None
+    entry, is_fresh = cached
+    if is_fresh:
+        cache.record('hit')
+        logger.info(f"Cache hit for {url}")
+        return key, entry, entry['payload']
+    return key, entry, None  # Expired but revalidatable
+
+
+def cache_store(key, entry, payload, validators, fresh=False, elapsed=None, projected=False):
+    """Second half of a cached extraction: stores what was fetched. Returns (payload, cache status).
+
+    With HISTORY_ENABLED the result is also recorded in the history store, together with
+    `elapsed`, the seconds the fetch took, unless it is `projected` (history compares whole results).
+    """
+    cache = get_cache()
+    if payload is None:
+        # 304 Not Modified: reuse the stored extraction, keeping old validators the server did not resend
+        payload = entry['payload']
+        validators = {name: value or entry.get(name) for name, value in validators.items()}
+        status = 'revalidated'
+    else:
+        status = 'bypass' if fresh else 'miss'
+    if not fresh:
+        cache.record(status)
+    cache.set(key, {'payload': payload, **validators})
+    history = get_history()
+    if history is not None and not projected:
+        history.record(key, payload, status, elapsed)
+    return payload, status
+
+
+def extract(url, fresh=False, fields=None):
+    """Cached, coalesced front door to extract_url. Returns (payload, cache status).
+
+    `fields` (a projection.Fields, or None for everything) limits the payload to the selected parts.
+
+    The status is 'hit', 'revalidated' (an expired entry confirmed unchanged by a 304), 'miss',
+    'bypass' when `fresh` asked to skip the cached copy, or 'coalesced' when the result came from
+    an identical request already in flight. Failed fetches are never cached.
+    """
+    key, entry, payload = cache_lookup(url, fresh, fields)
+    if payload is not None:
+        CACHE_RESULTS.inc('hit')
+        return payload, 'hit'
+
+    def fetch():
+        with shared_lock(key, enabled=SHARED_COALESCING) as locked:
+            if locked and not fresh:
+                # Another worker may have filled the shared cache while we waited for the lock
+                _, latest, payload = cache_lookup(url, fields=fields)
+                if payload is not None:
+                    return payload, 'hit'
+            else:
+                latest = entry
+            started = time.monotonic()
+            payload, validators = extract_url(url, conditional_headers(latest) if latest else None, fields)
+            return cache_store(key, latest, payload, validators, fresh, time.monotonic() - started,
+                               projected=fields is not None)
+
+    (payload, status), shared = flights.do(key, fetch)
+    status = 'coalesced' if shared else status
+    CACHE_RESULTS.inc(status)
+    return payload, status
+
+
+def _is_dns_failure(e):
+    """True if a socket.gaierror is somewhere behind `e` (requests wraps urllib3's NameResolutionError)."""
+    seen = set()
+    while e is not None and id(e) not in seen:
+        if isinstance(e, socket.gaierror):
+            return True
+        seen.add(id(e))
+        inner = getattr(e, 'reason', None) or (e.args[0] if e.args and isinstance(e.args[0], BaseException) else None)
+        e = inner or e.__cause__ or e.__context__
+    return False
+
+
+def describe_error(e, url):
+    """Logs an exception raised while extracting `url` and maps it to (error message, HTTP status).
+
+    Each call is also counted in the metaverifier_errors_total metric, by category.
+    """
+    if isinstance(e, requests.exceptions.Timeout):
+        logger.error(f"Timeout occurred while fetching {url}")
+        ERRORS.inc('timeout')
+        return f'Request timed out fetching URL: {url}', 504
+    if isinstance(e, requests.exceptions.RequestException):
+        logger.error(f"Error fetching URL {url}: {e}")
+        error_message = f'Could not fetch or process URL: {url}. Error: {str(e)}'
+        status_code = 500
+        category = 'request'
+        if isinstance(e, requests.exceptions.ConnectionError) and _is_dns_failure(e):
+            error_message = f'Could not resolve the host name of URL: {url}. Check the address.'
+            status_code = 400
+            category = 'dns'
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            error_message = f'Could not connect to URL: {url}. Check the address and network.'
+            status_code = 400
+            category = 'connection'
+        elif isinstance(e, requests.exceptions.HTTPError):
+            error_message = f'Server returned error {e.response.status_code} for URL: {url}.'
+            status_code = 400  # Treat client/server errors from target as bad request for our service
+            category = 'http_error'
+        elif isinstance(e, requests.exceptions.InvalidURL):
+            error_message = f'Invalid URL format provided: {url}'
+            status_code = 400
+            category = 'invalid_url'
+        ERRORS.inc(category)
+        return error_message, status_code
+
+    ERRORS.inc('unexpected')
+    logger.error(f"An unexpected error occurred processing {url}: {e}", exc_info=e)  # Log traceback
+    return 'An unexpected server error occurred while processing the URL.', 500
@@ -0,0 +1,770 @@
+"""Streaming fetch helpers that download only as much of a page as its <head> needs."""
+import asyncio
+import codecs
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+import requests
+from requests.cookies import RequestsCookieJar, extract_cookies_to_jar
+from requests.utils import requote_uri
+from urllib3.exceptions import ConnectTimeoutError, ProtocolError, ReadTimeoutError, SSLError
+from urllib3.util import Timeout
+
+from charset import resolve_label, sniff_encoding
+from connections import Abort, TimedHTTPAdapter, aborting, blocking_read
+from content_coding import ACCEPT_ENCODING, BoundedDecoder
+from deadlines import HEDGE_WORKERS, Deadline, host_latency
+from head_parser import create_extractor
+from metrics import (BYTES_FETCHED, BYTES_PARSED, HEAD_CACHE_LOOKUPS, HEDGED_FETCHES, add_timings, record_hop,
+                     record_phase, separate_timings)
+from parse_pool import offload_threshold, parse_offloaded, parse_offloaded_async
+
+logger = logging.getLogger(__name__)
+
+# Backstop for pages whose <head> never ends (or is enormous): stop reading after this many bytes
+HEAD_MAX_BYTES = int(os.environ.get('HEAD_MAX_BYTES', 1024 * 1024))
+CHUNK_SIZE = 16 * 1024
+# How much of the body we look at for a <meta charset> before we start decoding
+SNIFF_BYTES = 1024
+# Unwanted bodies (redirects, retried errors) up to this size are read, not just dropped, so their connection is reused
+REDIRECT_BODY_MAX = 64 * 1024
+
+# Connection pooling for the per-worker session
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 32))  # Hosts with a pool kept open
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 16))  # Keep-alive connections kept per host
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.3))  # First wait between retries; doubles each time
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+# Parsed heads remembered by a hash of their bytes, so an unchanged <head> is never parsed twice
+HEAD_HASH_CACHE_SIZE = int(os.environ.get('HEAD_HASH_CACHE_SIZE', 4096))
+
+# Codecs whose code units are wider than a byte (as the head reader decodes them) -> the codec to search raw bytes in
+_WIDE_CODECS = {'utf-16': 'utf-16-le', 'utf-16-le': 'utf-16-le', 'utf-16-be': 'utf-16-be',
+                'utf-32': 'utf-32-le', 'utf-32-le': 'utf-32-le', 'utf-32-be': 'utf-32-be'}  # No BOM: little-endian
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+class _Session(requests.Session):
+    """requests.Session without the Response.next lookahead.
+
+    With allow_redirects=False, Session.send() still prepares the next request of a redirect
+    (Response.next), and reads the redirect's whole body, decompressed, to do so. Nothing here
+    uses Response.next; _get_following_redirects drains or closes redirect bodies itself.
+    """
+
+    def resolve_redirects(self, resp, req, *args, yield_requests=False, **kwargs):
+        if yield_requests:
+            return iter(())
+        return super().resolve_redirects(resp, req, *args, yield_requests=yield_requests, **kwargs)
+
+
+def _build_session():
+    session = _Session()
+    # No retries here: _get_retrying() retries, so that no backoff runs past the fetch's deadline
+    adapter = TimedHTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # The session is shared by every check in this worker; never carry one site's cookies into the next request
+    # (each fetch keeps its redirect chain's cookies itself, see _get_following_redirects)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session():
+    """Returns this worker process's shared keep-alive session, rebuilding it after a fork."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def declared_charset(response):
+    """Returns the charset from the Content-Type header, or None if the server did not send one.
+
+    Works for both requests and httpx responses. The body itself is never decoded wholesale
+    (no response.text), so requests' charset guessing over the full document never runs.
+    """
+    content_type = response.headers.get('content-type', '').lower()
+    if 'charset=' not in content_type:
+        return None  # requests would default to ISO-8859-1 here; sniff <meta charset> instead
+    return requests.utils.get_encoding_from_headers(response.headers)
+
+
+class HeadResultCache:
+    """Bounded LRU of parse results keyed by a digest of the exact <head> bytes they came from."""
+
+    def __init__(self, max_entries=HEAD_HASH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        with self._lock:
+            payload = self._entries.get(digest)
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(digest)
+        HEAD_CACHE_LOOKUPS.inc('miss' if payload is None else 'hit')
+        return payload
+
+    def put(self, digest, payload):
+        with self._lock:
+            self._entries[digest] = payload
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'head_hash_entries': len(self._entries), 'head_hash_hits': self.hits, 'head_hash_misses': self.misses}
+
+
+head_results = HeadResultCache()
+
+
+class HeadReader:
+    """Decodes body chunks into a head extractor until it has seen </head> or the byte cap is hit.
+
+    With a `head_cache` (of a non-zero size), the body is consumed one </head or <body candidate
+    at a time. At each candidate the bytes so far are hashed (incrementally) and looked up; on a
+    hit the cached result is used and the rest is never parsed. On a miss the segment is parsed,
+    and if the parser finished there the result is cached under that hash. A candidate the parser did not accept
+    (say, "</head>" inside a script) just moves the lookup on to the next one. While the parser
+    is inside a script or style, the search skips to its end tag first, since no candidate before
+    that can end the head. Tags are searched for as encoded in the page's charset, so UTF-16 and
+    UTF-32 pages (by their byte order mark or Content-Type) end at their </head> too.
+
+    With `offload_bytes`, a first segment at least that large is not parsed here: feed() stops
+    with `offload_request` set, the caller has it parsed elsewhere (see parse_pool) and hands
+    the outcome to complete_offload().
+    """
+
+    def __init__(self, parser, header_charset=None, max_bytes=HEAD_MAX_BYTES, head_cache=None, offload_bytes=None):
+        self.parser = parser
+        self.header_charset = header_charset
+        self.max_bytes = max_bytes
+        self.head_cache = head_cache if head_cache is not None and head_cache.max_entries else None
+        self.offload_bytes = offload_bytes
+        self.offload_request = None  # (bytes, encoding, backend, fields) waiting to be parsed out of process
+        self.encoding = None
+        self.encoding_source = None  # How the encoding was chosen: 'bom', 'header', 'meta', 'detected' or 'default'
+        self.bytes_read = 0
+        self.truncated = False
+        self.done = False
+        self.parse_skipped = False  # True when the result came from head_cache
+        self._pending = bytearray()  # Bytes not yet fed to the parser
+        self._scanned = 0  # How far _pending has been searched for a head boundary
+        self._raw_text_end = None  # Offset in _pending just past the end tag of the parser's open script or style
+        self._units = None  # Codec to search _pending for tags in: None until known, '' for ASCII-compatible encodings
+        self._unit_width = 1  # Bytes per code unit in that codec
+        self._decoder = None
+        self._hasher = None
+        self._cached = None
+        self._offloaded = None
+        self._offload_final = False
+        self._digest = None  # Set when the parse result should be cached under this digest
+
+    def feed(self, chunk):
+        """Consumes one chunk of the body. Returns True once no more bytes are needed."""
+        if self.done or not chunk:
+            return self.done
+
+        remaining = self.max_bytes - self.bytes_read
+        if len(chunk) >= remaining:
+            chunk = chunk[:remaining]
+            self.truncated = True
+        self.bytes_read += len(chunk)
+
+        if self.head_cache is not None:
+            self._pending += chunk
+            self._consume_segments()
+            if self.offload_request is not None:
+                return False
+        elif self._decoder is None:
+            self._pending += chunk
+            if len(self._pending) < SNIFF_BYTES and not self.truncated:
+                return False
+            self._flush_pending()
+        else:
+            self.parser.feed(self._decoder.decode(chunk))
+
+        self.done = self.done or self.parser.done or self.truncated
+        return self.done
+
+    def close(self):
+        """Flushes anything still buffered into the parser; call once after the last chunk."""
+        if self.parse_skipped or self._offloaded is not None:
+            return
+        self._flush_pending()
+        self.parser.feed(self._decoder.decode(b'', final=True))
+        self.parser.close()
+
+    def result(self):
+        """The {'title', 'metadata', 'canonical'} payload; call after close()."""
+        if self.parse_skipped:
+            return self._cached
+        payload = self._offloaded if self._offloaded is not None else self.parser.result()
+        if self._digest is not None:
+            self.head_cache.put(self._digest, payload)
+        return payload
+
+    def complete_offload(self, outcome):
+        """Takes the (payload, done) of an offloaded parse, or None if it failed. Returns self.done.
+
+        If the parser stopped short of the end of the head (a false boundary candidate), or the
+        offload failed, the bytes are parsed here instead and reading carries on.
+        """
+        data = self.offload_request[0]
+        self.offload_request = None
+        if outcome is not None and (outcome[1] or self._offload_final):
+            self._offloaded = outcome[0]
+            if not outcome[1]:
+                self._digest = None  # Truncated: not a complete head, so not worth caching
+            self.done = True
+            return True
+        digest, self._digest = self._digest, None
+        self.parser.feed(self._decoder.decode(data))
+        if self._offload_final:
+            self.done = True
+            return True
+        if self.parser.done:
+            self._digest = digest
+        self._consume_segments()
+        self.done = self.done or self.parser.done or self.truncated
+        return self.done
+
+    def _consume_segments(self):
+        while not self.done and self.offload_request is None:
+            head_end = self._find_head_end()
+            if head_end is None:
+                break
+            self._feed_segment(head_end)
+        if self.truncated and not self.done and self.offload_request is None:
+            if self._decoder is None and self._offloadable(len(self._pending)):
+                # No end of head within the byte cap: parse everything we have, out of process
+                self._start_decoder(bytes(self._pending[:SNIFF_BYTES]))
+                self._request_offload(bytes(self._pending), final=True)
+                self._pending = None
+            else:
+                self._flush_pending()
+
+    def _offloadable(self, size):
+        # Callers check that nothing was fed to the parser yet: only then can a remote one replace it
+        return self.offload_bytes is not None and size >= self.offload_bytes
+
+    def _request_offload(self, data, final):
+        self.offload_request = (data, self.encoding, self.parser.backend, self.parser.fields)
+        self._offload_final = final
+
+    def _find_head_end(self):
+        """Returns the offset just past the next </head or <body candidate's '>', or None if none has arrived."""
+        if self._units is None:
+            if len(self._pending) < 2:
+                return None  # Not enough to see a byte order mark
+            self._units = _search_codec(bytes(self._pending[:2]), self.header_charset)
+            self._unit_width = len('<'.encode(self._units or 'ascii'))
+        width = self._unit_width
+        start = max(0, self._scanned - 5 * width)
+        raw_text = self.parser.raw_text_element
+        if raw_text and self._raw_text_end is None:
+            # No candidate before its end tag can end the head. Skipping them saves a hash lookup
+            # each, and a feed each, which in raw text makes html.parser rescan the whole element
+            end_tag = _search(_tag_re(self._units, '</' + raw_text), self._pending,
+                              max(0, self._scanned - (len(raw_text) + 1) * width), width)
+            if end_tag is None:
+                self._scanned = len(self._pending)
+                return None
+            self._raw_text_end = end_tag.end()
+        if self._raw_text_end is not None:
+            start = max(start, self._raw_text_end)
+        match = _search(_tag_re(self._units, '</head', '<body'), self._pending, start, width)
+        if match is None:
+            self._scanned = len(self._pending)
+            return None
+        close = _search(_tag_re(self._units, '>'), self._pending, match.end(), width)
+        if close is None:
+            self._scanned = match.start()  # Look at this candidate again once its '>' arrives
+            return None
+        return close.end()
+
+    def _feed_segment(self, end):
+        segment = bytes(self._pending[:end])
+        del self._pending[:end]
+        self._scanned = 0
+        self._raw_text_end = None
+        first = self._decoder is None
+        if first:
+            self._start_decoder(segment + bytes(self._pending[:SNIFF_BYTES]))
+            # The same bytes only give the same result with the same codec, parser backend and projection
+            fields = self.parser.fields.key if self.parser.fields is not None else '*'
+            self._hasher = hashlib.blake2b(f'{self.encoding}:{type(self.parser).__name__}:{fields}:'.encode(),
+                                           digest_size=20)
+        self._hasher.update(segment)
+        digest = self._hasher.digest()
+
+        cached = self.head_cache.get(digest)
+        if cached is not None:
+            self._cached = cached
+            self.parse_skipped = self.done = True
+            return
+        if first and self._offloadable(len(segment)):
+            self._digest = digest
+            self._request_offload(segment, final=False)
+            return
+        self.parser.feed(self._decoder.decode(segment))
+        if self.parser.done:
+            self._digest = digest
+            self.done = True
+
+    def _flush_pending(self):
+        """Feeds every held-back byte to the parser, picking the encoding first if needed."""
+        if self._pending is None:
+            return
+        data = bytes(self._pending)
+        self._pending = None
+        if self._decoder is None:
+            self._start_decoder(data)
+        self.parser.feed(self._decoder.decode(data))
+
+    def _start_decoder(self, prefix):
+        self.encoding, self.encoding_source = sniff_encoding(prefix[:SNIFF_BYTES], self.header_charset)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+
+
+def _search_codec(prefix, header_charset):
+    """The codec a body's tags are encoded in, for searching its raw bytes; '' for ASCII-compatible encodings.
+
+    Only a byte order mark or the Content-Type charset can make a page UTF-16 or UTF-32 (see charset.py).
+    """
+    if prefix.startswith(codecs.BOM_UTF16_LE):
+        return 'utf-16-le'
+    if prefix.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16-be'
+    if prefix.startswith(codecs.BOM_UTF8) or not header_charset:
+        return ''
+    return _WIDE_CODECS.get(resolve_label(header_charset), '')
+
+
+@functools.lru_cache(maxsize=None)
+def _tag_re(codec, *words):
+    """Matches any of the ASCII `words`, in any case, as encoded by `codec` ('' for ASCII-compatible encodings)."""
+    if not codec:
+        return re.compile(b'|'.join(re.escape(word.encode()) for word in words), re.IGNORECASE)
+    return re.compile(b'|'.join(
+        b''.join(b'(?:%s|%s)' % (re.escape(char.lower().encode(codec)), re.escape(char.upper().encode(codec)))
+                 for char in word)
+        for word in words))
+
+
+def _search(pattern, data, start, width):
+    """pattern.search(data, start), skipping matches that do not start on a code unit boundary."""
+    match = pattern.search(data, start)
+    while match is not None and match.start() % width:
+        match = pattern.search(data, match.start() + 1)
+    return match
+
+
+def fetch_head(url, headers, parser, deadline=None, max_bytes=HEAD_MAX_BYTES, head_cache=head_results):
+    """GETs `url` in streaming mode, feeding `parser` until it reports the <head> is complete.
+
+    Returns the (closed) response and the HeadReader that drove the parser; its result() is the
+    extraction. The reader is None when a conditional request was answered with 304 Not Modified.
+    Pass head_cache=None to always parse inline. Large heads go to the parse pool when one is configured.
+    Time limits come from `deadline` (a fresh deadlines.Deadline by default); with HEDGE_FETCHES on,
+    a fetch slower than its host's recent p95 is raced by a second attempt.
+    """
+    deadline = deadline or Deadline()
+    delay = host_latency.hedge_delay(urlsplit(url).hostname)
+    if delay is not None:
+        return _fetch_head_hedged(url, headers, parser, deadline, delay, max_bytes, head_cache)
+    return _fetch_head_once(url, headers, parser, deadline, max_bytes, head_cache)
+
+
+def _fetch_head_once(url, headers, parser, deadline, max_bytes, head_cache, abort=None):
+    session = get_session()
+    headers = {'Accept-Encoding': ACCEPT_ENCODING, **headers}
+    with _get_following_redirects(session, url, headers, deadline) as response:
+        response.raise_for_status()
+        if response.status_code == 304:
+            return response, None
+        reader = HeadReader(parser, declared_charset(response), max_bytes, head_cache, offload_threshold())
+        decoder = BoundedDecoder(response.headers.get('content-encoding'))
+        timer = _BodyTimer()
+        for chunk in _iter_raw(response, deadline):
+            if _feed_decoded(reader, decoder, chunk, timer) or (abort is not None and abort.aborted):
+                break
+    # Leaving the `with` block releases the connection; if the body was not fully read it is closed
+    # rather than returned to the pool, so the rest of the page is never transferred
+    with timer.phase('parse'):
+        reader.close()
+    timer.finish(reader, decoder)
+    logger.debug(f"Read {reader.bytes_read} bytes ({decoder.bytes_in} on the wire, {decoder.coding}) from {url} "
+                 f"as {reader.encoding} (truncated={reader.truncated}, parse skipped={reader.parse_skipped})")
+    return response, reader
+
+
+def _iter_raw(response, deadline):
+    """Yields the body's raw (still compressed) bytes as they arrive, never waiting past the deadline.
+
+    Raw bytes, because urllib3 would decompress each chunk in one unbounded step. read1() returns
+    what a single socket read brings, so a slowly sent head is parsed as it comes in rather than
+    once CHUNK_SIZE bytes have piled up.
+    """
+    raw = response.raw
+    read = getattr(raw, 'read1', raw.read)  # read1() needs urllib3 2.3
+    host_timeout = host_latency.read_timeout(urlsplit(response.url).hostname)
+    sock = _socket_of(raw)
+    try:
+        while True:
+            timeout = deadline.read_timeout(host_timeout)
+            if sock is not None:
+                sock.settimeout(timeout)  # urllib3 set it once, when the request was sent
+            with blocking_read(sock):
+                chunk = read(CHUNK_SIZE, decode_content=False)
+            if not chunk:
+                return
+            yield chunk
+    # Mapped as requests' iter_content() would, so describe_error reports them as fetch errors
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(str(e)) from e
+    except ProtocolError as e:  # The connection dropped mid-body, or the body came up short
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except SSLError as e:
+        raise requests.exceptions.SSLError(e) from e
+
+
+def _socket_of(raw):
+    """The socket a urllib3 response reads its body from, or None if it cannot be found."""
+    sock = getattr(getattr(raw, 'connection', None), 'sock', None)
+    if sock is None:
+        # http.client lets go of the connection's socket when the body runs until the connection closes;
+        # the response still reads from it, through a buffered reader over a SocketIO
+        sock = getattr(getattr(getattr(getattr(raw, '_fp', None), 'fp', None), 'raw', None), '_sock', None)
+    return sock
+
+
+def _get_following_redirects(session, url, headers, deadline):
+    """GETs `url`, following redirects one hop at a time so each hop can be timed. Returns the final response.
+
+    Cookies set along the way are sent on the following hops (as requests.get() does), but kept
+    in a jar of this fetch's own; the shared session never stores any.
+    """
+    cookies = RequestsCookieJar()
+    for _ in range(session.max_redirects + 1):
+        response = _get_retrying(session, url, headers, cookies, deadline)
+        extract_cookies_to_jar(cookies, response.request, response.raw)
+        location = session.get_redirect_target(response)
+        if location is None:
+            return response
+        _release(response)
+        url = requote_uri(urljoin(response.url, location))
+    raise requests.TooManyRedirects(f'Exceeded {session.max_redirects} redirects.', response=response)
+
+
+def _get_retrying(session, url, headers, cookies, deadline):
+    """GETs `url` without following a redirect, retrying failed connects and 502/503/504 responses.
+
+    There are up to HTTP_RETRIES retries, HTTP_RETRY_BACKOFF seconds apart and twice that each time
+    (a Retry-After header is ignored). A retry whose wait would leave no time before the deadline
+    is skipped: the failure or response at hand is final.
+    """
+    host = urlsplit(url).hostname
+    for attempt in range(HTTP_RETRIES + 1):
+        backoff = HTTP_RETRY_BACKOFF * 2 ** attempt
+        connect, read, total = deadline.request_timeouts(host)
+        started = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, cookies=cookies, allow_redirects=False, stream=True,
+                                   timeout=Timeout(connect=connect, read=read, total=total))
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.Timeout):
+                host_latency.record(host, time.perf_counter() - started)  # At least this slow
+            if not (_connect_failed(e) and attempt < HTTP_RETRIES and deadline.allows_wait(backoff)):
+                raise
+        else:
+            elapsed = time.perf_counter() - started
+            host_latency.record(host, elapsed)
+            record_hop(response.url, response.status_code, elapsed)
+            if response.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES or not deadline.allows_wait(backoff):
+                return response
+            _release(response)
+        time.sleep(backoff)
+
+
+def _connect_failed(error):
+    # Only a request that never reached the origin is retried; a read timeout stays a timeout (504)
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+def _release(response):
+    """Closes a response whose body is not wanted, reading a small one first so its connection is reused."""
+    if _small_body(response):
+        # Read undecoded, so a compressed body cannot expand
+        response.raw.read(REDIRECT_BODY_MAX, decode_content=False)
+    response.close()
+
+
+def _get_hedge_executor():
+    """Returns this worker process's pool for hedged fetches, creating it on first use."""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+        return _hedge_executor
+
+
+def _fetch_head_hedged(url, headers, parser, deadline, delay, max_bytes, head_cache):
+    """Runs the fetch on the hedge pool; if it is still going after `delay` seconds, races a second one against it.
+
+    The first attempt to succeed wins and the other is aborted: if it is waiting on the origin its
+    socket is shut down, so it gives its thread back at once rather than at its read timeout. Only
+    the winner's phases and hops are added to the extraction's timings.
+    """
+    executor = _get_hedge_executor()
+    attempts = []  # (future, Abort)
+
+    def start(attempt_parser):
+        abort = Abort()
+        future = executor.submit(contextvars.copy_context().run, _hedge_attempt, url, headers, attempt_parser,
+                                 deadline, max_bytes, head_cache, abort)
+        attempts.append((future, abort))
+
+    start(parser)
+    if not wait([attempts[0][0]], timeout=delay).done:
+        start(create_extractor(parser.backend, parser.fields))
+    pending, error = {future for future, _ in attempts}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result, timings = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            for other, abort in attempts:
+                if other is not future:
+                    abort.abort()
+            _hedge_won([other for other, _ in attempts].index(future), len(attempts), timings)
+            return result
+    if len(attempts) > 1:
+        HEDGED_FETCHES.inc('none')
+    raise error
+
+
+def _hedge_attempt(url, headers, parser, deadline, max_bytes, head_cache, abort):
+    with separate_timings() as timings, aborting(abort):
+        return _fetch_head_once(url, headers, parser, deadline, max_bytes, head_cache, abort), timings
+
+
+def _hedge_won(index, attempts, timings):
+    add_timings(timings)
+    if attempts > 1:
+        HEDGED_FETCHES.inc('first' if index == 0 else 'hedge')
+
+
+def _small_body(response):
+    # Reading a small unwanted body lets its connection be reused; a larger (or unsized) one is just closed
+    length = response.headers.get('content-length')
+    return length is not None and length.isdigit() and int(length) <= REDIRECT_BODY_MAX
+
+
+def _feed_decoded(reader, decoder, chunk, timer):
+    """Decodes `chunk` piece by piece into `reader`; returns True (leaving the rest undecoded) once it is done."""
+    for piece in timer.decoded(decoder.pieces(chunk)):
+        with timer.phase('parse'):
+            done = reader.feed(piece)
+            if reader.offload_request is not None:
+                done = parse_offloaded(reader)
+        if done:
+            return True
+    return False
+
+
+class _BodyTimer:
+    """Splits the time spent reading a body into decoding, parsing and everything else (the download)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {'decode': 0.0, 'parse': 0.0}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def decoded(self, pieces):
+        """Iterates the decoder's `pieces`, counting the time spent producing each one as decoding."""
+        pieces = iter(pieces)
+        while True:
+            with self.phase('decode'):
+                piece = next(pieces, None)
+            if piece is None:
+                return
+            yield piece
+
+    def finish(self, reader, decoder):
+        """Records the download, decode and parse phases and the bytes fetched and parsed."""
+        elapsed = time.perf_counter() - self.started
+        record_phase('download', elapsed - self.seconds['decode'] - self.seconds['parse'])
+        for name, seconds in self.seconds.items():
+            record_phase(name, seconds)
+        BYTES_FETCHED.inc(amount=decoder.bytes_in)
+        if not reader.parse_skipped:
+            BYTES_PARSED.inc(amount=reader.bytes_read)
+
+
+def _trace_phases():
+    """An httpx `trace` extension recording connect, TLS and time to first byte (httpcore resolves DNS while connecting)."""
+    phases = {'connection.connect_tcp': 'connect', 'connection.start_tls': 'tls',
+              'http11.receive_response_headers': 'ttfb', 'http2.receive_response_headers': 'ttfb'}
+    started = {}
+
+    async def trace(event, info):
+        step, _, stage = event.rpartition('.')
+        if step not in phases:
+            return
+        if stage == 'started':
+            started[step] = time.perf_counter()
+        elif step in started:
+            record_phase(phases[step], time.perf_counter() - started.pop(step))
+
+    return trace
+
+
+async def fetch_head_async(client, url, headers, parser, deadline=None, max_bytes=HEAD_MAX_BYTES,
+                           head_cache=head_results):
+    """Async counterpart of fetch_head for an httpx.AsyncClient; returns the same (response, reader) pair."""
+    deadline = deadline or Deadline()
+    delay = host_latency.hedge_delay(urlsplit(url).hostname)
+    if delay is not None:
+        fetch = _fetch_head_hedged_async(client, url, headers, parser, deadline, delay, max_bytes, head_cache)
+    else:
+        fetch = _fetch_head_once_async(client, url, headers, parser, deadline, max_bytes, head_cache)
+    try:
+        return await asyncio.wait_for(fetch, deadline.remaining())
+    except asyncio.TimeoutError as e:
+        raise requests.exceptions.Timeout(f'Fetch took longer than {deadline.total:g} s') from e
+
+
+async def _fetch_head_once_async(client, url, headers, parser, deadline, max_bytes, head_cache):
+    headers = {'Accept-Encoding': ACCEPT_ENCODING, **headers}
+    request = client.build_request('GET', url, headers=headers, extensions={'trace': _trace_phases()})
+    response = await _send_following_redirects(client, request, deadline)
+    try:
+        if response.status_code == 304:  # Checked first: httpx treats every non-2xx status as an error
+            return response, None
+        response.raise_for_status()
+        reader = HeadReader(parser, declared_charset(response), max_bytes, head_cache, offload_threshold())
+        decoder = BoundedDecoder(response.headers.get('content-encoding'))
+        timer = _BodyTimer()
+        done = False
+        async for chunk in response.aiter_raw():  # As received; a chunk size would make httpx wait to fill it
+            for piece in timer.decoded(decoder.pieces(chunk)):
+                with timer.phase('parse'):
+                    done = reader.feed(piece)
+                    if reader.offload_request is not None:
+                        done = await parse_offloaded_async(reader)
+                if done:
+                    break
+            if done:
+                break
+    finally:
+        await response.aclose()
+    with timer.phase('parse'):
+        reader.close()
+    timer.finish(reader, decoder)
+    logger.debug(f"Read {reader.bytes_read} bytes ({decoder.bytes_in} on the wire, {decoder.coding}) from {url} "
+                 f"as {reader.encoding} (truncated={reader.truncated}, parse skipped={reader.parse_skipped})")
+    return response, reader
+
+
+async def _fetch_head_hedged_async(client, url, headers, parser, deadline, delay, max_bytes, head_cache):
+    """Async counterpart of _fetch_head_hedged; the losing attempt is cancelled."""
+    async def attempt(attempt_parser):
+        with separate_timings() as timings:
+            return await _fetch_head_once_async(client, url, headers, attempt_parser, deadline, max_bytes,
+                                                head_cache), timings
+
+    tasks = [asyncio.ensure_future(attempt(parser))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.append(asyncio.ensure_future(attempt(create_extractor(parser.backend, parser.fields))))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                result, timings = task.result()
+                _hedge_won(tasks.index(task), len(tasks), timings)
+                return result
+        if len(tasks) > 1:
+            HEDGED_FETCHES.inc('none')
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()  # No-op for those already finished
+
+
+async def _send_following_redirects(client, request, deadline):
+    """Async counterpart of _get_following_redirects; the redirect requests come from httpx (response.next_request).
+
+    As there, cookies set along the chain go in a jar of this fetch's own.
+    """
+    cookies = httpx.Cookies()
+    for _ in range(client.max_redirects + 1):
+        host = request.url.host
+        connect, read, total = deadline.request_timeouts(host)
+        request.extensions['timeout'] = httpx.Timeout(read, connect=connect).as_dict()
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(client.send(request, stream=True, follow_redirects=False), total)
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            host_latency.record(host, time.perf_counter() - started)  # At least this slow
+            if isinstance(e, httpx.TimeoutException):
+                raise
+            raise requests.exceptions.Timeout(f'No final response within {deadline.redirects:g} s') from e
+        elapsed = time.perf_counter() - started
+        host_latency.record(host, elapsed)
+        record_hop(str(response.url), response.status_code, elapsed)
+        cookies.extract_cookies(response)
+        if response.next_request is None:
+            return response
+        request = response.next_request
+        cookies.set_cookie_header(request)
+        if _small_body(response):
+            async for _ in response.aiter_raw():  # Undecoded, as in _get_following_redirects
+                pass
+        await response.aclose()
+    raise httpx.TooManyRedirects('Exceeded maximum allowed redirects.', request=request)
@@ -0,0 +1,173 @@
+"""Single-pass <head> extractors that collect title, meta tags and canonical without building a DOM."""
+import logging
+import os
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional; the stdlib backend is always available
+    etree = None
+
+from projection import META_NAME_ATTRIBUTES
+
+logger = logging.getLogger(__name__)
+
+# 'html.parser' (default, stdlib) or 'lxml' (used only when lxml is installed)
+HEAD_PARSER = os.environ.get('HEAD_PARSER', 'html.parser')
+if HEAD_PARSER == 'lxml' and etree is None:
+    logger.warning("HEAD_PARSER=lxml requested but lxml is not installed; using html.parser")
+
+
+def _rel_is_canonical(rel):
+    return rel is not None and 'canonical' in rel.lower().split()
+
+
+class HeadExtractor(HTMLParser):
+    """Event-driven extractor on top of html.parser; stops collecting at </head> or <body>.
+
+    With a projection (`fields`), meta tags it does not select are skipped unread.
+    """
+
+    backend = 'html.parser'
+
+    def __init__(self, fields=None):
+        super().__init__(convert_charrefs=True)
+        self.fields = fields
+        self.done = False
+        self.title = None
+        self.canonical = None
+        self.metadata = []
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'meta':
+            if attrs and (self.fields is None or self.fields.keeps_meta(
+                    value for name, value in attrs if name in META_NAME_ATTRIBUTES)):
+                # Valueless attributes come through as None; report them as empty strings
+                self.metadata.append({'attributes': {name: value or '' for name, value in attrs}})
+        elif tag == 'link':
+            if self.canonical is None:
+                attrs = dict(attrs)
+                if attrs.get('href') and _rel_is_canonical(attrs.get('rel')):
+                    self.canonical = attrs['href'].strip()
+        elif tag == 'title':
+            if self.title is None:
+                self._in_title = True
+        elif tag == 'body':
+            self._finish()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    @property
+    def raw_text_element(self):
+        """The element (such as 'script') whose raw text is being read, or None.
+
+        No head boundary can occur inside it, so callers skip to its end tag before feeding more
+        (html.parser would also rescan all of the element's text on every feed()).
+        """
+        return self.cdata_elem
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts).strip()
+        elif tag == 'head':
+            self._finish()
+
+    def handle_data(self, data):
+        if self._in_title and not self.done:
+            self._title_parts.append(data)
+
+    def close(self):
+        super().close()
+        if self._in_title:  # Unterminated <title> at the end of the input
+            self._in_title = False
+            self.title = ''.join(self._title_parts).strip()
+
+    def _finish(self):
+        if self._in_title:
+            self.handle_endtag('title')
+        self.done = True
+
+    def result(self):
+        return {'title': self.title, 'metadata': self.metadata, 'canonical': self.canonical}
+
+
+class LxmlHeadExtractor:
+    """Same interface as HeadExtractor, backed by lxml's incremental libxml2 HTML parser."""
+
+    backend = 'lxml'
+
+    def __init__(self, fields=None):
+        self._parser = etree.HTMLPullParser(events=('start', 'end'))
+        self.fields = fields
+        self.done = False
+        self.raw_text_element = None  # An open script or style; libxml2 reports its start and end as they are fed
+        self.title = None
+        self.canonical = None
+        self.metadata = []
+
+    def feed(self, data):
+        if not self.done:
+            self._parser.feed(data)
+            self._drain()
+
+    def close(self):
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            pass  # libxml2 complains about truncated documents; we already have what we need
+        self._drain()
+
+    def _drain(self):
+        for event, element in self._parser.read_events():
+            if self.done:
+                continue
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue  # Comments and processing instructions
+            if tag in ('script', 'style'):
+                self.raw_text_element = tag if event == 'start' else None
+            if event == 'start':
+                if tag == 'meta':
+                    if element.attrib and (self.fields is None or self.fields.keeps_meta(
+                            element.get(name) for name in META_NAME_ATTRIBUTES)):
+                        self.metadata.append({'attributes': dict(element.attrib)})
+                elif tag == 'link':
+                    href = element.get('href')
+                    if self.canonical is None and href and _rel_is_canonical(element.get('rel')):
+                        self.canonical = href.strip()
+                elif tag == 'body':
+                    self.done = True
+            else:
+                if tag == 'title' and self.title is None:
+                    self.title = (element.text or '').strip()
+                elif tag == 'head':
+                    self.done = True
+                if tag != 'html':
+                    element.clear()  # Keep the partial tree from growing
+
+    def result(self):
+        return {'title': self.title, 'metadata': self.metadata, 'canonical': self.canonical}
+
+
+def create_extractor(backend=None, fields=None):
+    """Returns a fresh extractor for the configured (or requested) parser backend, keeping only `fields` if given."""
+    backend = backend or HEAD_PARSER
+    if backend == 'lxml' and etree is not None:
+        return LxmlHeadExtractor(fields)
+    return HeadExtractor(fields)
+
+
+def extract_head(html, backend=None):
+    """Parses an already-decoded document and returns {'title', 'metadata', 'canonical'}."""
+    extractor = create_extractor(backend)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.result()
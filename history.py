@@ -0,0 +1,181 @@
+"""Optional per-URL history of extraction results, for spotting what changed between checks.
+
+Snapshots are stored once per content hash, so re-checking an unchanged page only costs a hash
+comparison and a small observation row (time, hash, fetch duration). Diffs are computed on read,
+between consecutive distinct snapshots of a URL.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from storage import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', '0') == '1'
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', os.path.join(tempfile.gettempdir(), 'metaverifier-history.sqlite3'))
+
+
+def snapshot_hash(payload):
+    """Content hash of an extraction; the order of meta tags does not affect it."""
+    tags = sorted(json.dumps(tag['attributes'], sort_keys=True) for tag in payload['metadata'])
+    canonical = json.dumps({'title': payload['title'], 'canonical': payload['canonical'], 'metadata': tags},
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _meta_key(attrs):
+    """What identifies a meta tag across snapshots: its name/property, else all its attributes."""
+    for name in ('property', 'name', 'http-equiv', 'itemprop'):
+        if attrs.get(name):
+            return f'{name}={attrs[name].lower()}'
+    return json.dumps(attrs, sort_keys=True)
+
+
+def _meta_values(metadata):
+    values = {}
+    for tag in metadata:
+        attrs = tag['attributes']
+        values.setdefault(_meta_key(attrs), []).append(attrs.get('content', ''))
+    # Most keys occur once; only repeated ones (several og:image, say) are reported as lists
+    return {key: found[0] if len(found) == 1 else found for key, found in values.items()}
+
+
+def diff_snapshots(old, new):
+    """Describes how extraction `new` differs from `old`; only fields that changed are included."""
+    diff = {}
+    for field in ('title', 'canonical'):
+        if old[field] != new[field]:
+            diff[field] = {'from': old[field], 'to': new[field]}
+
+    before, after = _meta_values(old['metadata']), _meta_values(new['metadata'])
+    meta = {
+        'added': {key: after[key] for key in after.keys() - before.keys()},
+        'removed': {key: before[key] for key in before.keys() - after.keys()},
+        'changed': {key: {'from': before[key], 'to': after[key]}
+                    for key in before.keys() & after.keys() if before[key] != after[key]},
+    }
+    meta = {kind: dict(sorted(entries.items())) for kind, entries in meta.items() if entries}
+    if meta:
+        diff['metadata'] = meta
+    return diff
+
+
+class HistoryStore:
+    """Content-addressed snapshots plus one observation row per fetch, in a SQLite file."""
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        self._db = LocalConnections(path)
+        conn = self._db.connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS snapshots (hash TEXT PRIMARY KEY, payload TEXT NOT NULL) WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS observations ('
+                     'id INTEGER PRIMARY KEY, url TEXT NOT NULL, hash TEXT NOT NULL, observed_at REAL NOT NULL, '
+                     'fetch_ms REAL, cache_status TEXT)')
+        conn.execute('CREATE INDEX IF NOT EXISTS observations_url ON observations (url, id)')
+        # The current hash of every URL, so recording an unchanged page never reads the observation log
+        conn.execute('CREATE TABLE IF NOT EXISTS latest ('
+                     'url TEXT PRIMARY KEY, hash TEXT NOT NULL, changed_at REAL NOT NULL) WITHOUT ROWID')
+
+    def record(self, url, payload, cache_status, elapsed=None):
+        """Adds an observation of `url`; the snapshot itself is stored only if its hash is new.
+
+        Returns True if the page changed since it was last recorded. A storage failure is logged
+        and returns None, so history can never fail an extraction.
+        """
+        digest = snapshot_hash(payload)
+        now = time.time()
+        fetch_ms = round(elapsed * 1000, 1) if elapsed is not None else None
+        try:
+            conn = self._db.connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT hash FROM latest WHERE url = ?', (url,)).fetchone()
+                changed = row is None or row[0] != digest
+                if changed:
+                    conn.execute('INSERT OR IGNORE INTO snapshots (hash, payload) VALUES (?, ?)',
+                                 (digest, json.dumps(payload)))
+                    conn.execute('INSERT OR REPLACE INTO latest (url, hash, changed_at) VALUES (?, ?, ?)',
+                                 (url, digest, now))
+                conn.execute('INSERT INTO observations (url, hash, observed_at, fetch_ms, cache_status) '
+                             'VALUES (?, ?, ?, ?, ?)', (url, digest, now, fetch_ms, cache_status))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record history for {url}: {e}")
+            return None
+        if changed and row is not None:
+            logger.info(f"{url} changed since it was last checked")
+        return changed
+
+    def _snapshot(self, digest):
+        row = self._db.connect().execute('SELECT payload FROM snapshots WHERE hash = ?', (digest,)).fetchone()
+        return json.loads(row[0])
+
+    def changes(self, url=None, since=None, limit=50):
+        """Returns the most recent changes (newest first), optionally for one URL and/or after `since`.
+
+        Each change is one transition between consecutive distinct snapshots of a URL, with its diff.
+        """
+        inner = 'WHERE url = ?' if url else ''
+        params = [url] if url else []
+        outer = 'previous IS NOT NULL AND previous != hash'
+        if since is not None:
+            outer += ' AND observed_at > ?'
+            params.append(since)
+        # Window over each URL's observations; a row whose hash differs from the one before is a change
+        rows = self._db.connect().execute(
+            'SELECT url, observed_at, previous, hash, fetch_ms FROM ('
+            'SELECT id, url, observed_at, hash, fetch_ms, LAG(hash) OVER (PARTITION BY url ORDER BY id) AS previous '
+            f'FROM observations {inner}) WHERE {outer} ORDER BY id DESC LIMIT ?',
+            params + [limit]).fetchall()
+
+        changes = []
+        for changed_url, observed_at, previous, digest, fetch_ms in rows:
+            changes.append({
+                'url': changed_url,
+                'changed_at': observed_at,
+                'from': previous,
+                'to': digest,
+                'fetch_ms': fetch_ms,
+                'diff': diff_snapshots(self._snapshot(previous), self._snapshot(digest)),
+            })
+        return changes
+
+    def summary(self, url):
+        """The URL's current snapshot hash and how often it has been checked, or None if never."""
+        conn = self._db.connect()
+        latest = conn.execute('SELECT hash, changed_at FROM latest WHERE url = ?', (url,)).fetchone()
+        if latest is None:
+            return None
+        checks, first_seen, last_seen, avg_ms = conn.execute(
+            'SELECT COUNT(*), MIN(observed_at), MAX(observed_at), AVG(fetch_ms) FROM observations WHERE url = ?',
+            (url,)).fetchone()
+        return {
+            'url': url,
+            'hash': latest[0],
+            'changed_at': latest[1],
+            'checks': checks,
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+            'avg_fetch_ms': round(avg_ms, 1) if avg_ms is not None else None,
+        }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """Returns the HistoryStore, or None when HISTORY_ENABLED is off."""
+    global _history
+    if not HISTORY_ENABLED:
+        return None
+    with _history_lock:
+        if _history is None:
+            _history = HistoryStore()
+            logger.info(f"Recording extraction history in {_history.path}")
+        return _history
@@ -0,0 +1,326 @@
+"""Background jobs: batches and sitemap audits that run off the request threads and survive restarts.
+
+Jobs and their per-URL results live in a SQLite file shared by every worker process. Each worker
+runs JOBS_CONCURRENCY runner threads that claim queued jobs atomically and feed them through the
+batch scheduler. A running job whose runner stops heartbeating (its worker died or was restarted)
+is claimed again and resumes with the URLs that have no result yet.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+
+from audit import AUDIT_MAX_URLS, AuditSummary, Sitemap, iter_sitemap_urls
+from batch import iter_batch
+from extractor import describe_error
+from projection import Fields
+from storage import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', os.path.join(tempfile.gettempdir(), 'metaverifier-jobs.sqlite3'))
+JOBS_CONCURRENCY = int(os.environ.get('JOBS_CONCURRENCY', 2))  # Jobs run at once per worker process
+JOBS_MAX_URLS = int(os.environ.get('JOBS_MAX_URLS', 100000))
+# A running job with no progress for this long is assumed orphaned and taken over by another runner
+JOBS_STALE_AFTER = float(os.environ.get('JOBS_STALE_AFTER', 120))
+JOBS_RETENTION = float(os.environ.get('JOBS_RETENTION', 7 * 24 * 3600))  # Finished jobs are deleted after this
+JOBS_POLL_INTERVAL = 2.0  # How often idle runners look for jobs submitted through other workers
+_PAGE_SIZE = 500
+
+
+class JobStore:
+    """Jobs and per-URL results in a SQLite file; safe to use from every thread and process."""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._db = LocalConnections(path, timeout=10, row_factory=sqlite3.Row)
+        conn = self._db.connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                     'id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, '
+                     'collected INTEGER NOT NULL, total INTEGER NOT NULL DEFAULT 0, '
+                     'completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, '
+                     'summary TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, '
+                     'heartbeat REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS job_items ('
+                     'job_id TEXT NOT NULL, idx INTEGER NOT NULL, url TEXT NOT NULL, result TEXT, seq INTEGER, '
+                     'PRIMARY KEY (job_id, idx)) WITHOUT ROWID')
+        # seq numbers results in completion order, giving readers a cursor that never skips a late finisher
+        conn.execute('CREATE INDEX IF NOT EXISTS job_items_seq ON job_items (job_id, seq)')
+
+    def create(self, kind, params, urls=None):
+        """Queues a new job and returns its id. `urls` is given for batches; audits collect theirs later."""
+        job_id = uuid.uuid4().hex
+        conn = self._db.connect()
+        with conn:
+            conn.execute('BEGIN')
+            conn.execute('INSERT INTO jobs (id, kind, params, status, collected, total, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (job_id, kind, json.dumps(params), 'queued', int(urls is not None), len(urls or ()), time.time()))
+            if urls:
+                conn.executemany('INSERT INTO job_items (job_id, idx, url) VALUES (?, ?, ?)',
+                                 ((job_id, index, url) for index, url in enumerate(urls)))
+        return job_id
+
+    def get(self, job_id):
+        row = self._db.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim(self):
+        """Atomically takes the oldest queued (or orphaned) job and marks it running; None if there is none."""
+        conn = self._db.connect()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # Take the write lock first so no other runner can claim the same row
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) "
+                               "ORDER BY created_at LIMIT 1", (now - JOBS_STALE_AFTER,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), heartbeat = ? "
+                         "WHERE id = ?", (now, now, row['id']))
+        if row['status'] == 'running':
+            logger.warning(f"Resuming orphaned job {row['id']} ({row['completed']}/{row['total']} done)")
+        return dict(row)
+
+    def add_items(self, job_id, urls):
+        """Stores an audit's URLs as the sitemap is read; re-collecting after a restart is idempotent."""
+        conn = self._db.connect()
+        total = 0
+        batch = []
+        for url in urls:
+            batch.append((job_id, total, url))
+            total += 1
+            if len(batch) >= _PAGE_SIZE:
+                self._insert_items(conn, job_id, batch, total)
+                batch = []
+        self._insert_items(conn, job_id, batch, total)
+        return total
+
+    @staticmethod
+    def _insert_items(conn, job_id, batch, total):
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany('INSERT OR IGNORE INTO job_items (job_id, idx, url) VALUES (?, ?, ?)', batch)
+            conn.execute('UPDATE jobs SET total = ?, heartbeat = ? WHERE id = ?', (total, time.time(), job_id))
+
+    def mark_collected(self, job_id, error=None):
+        self._db.connect().execute('UPDATE jobs SET collected = 1, error = ? WHERE id = ?', (error, job_id))
+
+    def iter_pending(self, job_id):
+        """Yields (idx, url) for items without a result, a page at a time so writes can interleave."""
+        after = -1
+        while True:
+            rows = self._db.connect().execute('SELECT idx, url FROM job_items WHERE job_id = ? AND idx > ? '
+                                           'AND result IS NULL ORDER BY idx LIMIT ?',
+                                           (job_id, after, _PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            for idx, url in rows:
+                yield idx, url
+            after = rows[-1][0]
+
+    def record(self, job_id, idx, result):
+        """Stores one URL's result and bumps the job's progress counters (which doubles as a heartbeat)."""
+        conn = self._db.connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = conn.execute('UPDATE job_items SET result = ?, seq = (SELECT completed + 1 FROM jobs WHERE id = ?) '
+                                  'WHERE job_id = ? AND idx = ? AND result IS NULL',
+                                  (json.dumps(result), job_id, job_id, idx)).rowcount
+            if stored:
+                conn.execute('UPDATE jobs SET completed = completed + 1, failed = failed + ?, heartbeat = ? '
+                             'WHERE id = ?', (int('error' in result), time.time(), job_id))
+
+    def finish(self, job_id, status, summary=None, error=None):
+        self._db.connect().execute('UPDATE jobs SET status = ?, summary = ?, error = COALESCE(?, error), '
+                                'finished_at = ? WHERE id = ?',
+                                (status, json.dumps(summary) if summary is not None else None, error, time.time(), job_id))
+
+    def iter_results(self, job_id, after=0, limit=None):
+        """Yields (seq, idx, result) for items finished after sequence number `after`, in completion order."""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page = _PAGE_SIZE if remaining is None else min(_PAGE_SIZE, remaining)
+            rows = self._db.connect().execute('SELECT seq, idx, result FROM job_items WHERE job_id = ? AND seq > ? '
+                                           'ORDER BY seq LIMIT ?', (job_id, after, page)).fetchall()
+            for seq, idx, result in rows:
+                yield seq, idx, json.loads(result)
+            if len(rows) < page:
+                return
+            after = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def purge(self, older_than=JOBS_RETENTION):
+        """Deletes finished jobs (and their results) that ended more than `older_than` seconds ago."""
+        conn = self._db.connect()
+        cutoff = time.time() - older_than
+        with conn:
+            conn.execute('BEGIN')
+            conn.execute("DELETE FROM job_items WHERE job_id IN (SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+                         "AND finished_at < ?)", (cutoff,))
+            deleted = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                                   (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Purged {deleted} finished jobs")
+
+
+def describe_job(job):
+    """The public view of a job row, as returned by the API."""
+    summary = json.loads(job['summary']) if job['summary'] else None
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'total': job['total'] if job['collected'] else None,  # Unknown while an audit is still reading its sitemap
+        'completed': job['completed'],
+        'failed': job['failed'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'error': job['error'],
+        'summary': summary,
+    }
+
+
+class JobRunner:
+    """Runner threads for this worker process; they pick up jobs submitted by any worker."""
+
+    def __init__(self, store, concurrency=JOBS_CONCURRENCY):
+        self.store = store
+        self.concurrency = concurrency
+        self._wakeup = threading.Event()
+        self._last_purge = 0.0
+
+    def start(self):
+        for n in range(self.concurrency):
+            threading.Thread(target=self._loop, name=f'job-runner-{n}', daemon=True).start()
+        logger.info(f"Started {self.concurrency} job runners on {self.store.path}")
+
+    def notify(self):
+        """Wakes an idle runner right away instead of at its next poll."""
+        self._wakeup.set()
+
+    def _loop(self):
+        while True:
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._maybe_purge()
+                self._wakeup.wait(JOBS_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._last_purge > 3600:
+            self._last_purge = time.monotonic()
+            try:
+                self.store.purge()
+            except sqlite3.Error as e:
+                logger.error(f"Could not purge old jobs: {e}")
+
+    def _run(self, job):
+        job_id = job['id']
+        params = json.loads(job['params'])
+        logger.info(f"Running {job['kind']} job {job_id}")
+        try:
+            if not job['collected']:
+                error = self._collect(job_id, params)
+                if error is not None and not self.store.get(job_id)['total']:
+                    self.store.finish(job_id, 'failed', error=error)
+                    return
+
+            positions = {}  # scheduler index -> item idx, for items currently in flight
+
+            def pending():
+                for position, (idx, url) in enumerate(self.store.iter_pending(job_id)):
+                    positions[position] = idx
+                    yield url
+
+            # Only batch jobs carry a projection; an audit's summary needs whole results
+            fields = Fields.parse(params.get('fields'))
+            for position, result in iter_batch(pending(), fresh=params.get('fresh', False), fields=fields):
+                self.store.record(job_id, positions.pop(position), result)
+
+            summary = self._summarize(job_id, params) if job['kind'] == 'audit' else None
+            self.store.finish(job_id, 'done', summary=summary)
+            finished = self.store.get(job_id)
+            logger.info(f"Finished job {job_id}: {finished['completed']} URLs ({finished['failed']} failed)")
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            self.store.finish(job_id, 'failed', error=f'Job failed: {e}')
+
+    def _collect(self, job_id, params):
+        """Reads an audit's sitemap into job_items; returns an error message if reading it failed."""
+        sitemap_url = params['sitemap']
+        try:
+            sitemap = Sitemap(sitemap_url)
+        except Exception as e:
+            error, _ = describe_error(e, sitemap_url)
+            return error
+        error = None
+        try:
+            self.store.add_items(job_id, iter_sitemap_urls(sitemap, params.get('limit', AUDIT_MAX_URLS)))
+        except ElementTree.ParseError as e:
+            logger.error(f"Could not parse sitemap {sitemap_url}: {e}")
+            error = f'Could not parse sitemap: {e}'  # Keep the URLs read so far, as /audit does
+        self.store.mark_collected(job_id, error)
+        return error
+
+    def _summarize(self, job_id, params):
+        summary = AuditSummary(params['sitemap'])
+        for _, _, result in self.store.iter_results(job_id):
+            summary.add(result)
+        summary.sitemap_error = self.store.get(job_id)['error']
+        return summary.to_dict()
+
+
+_store = None
+_runner = None
+_runner_pid = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_store():
+    """Returns this process's JobStore, creating the database on first use."""
+    global _store
+    with _jobs_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+def start_job_runner():
+    """Starts this worker's runner threads once (again after a fork); returns the runner."""
+    global _runner, _runner_pid
+    store = get_job_store()
+    with _jobs_lock:
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = JobRunner(store)
+            _runner_pid = os.getpid()
+            _runner.start()
+        return _runner
+
+
+def ensure_job_runner():
+    """start_job_runner(), after a lock-free check that it has not run in this process: cheap enough for every request."""
+    if _runner_pid != os.getpid():
+        start_job_runner()
+
+
+def submit_job(kind, params, urls=None):
+    """Queues a 'batch' (with `urls`) or 'audit' (with params['sitemap']) job and returns its description."""
+    store = get_job_store()
+    job_id = store.create(kind, params, urls)
+    start_job_runner().notify()
+    logger.info(f"Queued {kind} job {job_id}" + (f" with {len(urls)} URLs" if urls else ''))
+    return describe_job(store.get(job_id))
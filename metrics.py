@@ -0,0 +1,384 @@
+"""Prometheus metrics, aggregated across every worker process of one server.
+
+Each worker keeps its counters, gauges and histograms in memory and a background thread writes
+them to its own file in METRICS_DIR about once a second. GET /metrics reads the other workers'
+files, adds its own live values and renders the sum in the Prometheus text format, so a scrape
+sees the whole server whichever worker answers it. Files of exited workers still count towards
+counters and histograms (so totals never go backwards) but not towards gauges.
+
+By default METRICS_DIR is a directory per gunicorn master (named after its pid), so a restart
+starts from zero. If you set it yourself, empty it whenever the server restarts.
+"""
+import contextvars
+import copy
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+# Upper bounds in seconds; phases range from sub-millisecond parses to multi-second downloads
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+_lock = threading.Lock()  # Guards every metric's values
+_metrics = {}
+_state = {'pid': None, 'path': None, 'dirty': False}
+
+
+def metrics_dir():
+    """The directory shared by this server's workers (profiling.py keeps its samples there too)."""
+    # Evaluated in the worker: its parent is the gunicorn master, shared by all its siblings
+    return METRICS_DIR or os.path.join(tempfile.gettempdir(), f'metaverifier-metrics-{os.getppid()}')
+
+
+def _changed():
+    """Marks this process's values as changed, starting its flush thread on first use. Call with _lock held."""
+    _state['dirty'] = True
+    if _state['pid'] != os.getpid():
+        _state['pid'] = os.getpid()
+        _state['path'] = os.path.join(metrics_dir(), f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {_state['path']}: {e}")
+
+
+def flush():
+    """Writes this process's values to its file if they changed since the last write."""
+    with _lock:
+        if not _state['dirty'] or _state['pid'] != os.getpid():
+            return
+        path = _state['path']
+        snapshot = {'pid': os.getpid(), 'metrics': _snapshot()}
+        _state['dirty'] = False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)  # Readers never see a half-written file
+
+
+def _snapshot():
+    return {name: [[list(labels), value] for labels, value in metric.values.items()] for name, metric in _metrics.items()}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # Label values (a tuple) -> value
+        _metrics[name] = self
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+            _changed()
+
+
+class Gauge(_Metric):
+    """A gauge summed over the live workers, such as a count of requests in flight."""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+            _changed()
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """Counts the block as in progress while it runs."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Stored as [per-bucket counts (the last one is +Inf), sum, count]; made cumulative when rendered
+        with _lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+            _changed()
+
+    @staticmethod
+    def merge(total, value):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but belongs to someone else
+    return True
+
+
+def collect():
+    """Returns {metric name: {label values: value}} summed over every worker's file and this process."""
+    with _lock:
+        own = {name: copy.deepcopy(metric.values) for name, metric in _metrics.items()}
+        own_path = _state['path'] if _state['pid'] == os.getpid() else None
+    totals = {name: {} for name in _metrics}
+    sources = [own]
+    directory = metrics_dir()
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+    for file_name in names:
+        path = os.path.join(directory, file_name)
+        if path == own_path:
+            continue  # Our live values are fresher than what we last wrote
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # Removed or replaced while we listed the directory
+        alive = _pid_alive(data['pid'])
+        sources.append({name: {tuple(labels): value for labels, value in series}
+                        for name, series in data['metrics'].items()
+                        if name in _metrics and (alive or _metrics[name].kind != 'gauge')})
+    for source in sources:
+        for name, series in source.items():
+            metric, merged = _metrics[name], totals[name]
+            for labels, value in series.items():
+                merged[labels] = metric.merge(merged[labels], value) if labels in merged else value
+    return totals
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """The aggregated metrics in the Prometheus text exposition format (version 0.0.4)."""
+    totals = collect()
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(totals[name].items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(metric.labels, labels)} {_format_value(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = _format_labels(metric.labels, labels, [('le', _format_value(float(bound)))])
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(metric.labels, labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(metric.labels, labels)} {count}')
+        if name == 'metaverifier_cache_results_total':
+            lines.extend(_cache_ratio_lines(totals[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _cache_ratio_lines(results):
+    # Derived at scrape time from the aggregated counters; defined like /cache/stats' hit_ratio
+    counts = {labels[0]: value for labels, value in results.items()}
+    served = counts.get('hit', 0) + counts.get('revalidated', 0)
+    lookups = served + counts.get('miss', 0)
+    return [
+        '# HELP metaverifier_cache_hit_ratio Share of cache lookups (hit, revalidated or miss) answered from the cache',
+        '# TYPE metaverifier_cache_hit_ratio gauge',
+        f'metaverifier_cache_hit_ratio {_format_value(served / lookups if lookups else 0.0)}',
+    ]
+
+
+# --- The application's metrics ---
+
+HTTP_REQUESTS = Counter('metaverifier_http_requests_total', 'Requests served, by endpoint and status code',
+                        ('endpoint', 'status'))
+HTTP_IN_FLIGHT = Gauge('metaverifier_http_requests_in_flight', 'Requests being served right now, by endpoint',
+                       ('endpoint',))
+FETCHES_IN_FLIGHT = Gauge('metaverifier_fetches_in_flight', 'Page fetches in progress (single, batch, audit and job)')
+EXTRACTION_SECONDS = Histogram('metaverifier_extraction_seconds', 'Wall time of extractions that fetched the page')
+PHASE_SECONDS = Histogram('metaverifier_extraction_phase_seconds',
+                          'Time spent in each phase of an extraction (dns, connect, tls, ttfb, download, decode, '
+                          'parse, serialize); summed over redirects and retries', ('phase',))
+BYTES_FETCHED = Counter('metaverifier_bytes_fetched_total', 'Body bytes received from origins, as sent (compressed)')
+BYTES_PARSED = Counter('metaverifier_bytes_parsed_total', 'Decoded body bytes handed to the head parser')
+CACHE_RESULTS = Counter('metaverifier_cache_results_total',
+                        'Extractions by result cache status (hit, revalidated, miss, bypass, coalesced)', ('status',))
+HEAD_CACHE_LOOKUPS = Counter('metaverifier_head_cache_lookups_total',
+                             'Lookups of parsed heads by the hash of their bytes, by outcome', ('outcome',))
+ERRORS = Counter('metaverifier_errors_total',
+                 'Failed fetches and rejected URLs, by category (timeout, dns, connection, http_error, invalid_url, '
+                 'request, unexpected)', ('category',))
+HEDGED_FETCHES = Counter('metaverifier_hedged_fetches_total',
+                         'Fetches raced by a second attempt, by which one finished first (first, hedge or none)',
+                         ('winner',))
+DNS_LOOKUPS = Counter('metaverifier_dns_lookups_total',
+                      'Host name lookups by outcome (hit, negative_hit, miss, coalesced)', ('outcome',))
+DNS_LOOKUP_SECONDS = Histogram('metaverifier_dns_lookup_seconds', 'Time the system resolver took for cache misses')
+
+class Timings:
+    """Phase durations (seconds) and HTTP hops of one extraction, or of every extraction in a request."""
+
+    def __init__(self):
+        self.phases = {}
+        self.hops = []  # {'url', 'status', 'ms'} per response received, redirects first
+        self.elapsed = 0.0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def merge(self, other):
+        for phase, seconds in other.phases.items():
+            self.add(phase, seconds)
+        self.hops.extend(other.hops)
+        self.elapsed += other.elapsed
+
+    def fetch_seconds(self):
+        """The extractions' time outside decoding and parsing: the network, and waiting on the origin."""
+        return max(self.elapsed - self.phases.get('decode', 0.0) - self.phases.get('parse', 0.0), 0.0)
+
+    def to_dict(self, total):
+        """The request's breakdown in milliseconds; `total` is the seconds the whole request took."""
+        ms = {phase: round(seconds * 1000, 2) for phase, seconds in self.phases.items()}
+        return {
+            'total_ms': round(total * 1000, 2),
+            'fetch_ms': round(self.fetch_seconds() * 1000, 2),
+            'decode_ms': ms.pop('decode', 0.0),
+            'parse_ms': ms.pop('parse', 0.0),
+            'serialize_ms': ms.pop('serialize', 0.0),
+            'phases': {f'{phase}_ms': value for phase, value in ms.items()},  # Network phases of `fetch`
+            'hops': self.hops,
+        }
+
+    def server_timing(self, total):
+        """The same breakdown as a Server-Timing header value, which browser dev tools display."""
+        durations = [('total', total), ('fetch', self.fetch_seconds())]
+        durations += [(phase, self.phases.get(phase, 0.0)) for phase in ('decode', 'parse', 'serialize')]
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in durations)
+
+
+_current = contextvars.ContextVar('metaverifier_timings', default=None)
+_request = contextvars.ContextVar('metaverifier_request_timings', default=None)
+
+
+@contextmanager
+def track_extraction():
+    """Times one fetch-and-parse; phases recorded inside it are observed once it ends.
+
+    Yields the extraction's Timings, which are also added to the enclosing request_timings(), if any.
+    """
+    timings = Timings()
+    token = _current.set(timings)
+    started = time.perf_counter()
+    try:
+        with FETCHES_IN_FLIGHT.track():
+            yield timings
+    finally:
+        _current.reset(token)
+        timings.elapsed = time.perf_counter() - started
+        EXTRACTION_SECONDS.observe(timings.elapsed)
+        for phase, seconds in timings.phases.items():
+            PHASE_SECONDS.observe(seconds, phase)
+        collector = _request.get()
+        if collector is not None:
+            collector.merge(timings)
+
+
+@contextmanager
+def request_timings():
+    """Collects the Timings of the extractions run inside the block (a cache hit has none)."""
+    timings = Timings()
+    token = _request.set(timings)
+    try:
+        yield timings
+    finally:
+        _request.reset(token)
+
+
+@contextmanager
+def separate_timings():
+    """Records the phases and hops of the block in a Timings of its own (yielded), not the enclosing extraction's.
+
+    For an attempt that may be thrown away; add_timings() adds the one that is kept.
+    """
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def add_timings(timings):
+    """Adds the phases and hops of `timings` to the extraction running in this context."""
+    current = _current.get()
+    if current is not None:
+        current.merge(timings)
+
+
+def record_phase(phase, seconds):
+    """Adds `seconds` to `phase` of the extraction running in this context; a no-op outside one."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def record_hop(url, status, seconds):
+    """Notes one response (a redirect or the final page) received by the extraction running in this context."""
+    timings = _current.get()
+    if timings is not None:
+        timings.hops.append({'url': url, 'status': status, 'ms': round(seconds * 1000, 2)})
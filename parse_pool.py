@@ -0,0 +1,102 @@
+"""Optional process pool that parses large heads off the fetching threads (and off their GIL).
+
+With PARSE_POOL_SIZE > 0, a head of at least PARSE_OFFLOAD_BYTES is copied once into a shared
+memory block and parsed by a pool process; only the small {'title', 'metadata', 'canonical'}
+result is pickled back. Smaller heads are parsed inline, where a round trip would cost more than
+it saves. The pool is created lazily in each worker process, after gunicorn forks.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+from head_parser import create_extractor
+
+logger = logging.getLogger(__name__)
+
+PARSE_POOL_SIZE = int(os.environ.get('PARSE_POOL_SIZE', 0))  # 0 parses everything inline
+PARSE_OFFLOAD_BYTES = int(os.environ.get('PARSE_OFFLOAD_BYTES', 256 * 1024))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def offload_threshold():
+    """The head size from which parsing is offloaded, or None when the pool is disabled."""
+    return PARSE_OFFLOAD_BYTES if PARSE_POOL_SIZE > 0 else None
+
+
+def get_parse_pool():
+    """Returns this worker process's parse pool, creating it on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Never fork a process that is running fetch threads; forkserver children start clean
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _pool = ProcessPoolExecutor(max_workers=PARSE_POOL_SIZE, mp_context=context)
+            _pool_pid = os.getpid()
+            logger.info(f"Started parse pool with {PARSE_POOL_SIZE} processes (offload from {PARSE_OFFLOAD_BYTES} bytes)")
+        return _pool
+
+
+def _parse_shared(name, size, encoding, backend, fields):
+    """Runs in a pool process: decodes and parses the head in shared memory block `name`, keeping `fields`.
+
+    Returns (payload, done), where done says whether the parser reached the end of the head.
+    """
+    shm = SharedMemory(name=name)  # Pool processes share the parent's resource tracker, which unlinks it
+    try:
+        with shm.buf[:size] as view:
+            text = str(view, encoding, 'replace')
+    finally:
+        shm.close()
+    parser = create_extractor(backend, fields)
+    parser.feed(text)
+    done = parser.done
+    parser.close()
+    return parser.result(), done
+
+
+def _submit(data, encoding, backend, fields):
+    shm = SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    try:
+        future = get_parse_pool().submit(_parse_shared, shm.name, len(data), encoding, backend, fields)
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+
+    def release(_):
+        shm.close()
+        shm.unlink()
+
+    future.add_done_callback(release)
+    return future
+
+
+def parse_offloaded(reader):
+    """Parses `reader`'s pending head in the pool, blocking only the calling thread. Returns reader.done."""
+    data, encoding, backend, fields = reader.offload_request
+    try:
+        outcome = _submit(data, encoding, backend, fields).result()
+    except Exception as e:
+        logger.warning(f"Parse pool failed ({e}); parsing inline")
+        outcome = None
+    return reader.complete_offload(outcome)
+
+
+async def parse_offloaded_async(reader):
+    """Async counterpart of parse_offloaded; the event loop keeps running while the pool parses."""
+    data, encoding, backend, fields = reader.offload_request
+    try:
+        outcome = await asyncio.wrap_future(_submit(data, encoding, backend, fields))
+    except Exception as e:
+        logger.warning(f"Parse pool failed ({e}); parsing inline")
+        outcome = None
+    return reader.complete_offload(outcome)
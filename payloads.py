@@ -0,0 +1,120 @@
+"""Encoding of API responses: JSON (with orjson when installed), the columnar batch layout, and gzip.
+
+Batch results used to be sent as one object per URL, repeating every key name, and each meta
+tag as {"attributes": {...}}, uncompressed; 10k URLs came to tens of MB. Now:
+
+- JSON is encoded by orjson when it is installed (several times faster than the json module),
+  compactly and in UTF-8, and with the json module otherwise.
+- `?format=columnar` sends a list of results as one array per field, and each meta tag as a
+  flat [attribute, value, attribute, value, ...] list whose attribute names are indexes into a
+  shared `attributes` table.
+- Responses of GZIP_MIN_BYTES or more are gzip compressed for clients that accept it; streamed
+  NDJSON is compressed line by line, so every line still goes out as soon as it is ready.
+"""
+import gzip
+import json
+import os
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:  # Optional; the json module is used without it
+    orjson = None
+
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', 1024))  # 0 disables compression
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+
+_COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/plain')
+
+
+def dumps(obj):
+    """`obj` as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider with orjson encoding responses; keys keep their order instead of being sorted."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+JSONProvider = OrjsonProvider if orjson is not None else DefaultJSONProvider
+
+
+def columnar(results):
+    """Encodes a list of result dicts as {'format', 'count', 'attributes', 'columns'}.
+
+    `columns` maps each key found in any result to a list with one value per result (null where
+    a result lacks it). In the `metadata` column each tag is a flat list alternating an index
+    into `attributes` and that attribute's value.
+    """
+    attributes = {}  # Attribute name -> index
+
+    def flat(tags):
+        if tags is None:
+            return None
+        return [[part for name, value in tag['attributes'].items()
+                 for part in (attributes.setdefault(name, len(attributes)), value)] for tag in tags]
+
+    names = dict.fromkeys(name for result in results for name in result)
+    columns = {}
+    for name in names:
+        values = [result.get(name) for result in results]
+        columns[name] = [flat(tags) for tags in values] if name == 'metadata' else values
+    return {'format': 'columnar', 'count': len(results), 'attributes': list(attributes), 'columns': columns}
+
+
+def accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header value allows gzip."""
+    return bool(parse_accept_header(accept_encoding)['gzip']) if accept_encoding else False
+
+
+def gzip_body(body, accept_encoding):
+    """Returns (body, compressed): `body` gzipped if it is large enough and the client accepts gzip."""
+    if not GZIP_MIN_BYTES or len(body) < GZIP_MIN_BYTES or not accepts_gzip(accept_encoding):
+        return body, False
+    return gzip.compress(body, GZIP_LEVEL, mtime=0), True
+
+
+def gzip_response(response, request):
+    """Compresses a Flask JSON, NDJSON or plain-text `response` in place when `request` accepts gzip."""
+    if (not GZIP_MIN_BYTES or response.mimetype not in _COMPRESSIBLE or 'Content-Encoding' in response.headers
+            or response.status_code in (204, 304) or request.method == 'HEAD'):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < GZIP_MIN_BYTES:
+            return response
+        response.set_data(gzip.compress(body, GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _gzip_stream(chunks):
+    """Gzips an iterable of chunks, flushing after each one so none is held back."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16+: gzip framing
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
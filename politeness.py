@@ -0,0 +1,187 @@
+"""Per-host politeness for batch fetches: token-bucket rate limits, Crawl-delay and cached robots.txt."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from extractor import USER_AGENT
+from fetcher import get_session
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+POLITE_RATE = float(os.environ.get('POLITE_RATE', 2.0))  # Sustained requests per second per host
+POLITE_BURST = int(os.environ.get('POLITE_BURST', 4))  # Requests a host may get back to back
+RESPECT_ROBOTS = os.environ.get('RESPECT_ROBOTS', '1') == '1'
+ROBOTS_TTL = float(os.environ.get('ROBOTS_TTL', 3600))
+ROBOTS_RETRY_INTERVAL = float(os.environ.get('ROBOTS_RETRY_INTERVAL', 60))  # How long an unreachable robots.txt is cached
+ROBOTS_MAX_BYTES = 512 * 1024  # RFC 9309 asks crawlers to parse at least 500 KiB
+MAX_CRAWL_DELAY = 30.0  # Cap absurd Crawl-delay values so one host cannot stall an audit indefinitely
+MAX_TRACKED_HOSTS = 10000
+ROBOTS_POLL_INTERVAL = 0.05  # How soon reserve() asks a host back while its robots.txt is being fetched
+ROBOTS_HOLD_MAX = 30.0  # Longest a host is held back that way, should its first request never fetch robots.txt
+
+# The product token from our User-Agent, matched against robots.txt user-agent lines
+ROBOTS_AGENT = 'MetaVerifierBot'
+
+
+class RobotsDisallowed(Exception):
+    """Raised when robots.txt forbids us from fetching a URL."""
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe on its own (HostPoliteness holds a lock around it)."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Takes a token if one is available and returns 0; otherwise returns seconds until one will be."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _HostBucket(TokenBucket):
+    """A host's token bucket, and whether that host's robots.txt (and so its Crawl-delay) is known yet."""
+
+    def __init__(self, rate, burst, robots_pending):
+        super().__init__(rate, burst)
+        self.robots_pending = robots_pending
+        self.robots_requested = None  # When a request was let through to fetch robots.txt
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class HostPoliteness:
+    """Rate limits and robots.txt rules per host, shared by every batch in the worker."""
+
+    def __init__(self, rate=POLITE_RATE, burst=POLITE_BURST, respect_robots=RESPECT_ROBOTS, robots_ttl=ROBOTS_TTL,
+                 robots_retry_interval=ROBOTS_RETRY_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.robots_retry_interval = robots_retry_interval
+        self._buckets = OrderedDict()  # host -> TokenBucket, least recently used first
+        self._robots = OrderedDict()  # origin -> (expires_at, RobotFileParser or None), least recently used first
+        self._lock = threading.Lock()
+        self._robots_flights = SingleFlight()
+
+    def reserve(self, host):
+        """Non-blocking: claims a request slot for `host` (host[:port]) and returns 0, or returns how long to wait.
+
+        The batch scheduler calls this before submitting, so a host that is out of tokens never
+        holds a worker thread while other hosts have work ready. Until the host's robots.txt is
+        known, only one request is let through: its check() fetches robots.txt, so any Crawl-delay
+        is applied before the host's burst is spent.
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            self._buckets.move_to_end(host)
+            requested = bucket.robots_requested
+            if bucket.robots_pending and requested is not None and time.monotonic() - requested < ROBOTS_HOLD_MAX:
+                return ROBOTS_POLL_INTERVAL
+            delay = bucket.reserve()
+            if bucket.robots_pending and not delay:
+                bucket.robots_requested = time.monotonic()
+            return delay
+
+    def _bucket(self, host):
+        # Call with the lock held
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            # No host (an unparsable URL): check() never runs, so do not wait for robots.txt
+            bucket = self._buckets[host] = _HostBucket(self.rate, self.burst, self.respect_robots and bool(host))
+            while len(self._buckets) > MAX_TRACKED_HOSTS:
+                self._buckets.popitem(last=False)
+        return bucket
+
+    def check(self, url):
+        """Raises RobotsDisallowed if robots.txt forbids `url`; fetches and caches robots.txt as needed."""
+        if not self.respect_robots:
+            return
+        rules = self._rules_for(_origin(url))
+        if rules is not None and rules.disallow_all:
+            raise RobotsDisallowed(f'robots.txt could not be fetched, so nothing is fetched from this site for now: {url}')
+        if rules is not None and not rules.can_fetch(ROBOTS_AGENT, url):
+            raise RobotsDisallowed(f'Blocked by robots.txt: {url}')
+
+    def _rules_for(self, origin):
+        with self._lock:
+            cached = self._robots.get(origin)
+            if cached is not None and cached[0] > time.time():
+                self._robots.move_to_end(origin)
+                self._robots_known(origin)
+                return cached[1]
+        rules, _ = self._robots_flights.do(origin, lambda: self._load_robots(origin))
+        with self._lock:
+            self._robots_known(origin)
+        return rules
+
+    def _robots_known(self, origin):
+        # Call with the lock held, once the origin's Crawl-delay (if any) is applied: reserve() stops holding its host back
+        bucket = self._buckets.get(urlsplit(origin).netloc.lower())
+        if bucket is not None:
+            bucket.robots_pending = False
+
+    def _load_robots(self, origin):
+        robots_url = f'{origin}/robots.txt'
+        rules = RobotFileParser(robots_url)
+        ttl = self.robots_ttl
+        try:
+            with get_session().get(robots_url, headers={'User-Agent': USER_AGENT}, timeout=(5, 10), stream=True) as response:
+                if response.status_code >= 500:
+                    raise requests.HTTPError(f'HTTP {response.status_code}')
+                if response.status_code >= 400:
+                    rules = None  # No robots.txt: everything is allowed
+                else:
+                    body = response.raw.read(ROBOTS_MAX_BYTES, decode_content=True)
+                    rules.parse(body.decode('utf-8', errors='replace').splitlines())
+        except Exception as e:
+            # RFC 9309: an unreachable robots.txt (server error or no answer) means everything is disallowed.
+            # Likely transient, so it is tried again after ROBOTS_RETRY_INTERVAL rather than ROBOTS_TTL
+            logger.warning(f"Could not fetch {robots_url}: {e}; disallowing all paths for {self.robots_retry_interval:g}s")
+            rules.disallow_all = True
+            ttl = self.robots_retry_interval
+
+        if rules is not None:
+            self._apply_crawl_delay(urlsplit(origin).netloc.lower(), rules.crawl_delay(ROBOTS_AGENT))
+        with self._lock:
+            self._robots[origin] = (time.time() + ttl, rules)
+            self._robots.move_to_end(origin)
+            while len(self._robots) > MAX_TRACKED_HOSTS:
+                self._robots.popitem(last=False)
+        return rules
+
+    def _apply_crawl_delay(self, host, delay):
+        """Slows the host's bucket down to one request per Crawl-delay seconds, with no bursts."""
+        if not delay:
+            return
+        delay = min(float(delay), MAX_CRAWL_DELAY)
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.rate = min(self.rate, 1 / delay)
+            bucket.capacity = 1
+            # robots.txt is loaded by a request about to fetch from the host: the next one waits a full delay
+            bucket.tokens = 0.0
+            bucket.updated = time.monotonic()
+        logger.info(f"Honouring Crawl-delay of {delay}s for {host}")
+
+
+politeness = HostPoliteness()
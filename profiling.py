@@ -0,0 +1,226 @@
+"""A sampling profiler for the extraction path, reported as collapsed stacks.
+
+A sampler thread reads the stacks of the threads it watches every interval (sys._current_frames),
+so the profiled code runs unmodified and pays nothing per call; the cost is the sampler's own.
+Samples are counted per stack in the collapsed format (`module:function;module:function count`)
+that flamegraph.pl, speedscope and inferno read, and summed per component by the innermost frame
+that belongs to one: network, decode (decompression), charset (detection and transcoding),
+parse, serialize, or other.
+
+Two modes:
+
+- `POST /extract?profile=1` samples the request's own thread every PROFILE_REQUEST_INTERVAL
+  and returns the profile with the result.
+- With PROFILE_SAMPLE_INTERVAL set, each worker samples every thread inside profiled() (the
+  /extract view, and extractions for batches, audits and jobs) for as long as it runs, and
+  writes its totals to the metrics directory. GET /profile sums all workers' files.
+
+Samples land wherever the thread holds the GIL when the sampler wakes, so intervals much below
+the interpreter's switch interval (5 ms by default) are not honoured for CPU-bound code.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from metrics import metrics_dir
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0))  # 0 disables continuous sampling
+PROFILE_REQUEST_INTERVAL = float(os.environ.get('PROFILE_REQUEST_INTERVAL', 0.002))
+PROFILE_FLUSH_INTERVAL = 10  # Seconds between a worker's profile file writes
+
+# Checked from the innermost frame outwards; the first frame whose module matches names the component
+_COMPONENTS = (
+    ('serialize', ('json', 'flask.json', 'orjson')),
+    ('charset', ('charset', 'charset_normalizer', 'codecs', 'encodings')),
+    ('parse', ('head_parser', 'parse_pool', 'html.parser', '_markupbase', 'lxml')),
+    ('decode', ('content_coding', 'gzip', 'zlib', 'brotli', 'zstandard')),
+    ('network', ('connections', 'socket', 'ssl', 'selectors', 'http.client', 'urllib3', 'requests', 'httpx',
+                 'httpcore', 'anyio')),
+)
+
+_labels = {}  # Code object -> 'module:qualname'
+_lock = threading.Lock()
+_active = {}  # Thread ident -> nesting depth of profiled() blocks
+_state = {'pid': None, 'profile': None, 'path': None}
+
+
+def _stack(frame):
+    """The frame's stack as a tuple of labels, outermost first."""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        label = _labels.get(code)
+        if label is None:
+            module = frame.f_globals.get('__name__', '?')
+            label = _labels[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+        labels.append(label)
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def _component(stack):
+    for label in reversed(stack):
+        module = label.partition(':')[0]
+        for component, prefixes in _COMPONENTS:
+            if any(module == prefix or module.startswith(prefix + '.') for prefix in prefixes):
+                return component
+    return 'other'
+
+
+class Profile:
+    """Sample counts per stack, taken every `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()  # Tuple of labels -> samples
+
+    def add(self, frame):
+        self.stacks[_stack(frame)] += 1
+
+    def merge(self, stacks):
+        self.stacks.update(stacks)
+
+    def components(self):
+        counts = Counter()
+        for stack, samples in self.stacks.items():
+            counts[_component(stack)] += samples
+        return dict(counts.most_common())
+
+    def collapsed(self):
+        """One `frame;frame;frame samples` line per stack, most sampled first."""
+        return [f"{';'.join(stack)} {samples}" for stack, samples in self.stacks.most_common()]
+
+    def to_dict(self):
+        return {
+            'interval_ms': round(self.interval * 1000, 3),
+            'samples': sum(self.stacks.values()),
+            'components': self.components(),
+            'stacks': self.collapsed(),
+        }
+
+
+@contextmanager
+def profile_thread(interval=PROFILE_REQUEST_INTERVAL):
+    """Samples the calling thread while the block runs; yields the Profile, complete once the block ends."""
+    profile = Profile(interval)
+    ident = threading.get_ident()
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(ident)
+            if frame is not None:
+                profile.add(frame)
+
+    sampler = threading.Thread(target=sample, name='profile-request', daemon=True)
+    sampler.start()
+    try:
+        yield profile
+    finally:
+        stop.set()
+        sampler.join()
+
+
+@contextmanager
+def profiled():
+    """Marks the calling thread as doing extraction work, for the continuous sampler (if enabled)."""
+    if not PROFILE_SAMPLE_INTERVAL:
+        yield
+        return
+    ident = threading.get_ident()
+    with _lock:
+        _ensure_sampler()
+        _active[ident] = _active.get(ident, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            if _active[ident] > 1:
+                _active[ident] -= 1
+            else:
+                del _active[ident]
+
+
+def _profiles_dir():
+    return os.path.join(metrics_dir(), 'profiles')
+
+
+def _ensure_sampler():
+    """Starts this process's sampler thread on first use (and again in a forked worker). Call with _lock held."""
+    if _state['pid'] == os.getpid():
+        return
+    _state['pid'] = os.getpid()
+    _state['profile'] = Profile(PROFILE_SAMPLE_INTERVAL)
+    _state['path'] = os.path.join(_profiles_dir(), f'{os.getpid()}.json')
+    _active.clear()  # Inherited from the parent, whose threads do not exist here
+    threading.Thread(target=_sample_loop, args=(_state['profile'],), name='profile-sampler', daemon=True).start()
+
+
+def _sample_loop(profile):
+    own, flushed = threading.get_ident(), time.monotonic()
+    while True:
+        time.sleep(PROFILE_SAMPLE_INTERVAL)
+        with _lock:
+            idents = [ident for ident in _active if ident != own]
+        if idents:
+            frames = sys._current_frames()
+            with _lock:
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.add(frame)
+        if time.monotonic() - flushed >= PROFILE_FLUSH_INTERVAL:
+            flushed = time.monotonic()
+            try:
+                _flush(profile)
+            except OSError as e:
+                logger.warning(f"Could not write the profile to {_state['path']}: {e}")
+
+
+def _flush(profile):
+    with _lock:
+        stacks = [[list(stack), samples] for stack, samples in profile.stacks.items()]
+    path = _state['path']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'pid': os.getpid(), 'interval': profile.interval, 'stacks': stacks}, f)
+    os.replace(tmp, path)
+
+
+def collect():
+    """The continuous samples of every worker of this server (exited ones included), as one Profile.
+
+    Returns None if no worker has sampled anything.
+    """
+    total, found = Profile(PROFILE_SAMPLE_INTERVAL), False
+    own_path = None
+    with _lock:
+        if _state['pid'] == os.getpid():
+            total.merge(_state['profile'].stacks)
+            own_path, found = _state['path'], True
+    directory = _profiles_dir()
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if path == own_path:
+            continue  # Our live counts are fresher than what we last wrote
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        total.merge({tuple(stack): samples for stack, samples in data['stacks']})
+        found = True
+    return total if found else None
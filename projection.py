@@ -0,0 +1,83 @@
+"""`fields` projections: which parts of a result a client wants.
+
+A projection is a comma-separated list (or a JSON list) of names:
+
+- `title`, `canonical`, `charset` (with `charset_source`) and `metadata` (every meta tag) select
+  those parts of the result;
+- anything else selects meta tags by their `property`, `name`, `http-equiv` or `itemprop` value,
+  case-insensitively, with a trailing `*` matching a prefix: `og:*`, `twitter:*`, `description`.
+
+The head parsers check each meta tag against the projection before building its attributes, so
+unwanted tags are never materialized, cached or serialized. A cached full result is projected
+with project().
+"""
+MAX_FIELDS = 100
+META_NAME_ATTRIBUTES = ('property', 'name', 'http-equiv', 'itemprop')
+
+# Projection name -> the result keys it selects
+_PARTS = {
+    'title': ('title',),
+    'canonical': ('canonical',),
+    'charset': ('charset', 'charset_source'),
+    'metadata': ('metadata',),
+}
+_PROJECTED_KEYS = frozenset(key for keys in _PARTS.values() for key in keys)  # Other keys (url, cache, error...) are kept
+
+
+class InvalidFieldsError(ValueError):
+    """Raised when a `fields` parameter cannot be parsed."""
+
+
+class Fields:
+    """A parsed projection. Use Fields.parse(); None stands for "everything"."""
+
+    def __init__(self, names):
+        self.names = tuple(sorted(set(names)))
+        self.key = ','.join(self.names)  # Canonical form, for cache keys
+        self.all_meta = 'metadata' in self.names or '*' in self.names
+        patterns = [name for name in self.names if name not in _PARTS]
+        self._exact = frozenset(name for name in patterns if not name.endswith('*'))
+        self._prefixes = tuple(name[:-1] for name in patterns if name.endswith('*'))
+        self.keys = frozenset(key for name in self.names for key in _PARTS.get(name, ('metadata',)))
+
+    @classmethod
+    def parse(cls, spec):
+        """Parses a comma-separated string or a list of names; returns None when `spec` is None or empty."""
+        if spec is None:
+            return None
+        if isinstance(spec, str):
+            spec = spec.split(',')
+        if not isinstance(spec, list) or not all(isinstance(name, str) for name in spec):
+            raise InvalidFieldsError('fields must be a comma-separated string or a list of strings')
+        names = [name.strip().lower() for name in spec if name.strip()]
+        if len(names) > MAX_FIELDS:
+            raise InvalidFieldsError(f'Too many fields: {len(names)} (maximum is {MAX_FIELDS})')
+        return cls(names) if names else None
+
+    def keeps_meta(self, values):
+        """True if a meta tag whose name attributes (see META_NAME_ATTRIBUTES) have `values` is selected."""
+        if self.all_meta:
+            return True
+        for value in values:
+            if value:
+                value = value.strip().lower()
+                if value in self._exact or value.startswith(self._prefixes):
+                    return True
+        return False
+
+    def project(self, payload):
+        """The selected parts of a result; keys that are not part of the extraction are passed through."""
+        projected = {key: value for key, value in payload.items() if key in self.keys or key not in _PROJECTED_KEYS}
+        if 'metadata' in projected and not self.all_meta:
+            projected['metadata'] = [
+                tag for tag in projected['metadata']
+                if self.keeps_meta(tag['attributes'].get(name) for name in META_NAME_ATTRIBUTES)
+            ]
+        return projected
+
+    def cache_key(self, key):
+        """The result cache key of this projection of the URL cached under `key`."""
+        return f'{key}#fields={self.key}'
+
+    def __repr__(self):
+        return f'Fields({self.key!r})'
@@ -0,0 +1,200 @@
+"""A process-wide DNS cache for outbound connections.
+
+Every new connection used to call getaddrinfo(), so an audit of one site resolved the same name
+thousands of times, and a slow resolver delayed every one of them. Here lookups are shared by the
+whole worker process:
+
+- Addresses come from getaddrinfo(), so /etc/hosts and the system's address ordering still apply.
+  getaddrinfo() does not report TTLs; with dnspython installed the record's TTL is looked up
+  alongside (clamped to DNS_CACHE_MIN_TTL..DNS_CACHE_TTL), otherwise entries live DNS_CACHE_TTL.
+- Failures are cached for DNS_NEGATIVE_TTL, so a dead domain fails fast for each of its URLs
+  instead of waiting on the resolver every time.
+- Concurrent lookups of a name wait on one query, and prefetch() resolves a batch's hosts on a
+  small thread pool while their URLs are still queued, so connect rarely waits for DNS.
+
+Hits, misses and lookup times are counted in metaverifier_dns_lookups_total and
+metaverifier_dns_lookup_seconds.
+"""
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # Optional; without it every answer is cached for DNS_CACHE_TTL
+    dns = None
+
+from metrics import DNS_LOOKUP_SECONDS, DNS_LOOKUPS
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DNS_CACHE_TTL = float(os.environ.get('DNS_CACHE_TTL', 300))  # 0 disables the cache
+DNS_CACHE_MIN_TTL = float(os.environ.get('DNS_CACHE_MIN_TTL', 5))
+DNS_NEGATIVE_TTL = float(os.environ.get('DNS_NEGATIVE_TTL', 10))
+DNS_CACHE_SIZE = int(os.environ.get('DNS_CACHE_SIZE', 4096))
+DNS_PREFETCH_WORKERS = int(os.environ.get('DNS_PREFETCH_WORKERS', 8))
+DNS_TTL_LOOKUP_TIMEOUT = 5  # Seconds dnspython may spend finding a record's TTL
+
+
+class _Entry:
+    def __init__(self, addresses, error, ttl):
+        self.addresses = addresses  # IP address strings, in getaddrinfo() order
+        self.error = error  # The gaierror's args for a cached failure
+        self.expires = time.monotonic() + ttl
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    """Bounded LRU of resolved host names, shared by every thread of the process."""
+
+    def __init__(self, max_entries=DNS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._pool = None
+        self._pool_pid = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def resolve(self, host):
+        """Returns the IP addresses of `host` as strings; raises socket.gaierror if it does not resolve."""
+        addresses = self.cached(host)
+        return addresses if addresses is not None else self.lookup(host)
+
+    def cached(self, host):
+        """Like resolve(), but returns None instead of blocking when `host` has to be looked up."""
+        if _is_ip(host):
+            return [host]
+        if not DNS_CACHE_TTL:
+            return None
+        entry = self._fresh(host.lower())
+        if entry is None:
+            return None
+        if entry.error is not None:
+            DNS_LOOKUPS.inc('negative_hit')
+            raise socket.gaierror(*entry.error)
+        DNS_LOOKUPS.inc('hit')
+        return entry.addresses
+
+    def lookup(self, host):
+        """Resolves `host` now, or waits for a lookup of it already in progress, and caches the outcome."""
+        if not DNS_CACHE_TTL:
+            return _getaddrinfo(host)
+        key = host.lower()
+        entry, shared = self._flights.do(key, lambda: self._lookup(key))
+        DNS_LOOKUPS.inc('coalesced' if shared else 'miss')
+        if entry.error is not None:
+            raise socket.gaierror(*entry.error)
+        return entry.addresses
+
+    def prefetch(self, netloc):
+        """Starts resolving the host of a URL's `netloc` in the background, unless it is cached or an IP address."""
+        try:
+            host = urlsplit(f'//{netloc}').hostname
+        except ValueError:
+            return
+        if not DNS_CACHE_TTL or not host or _is_ip(host) or self._fresh(host, count=False) is not None:
+            return
+        self._get_pool().submit(self._prefetch, host)
+
+    def _prefetch(self, host):
+        try:
+            self.resolve(host)
+        except socket.gaierror:
+            pass  # Cached; the fetch reports it
+
+    def _fresh(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                if entry.error is None:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+            return entry
+
+    def _lookup(self, host):
+        started = time.perf_counter()
+        ttl_query = self._get_pool().submit(_record_ttl, host) if dns is not None else None
+        try:
+            entry = _Entry(_getaddrinfo(host), None, DNS_CACHE_TTL)
+        except socket.gaierror as e:
+            logger.info(f"Could not resolve {host}: {e}")
+            entry = _Entry(None, e.args, DNS_NEGATIVE_TTL)
+            ttl_query = None
+        finally:
+            DNS_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        self._store(host, entry)
+        if ttl_query is not None:
+            # Shortens the entry to the record's TTL once dnspython answers; the connect does not wait for it
+            ttl_query.add_done_callback(lambda future: self._apply_ttl(entry, future))
+        return entry
+
+    def _apply_ttl(self, entry, future):
+        ttl = future.result()
+        if ttl is not None:
+            with self._lock:
+                entry.expires = min(entry.expires, time.monotonic() + max(ttl, DNS_CACHE_MIN_TTL))
+
+    def _store(self, host, entry):
+        with self._lock:
+            self._entries[host] = entry
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=DNS_PREFETCH_WORKERS, thread_name_prefix='dns')
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def stats(self):
+        return {'dns_entries': len(self._entries), 'dns_hits': self.hits, 'dns_negative_hits': self.negative_hits,
+                'dns_misses': self.misses}
+
+
+def _getaddrinfo(host):
+    infos = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+def _record_ttl(host):
+    """The TTL in seconds of `host`'s address records, or None if dnspython cannot find them."""
+    for rdtype in ('A', 'AAAA'):
+        try:
+            answer = dns.resolver.resolve(host, rdtype, raise_on_no_answer=False, lifetime=DNS_TTL_LOOKUP_TIMEOUT)
+        except dns.exception.DNSException:
+            return None  # Such as a name only in /etc/hosts
+        if answer.rrset is not None:
+            return answer.expiration - time.time()  # The lowest TTL along any CNAME chain
+    return None
+
+
+dns_cache = DNSCache()
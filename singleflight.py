@@ -0,0 +1,142 @@
+"""Request coalescing: concurrent extractions of the same URL share a single fetch-and-parse.
+
+SingleFlight deduplicates within a worker process. When the result cache is shared between
+workers (CACHE_BACKEND=sqlite), shared_lock() additionally serializes the leaders of different
+workers on a striped set of lock files, so only one of them goes to the origin and the others
+find its result in the cache.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to per-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'metaverifier-locks'))
+# URLs are hashed onto a fixed number of lock files so the directory never grows unbounded
+SINGLEFLIGHT_LOCK_STRIPES = int(os.environ.get('SINGLEFLIGHT_LOCK_STRIPES', 4096))
+# Give up waiting for another worker after this long and fetch anyway
+SINGLEFLIGHT_LOCK_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_LOCK_TIMEOUT', 20))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs `fn` once per key at a time; callers arriving meanwhile wait for and share its outcome."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        """Returns (result, shared). Exceptions raised by the leader are re-raised in every follower."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {'leaders': self.leaders, 'coalesced': self.followers}
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for the ASGI path (one event loop per process)."""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, fn):
+        """Awaits `fn()` once per key; returns (result, shared)."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.followers += 1
+            return await asyncio.shield(future), True
+
+        self.leaders += 1
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved so asyncio doesn't warn when nobody was waiting
+            raise
+        finally:
+            del self._calls[key]
+
+    def stats(self):
+        return {'leaders': self.leaders, 'coalesced': self.followers}
+
+
+@contextmanager
+def shared_lock(key, enabled=True, timeout=SINGLEFLIGHT_LOCK_TIMEOUT):
+    """Cross-process lock for `key`, held by at most one worker on the host at a time.
+
+    Yields True if the lock was acquired, False if it is disabled, unsupported or timed out;
+    callers proceed either way, so a stuck worker can only cost us the deduplication.
+    """
+    if not enabled or fcntl is None:
+        yield False
+        return
+
+    os.makedirs(SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % SINGLEFLIGHT_LOCK_STRIPES
+    fd = os.open(os.path.join(SINGLEFLIGHT_LOCK_DIR, f'{stripe}.lock'), os.O_CREAT | os.O_RDWR, 0o600)
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Timed out waiting for another worker to fetch {key}; fetching anyway")
+                    break
+                time.sleep(0.05)
+        yield acquired
+    finally:
+        if acquired:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
@@ -0,0 +1,467 @@
+const urlInput = document.getElementById('urlInput');
+const submitButton = document.getElementById('submitButton');
+const buttonText = document.getElementById('button-text');
+const spinner = document.getElementById('spinner');
+const resultsContainer = document.getElementById('results-container');
+const resultsStatus = document.getElementById('results-status');
+const resultsContent = document.getElementById('results-content');
+const initialMessage = document.getElementById('initial-message');
+const canonicalBox = document.getElementById('canonical-box');
+const canonicalLink = document.getElementById('canonical-link');
+const canonicalMessage = document.getElementById('canonical-message');
+const urlForm = document.getElementById('url-form');
+const batchForm = document.getElementById('batch-form');
+const batchInput = document.getElementById('batchInput');
+const batchButton = document.getElementById('batchButton');
+const batchButtonText = document.getElementById('batch-button-text');
+const batchSpinner = document.getElementById('batch-spinner');
+const batchContainer = document.getElementById('batch-container');
+const batchStatus = document.getElementById('batch-status');
+const batchList = document.getElementById('batch-list');
+const modeToggle = document.getElementById('mode-toggle');
+
+// --- Helper Functions ---
+function escapeHtml(unsafe) {
+    if (unsafe === null || unsafe === undefined) return '';
+    return unsafe
+         .toString()
+         .replace(/&/g, "&amp;")
+         .replace(/</g, "&lt;")
+         .replace(/>/g, "&gt;")
+         .replace(/"/g, "&quot;")
+         .replace(/'/g, "&#039;");
+}
+
+function createCopyButton(textToCopy) {
+    const button = document.createElement('button');
+    button.className = 'copy-button';
+    button.innerHTML = '<i class="far fa-copy"></i>';
+    button.title = 'Copy value';
+    button.onclick = () => {
+        navigator.clipboard.writeText(textToCopy).then(() => {
+            button.innerHTML = '<i class="fas fa-check" style="color: var(--success-color);"></i>';
+            setTimeout(() => { button.innerHTML = '<i class="far fa-copy"></i>'; }, 1500);
+        }).catch(err => {
+            console.error('Failed to copy: ', err);
+            alert('Failed to copy text.');
+        });
+    };
+    return button;
+}
+
+function createMetaItem(key, value, container, isImportant = false, isImage = false) {
+    const itemDiv = document.createElement('div');
+    itemDiv.className = 'meta-item';
+
+    const keySpan = document.createElement('span');
+    keySpan.className = 'meta-key';
+    keySpan.textContent = key + ':';
+    itemDiv.appendChild(keySpan);
+
+    const valueSpan = document.createElement('span');
+    valueSpan.className = 'meta-value';
+    if (value) {
+        valueSpan.textContent = value;
+        if (isImage) {
+            const img = document.createElement('img');
+            img.src = value;
+            img.alt = `${key} preview`;
+            img.onerror = () => { img.style.display = 'none'; }; // Hide if image fails to load
+            valueSpan.appendChild(img);
+        }
+        // If the key is a description or title (page, og, twitter), show character count
+        try {
+            const keyLower = (key || '').toString().toLowerCase();
+            if (keyLower.includes('description') || keyLower.includes('title')) {
+                const textVal = (typeof value === 'string') ? value : String(value || '');
+                const countDiv = document.createElement('div');
+                countDiv.className = 'char-count';
+                countDiv.textContent = `${textVal.length} characters`;
+                valueSpan.appendChild(countDiv);
+            }
+        } catch (e) {
+            // Defensive: if value is not convertible, skip counting
+        }
+    } else {
+        valueSpan.textContent = '(Not set or empty)';
+        valueSpan.classList.add('missing');
+    }
+    itemDiv.appendChild(valueSpan);
+
+    if (value && isImportant) {
+        itemDiv.appendChild(createCopyButton(value));
+    } else {
+         itemDiv.appendChild(document.createElement('span')); // Placeholder for grid alignment
+    }
+
+    container.appendChild(itemDiv);
+}
+
+function displayResults(data, url) {
+    resultsContent.innerHTML = ''; // Clear previous results
+    initialMessage.style.display = 'none';
+    resultsContainer.style.display = 'block';
+
+    const { title, metadata, canonical } = data;
+
+    // --- Status Message ---
+    const safeUrl = escapeHtml(url);
+    resultsStatus.className = 'success';
+    resultsStatus.innerHTML = `Successfully fetched metadata for: <a href="${safeUrl}" target="_blank" rel="noopener noreferrer">${safeUrl}</a>`;
+
+    // Display canonical URL or a friendly message when missing
+    if (canonical) {
+        const safeCanonical = escapeHtml(canonical);
+        canonicalLink.href = safeCanonical;
+        canonicalLink.textContent = safeCanonical;
+        canonicalMessage.textContent = '';
+        canonicalBox.style.display = 'block';
+    } else {
+        canonicalLink.href = '#';
+        canonicalLink.textContent = '';
+        canonicalMessage.textContent = 'No canonical link found in the page head.';
+        canonicalBox.style.display = 'block';
+    }
+
+    // --- Prepare Data Structures ---
+    const generalMeta = {};
+    const ogMeta = {};
+    const twitterMeta = {};
+    const otherMeta = []; // Keep raw structure for 'other'
+
+    // --- Extract Title ---
+    generalMeta['page_title'] = title || null; // Use a distinct key
+
+    // --- Process Meta Tags ---
+    const metaMap = new Map(); // Use map to easily find tags by name/property
+    metadata.forEach(tag => {
+        const attrs = tag.attributes;
+        if (attrs.name) metaMap.set(attrs.name.toLowerCase(), attrs.content);
+        if (attrs.property) metaMap.set(attrs.property.toLowerCase(), attrs.content);
+        if (attrs.charset) metaMap.set('charset', attrs.charset); // Handle charset separately
+        if (attrs.hasOwnProperty('http-equiv')) metaMap.set(`http-equiv-${attrs['http-equiv'].toLowerCase()}`, attrs.content);
+
+        // Categorize for display
+        if (attrs.property?.startsWith('og:')) {
+            ogMeta[attrs.property] = attrs.content;
+        } else if (attrs.name?.startsWith('twitter:')) {
+            twitterMeta[attrs.name] = attrs.content;
+        } else if (attrs.name && ['description', 'keywords', 'author', 'viewport'].includes(attrs.name.toLowerCase())) {
+            generalMeta[attrs.name.toLowerCase()] = attrs.content;
+        } else if (attrs.charset) {
+             generalMeta['charset'] = attrs.charset;
+        } else {
+            otherMeta.push(tag); // Keep the original structure for the raw list
+        }
+    });
+
+     // Ensure common general tags are present, even if null
+    ['description', 'keywords', 'author', 'viewport', 'charset'].forEach(key => {
+        if (!generalMeta.hasOwnProperty(key)) {
+            generalMeta[key] = null;
+        }
+    });
+     // Ensure common OG tags are present
+    ['og:title', 'og:description', 'og:image', 'og:url', 'og:type', 'og:site_name'].forEach(key => {
+         if (!ogMeta.hasOwnProperty(key)) {
+            ogMeta[key] = null;
+         }
+    });
+     // Ensure common Twitter tags are present
+    ['twitter:card', 'twitter:title', 'twitter:description', 'twitter:image', 'twitter:site'].forEach(key => {
+         if (!twitterMeta.hasOwnProperty(key)) {
+            twitterMeta[key] = null;
+         }
+    });
+
+
+    // --- Build HTML Sections ---
+
+    // 1. General Section
+    const generalSection = document.createElement('div');
+    generalSection.className = 'meta-section';
+    generalSection.innerHTML = '<h3><i class="fas fa-info-circle"></i> General</h3>';
+    const generalContent = document.createElement('div');
+    generalContent.className = 'meta-content';
+    createMetaItem('Page Title', generalMeta.page_title, generalContent, true);
+    createMetaItem('Description', generalMeta.description, generalContent, true);
+    createMetaItem('Keywords', generalMeta.keywords, generalContent, false); // Less important now
+    createMetaItem('Author', generalMeta.author, generalContent, false);
+    createMetaItem('Viewport', generalMeta.viewport, generalContent, false);
+    createMetaItem('Charset', generalMeta.charset, generalContent, false);
+    generalSection.appendChild(generalContent);
+    resultsContent.appendChild(generalSection);
+
+    // 2. Open Graph Section
+    const ogSection = document.createElement('div');
+    ogSection.className = 'meta-section';
+    ogSection.innerHTML = '<h3><i class="fab fa-facebook-square"></i> Open Graph (Facebook, LinkedIn, etc.)</h3>';
+    const ogContent = document.createElement('div');
+    ogContent.className = 'meta-content';
+    createMetaItem('og:title', ogMeta['og:title'], ogContent, true);
+    createMetaItem('og:description', ogMeta['og:description'], ogContent, true);
+    createMetaItem('og:image', ogMeta['og:image'], ogContent, true, true); // Mark as image
+    createMetaItem('og:url', ogMeta['og:url'], ogContent, true);
+    createMetaItem('og:type', ogMeta['og:type'], ogContent, false);
+    createMetaItem('og:site_name', ogMeta['og:site_name'], ogContent, false);
+    // Add any other found OG tags
+    for (const [key, value] of Object.entries(ogMeta)) {
+        if (!['og:title', 'og:description', 'og:image', 'og:url', 'og:type', 'og:site_name'].includes(key)) {
+             createMetaItem(key, value, ogContent, false, key.endsWith(':image'));
+        }
+    }
+    ogSection.appendChild(ogContent);
+    resultsContent.appendChild(ogSection);
+
+    // 3. Twitter Card Section
+    const twitterSection = document.createElement('div');
+    twitterSection.className = 'meta-section';
+    twitterSection.innerHTML = '<h3><i class="fab fa-twitter-square"></i> Twitter Card</h3>';
+    const twitterContent = document.createElement('div');
+    twitterContent.className = 'meta-content';
+    createMetaItem('twitter:card', twitterMeta['twitter:card'], twitterContent, true);
+    createMetaItem('twitter:title', twitterMeta['twitter:title'], twitterContent, true);
+    createMetaItem('twitter:description', twitterMeta['twitter:description'], twitterContent, true);
+    createMetaItem('twitter:image', twitterMeta['twitter:image'], twitterContent, true, true); // Mark as image
+    createMetaItem('twitter:site', twitterMeta['twitter:site'], twitterContent, false);
+     // Add any other found Twitter tags
+    for (const [key, value] of Object.entries(twitterMeta)) {
+        if (!['twitter:card', 'twitter:title', 'twitter:description', 'twitter:image', 'twitter:site'].includes(key)) {
+             createMetaItem(key, value, twitterContent, false, key.endsWith(':image'));
+        }
+    }
+    twitterSection.appendChild(twitterContent);
+    resultsContent.appendChild(twitterSection);
+
+    // 4. All Raw Meta Tags Section (Collapsible)
+    if (metadata.length > 0) {
+        const details = document.createElement('details');
+        const summary = document.createElement('summary');
+        summary.textContent = `All Raw Meta Tags (${metadata.length})`;
+        details.appendChild(summary);
+
+        const rawListDiv = document.createElement('div');
+        rawListDiv.className = 'raw-tag-list';
+        metadata.forEach(tag => {
+            const tagDiv = document.createElement('div');
+            tagDiv.className = 'raw-tag';
+            let attributesHTML = '';
+            for (const [key, value] of Object.entries(tag.attributes)) {
+                attributesHTML += `<span class="attr-name">${escapeHtml(key)}</span>: "${escapeHtml(value)}"<br>`;
+            }
+            tagDiv.innerHTML = attributesHTML || '<i>(Empty meta tag)</i>';
+            rawListDiv.appendChild(tagDiv);
+        });
+        details.appendChild(rawListDiv);
+        resultsContent.appendChild(details);
+    }
+
+    // 5. Timing Breakdown (Collapsible)
+    if (data.timings) {
+        resultsContent.appendChild(createTimingsPanel(data.timings, data.cache));
+    }
+}
+
+function createTimingsPanel(timings, cacheStatus) {
+    const details = document.createElement('details');
+    const summary = document.createElement('summary');
+    summary.textContent = `Timings (${timings.total_ms} ms, cache: ${cacheStatus})`;
+    details.appendChild(summary);
+
+    const listDiv = document.createElement('div');
+    listDiv.className = 'raw-tag-list timings-list';
+    const rows = [
+        ['Fetch (target site)', timings.fetch_ms],
+        ['Decode', timings.decode_ms],
+        ['Parse', timings.parse_ms],
+        ['Serialize', timings.serialize_ms],
+    ];
+    for (const [phase, ms] of Object.entries(timings.phases)) {
+        rows.push([`\u2003${phase.replace(/_ms$/, '')}`, ms]); // Network phases within fetch
+    }
+    let html = rows.map(([label, ms]) => `<span class="attr-name">${escapeHtml(label)}</span>: ${escapeHtml(ms)} ms`).join('<br>');
+    if (timings.hops.length > 0) {
+        html += '<div class="timings-hops">';
+        timings.hops.forEach((hop, i) => {
+            html += `<div class="raw-tag">${i + 1}. <span class="attr-name">${escapeHtml(hop.status)}</span> ${escapeHtml(hop.url)} (${escapeHtml(hop.ms)} ms)</div>`;
+        });
+        html += '</div>';
+    }
+    listDiv.innerHTML = html;
+    details.appendChild(listDiv);
+    return details;
+}
+
+// --- Event Listener ---
+submitButton.addEventListener('click', async () => {
+    const url = urlInput.value.trim();
+    if (!url) {
+        resultsContainer.style.display = 'block';
+        initialMessage.style.display = 'none';
+        resultsStatus.className = 'error';
+        resultsStatus.textContent = 'Please enter a URL.';
+        resultsContent.innerHTML = '';
+        return;
+    }
+
+    // --- Update UI for Loading State ---
+    resultsContainer.style.display = 'block';
+    initialMessage.style.display = 'none';
+    resultsStatus.className = 'loading';
+    resultsStatus.textContent = 'Fetching and extracting metadata...';
+    resultsContent.innerHTML = ''; // Clear previous results
+    // (loading bar removed)
+    submitButton.disabled = true;
+    spinner.style.display = 'inline-block';
+    buttonText.textContent = 'Verifying...';
+
+    try {
+        const response = await fetch('/extract?timings=1', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ url: url }),
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP error! Status: ${response.status}`);
+        }
+
+        displayResults(data, url); // Pass URL for display
+
+    } catch (error) {
+        console.error('Error:', error);
+        resultsStatus.className = 'error';
+        resultsStatus.textContent = `Error: ${error.message}`;
+        resultsContent.innerHTML = ''; // Clear content area on error
+      } finally {
+         // --- Restore UI from Loading State ---
+         submitButton.disabled = false;
+         spinner.style.display = 'none';
+         buttonText.textContent = 'Verify';
+    }
+});
+
+// --- Batch Mode ---
+function appendBatchResult(item) {
+    // Called once per streamed line, so results show up as soon as each URL finishes
+    const row = document.createElement('div');
+    row.className = 'batch-item' + (item.error ? ' failed' : '');
+
+    const icon = document.createElement('i');
+    icon.className = item.error ? 'fas fa-times-circle' : 'fas fa-check-circle';
+    icon.style.color = item.error ? 'var(--error-color)' : 'var(--success-color)';
+    row.appendChild(icon);
+
+    const urlSpan = document.createElement('span');
+    urlSpan.className = 'batch-url';
+    urlSpan.textContent = item.url;
+    row.appendChild(urlSpan);
+
+    const countSpan = document.createElement('span');
+    countSpan.className = 'char-count';
+    countSpan.textContent = item.error ? `Error ${item.status}` : `${item.metadata.length} meta tags`;
+    row.appendChild(countSpan);
+
+    const summary = document.createElement('div');
+    summary.className = 'batch-summary';
+    summary.textContent = item.error || (item.title ? item.title : '(No title)');
+    row.appendChild(summary);
+
+    if (!item.error) {
+        row.title = 'Show full results';
+        row.onclick = () => {
+            displayResults(item, item.url);
+            resultsContainer.scrollIntoView({ behavior: 'smooth' });
+        };
+    }
+    batchList.appendChild(row);
+}
+
+async function readNdjson(response, onItem) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onItem(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onItem(JSON.parse(buffer));
+}
+
+modeToggle.addEventListener('click', (event) => {
+    event.preventDefault();
+    const batchMode = batchForm.style.display === 'none';
+    batchForm.style.display = batchMode ? 'flex' : 'none';
+    urlForm.style.display = batchMode ? 'none' : 'flex';
+    batchContainer.style.display = batchMode && batchList.children.length ? 'block' : 'none';
+    modeToggle.textContent = batchMode ? 'Check a single URL' : 'Check several URLs at once';
+});
+
+batchButton.addEventListener('click', async () => {
+    const urls = batchInput.value.split('\n').map(u => u.trim()).filter(u => u);
+    batchContainer.style.display = 'block';
+    batchList.innerHTML = '';
+    if (!urls.length) {
+        batchStatus.className = 'error';
+        batchStatus.textContent = 'Please enter at least one URL.';
+        return;
+    }
+
+    batchStatus.className = 'loading';
+    batchStatus.textContent = `Checking ${urls.length} URLs...`;
+    batchButton.disabled = true;
+    batchSpinner.style.display = 'inline-block';
+    batchButtonText.textContent = 'Verifying...';
+
+    let finished = 0;
+    let failed = 0;
+    try {
+        const response = await fetch('/extract/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson',
+            },
+            body: JSON.stringify({ urls: urls }),
+        });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || `HTTP error! Status: ${response.status}`);
+        }
+        await readNdjson(response, (item) => {
+            finished += 1;
+            if (item.error) failed += 1;
+            batchStatus.textContent = `Checked ${finished} of ${urls.length} URLs...`;
+            appendBatchResult(item);
+        });
+        batchStatus.className = failed ? 'error' : 'success';
+        batchStatus.textContent = `Checked ${finished} URLs (${failed} failed). Click a row to see its full metadata.`;
+    } catch (error) {
+        console.error('Error:', error);
+        batchStatus.className = 'error';
+        batchStatus.textContent = `Error: ${error.message}`;
+    } finally {
+        batchButton.disabled = false;
+        batchSpinner.style.display = 'none';
+        batchButtonText.textContent = 'Verify All';
+    }
+});
+
+// Optional: Allow pressing Enter in the input field
+urlInput.addEventListener('keypress', (event) => {
+    if (event.key === 'Enter') {
+        event.preventDefault();
+        submitButton.click();
+    }
+});
@@ -0,0 +1,31 @@
+"""SQLite plumbing shared by the file-backed stores: the result cache, the job queue and the change history."""
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    """Connections to one SQLite file, one per thread (and per process), opened on first use.
+
+    sqlite3 connections cannot be shared across threads, nor used in a process forked after they
+    were opened. Every connection is in autocommit mode, with WAL so readers never block the writer.
+    """
+
+    def __init__(self, path, timeout=5, row_factory=None):
+        self.path = path
+        self.timeout = timeout
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def connect(self):
+        """Returns this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
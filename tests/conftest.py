@@ -0,0 +1,135 @@
+"""Shared fixtures: a scriptable origin server on 127.0.0.1, and throwaway paths for every store."""
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The modules read their paths from the environment at import time
+_tmp = tempfile.mkdtemp(prefix='metaverifier-tests-')
+for _name, _path in (('METRICS_DIR', 'metrics'), ('JOBS_DB_PATH', 'jobs.sqlite3'), ('HISTORY_DB_PATH', 'history.sqlite3'),
+                     ('CACHE_SQLITE_PATH', 'cache.sqlite3'), ('SINGLEFLIGHT_LOCK_DIR', 'locks')):
+    os.environ.setdefault(_name, os.path.join(_tmp, _path))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Route:
+    def __init__(self, status=200, body=b'', headers=None, delay=0.0, handler=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.delay = delay  # Seconds before the response headers are sent
+        self.handler = handler  # Called with the request handler instead, to write anything at all
+        self.hits = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        route = self.server.routes.get(self.path)
+        if route is None:
+            route = Route(404, b'not found', {'Content-Type': 'text/plain'})
+        route.hits += 1
+        self.server.requests.append((self.path, dict(self.headers)))
+        if route.handler is not None:
+            route.handler(self)
+            return
+        time.sleep(route.delay)
+        self.send_response(route.status)
+        headers = {'Content-Type': 'text/html; charset=utf-8', **route.headers}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if 'Transfer-Encoding' not in headers:
+            self.send_header('Content-Length', str(len(route.body)))
+        self.end_headers()
+        try:
+            self.wfile.write(route.body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The fetcher hung up after the head, as intended
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # The fetcher hangs up early on purpose
+            super().handle_error(request, client_address)
+
+
+class Origin:
+    """A local web site whose pages are set per test with route()."""
+
+    def __init__(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.routes = {}
+        self._server.requests = []
+        self._server.connections = 0
+        self.requests = self._server.requests  # (path, headers) of every request received
+
+    def route(self, path, *args, **kwargs):
+        route = self._server.routes[path] = Route(*args, **kwargs)
+        return route
+
+    @property
+    def connections(self):
+        """TCP connections accepted so far."""
+        return self._server.connections
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self._server.server_port}{path}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def origin():
+    server = Origin()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    """A fresh in-process result cache for the test."""
+    import cache
+    fresh = cache.MemoryCache()
+    monkeypatch.setattr(cache, '_cache', fresh)
+    return fresh
+
+
+def page(title='Test page', head_extra='', body='<p>Body</p>'):
+    return (f'<!doctype html><html><head><title>{title}</title>{head_extra}</head>'
+            f'<body>{body}</body></html>').encode('utf-8')
+
+
+def consent_gate(request):
+    """A Route handler that redirects to itself, setting a cookie, until the request carries that cookie."""
+    if 'consent=1' in request.headers.get('Cookie', ''):
+        body = page('Consented')
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html')
+    else:
+        body = b''
+        request.send_response(302)
+        request.send_header('Set-Cookie', 'consent=1; Path=/')
+        request.send_header('Location', request.path)
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import httpx
+
+from asgi import application
+from conftest import consent_gate, page
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url='http://testserver')
+
+
+def test_flask_routes_run_concurrently(origin):
+    origin.route('/slow', body=page('Slow'), delay=1)
+
+    async def scenario():
+        async with _client() as client:
+            batch = asyncio.ensure_future(client.post('/extract/batch?fresh=1', json={'urls': [origin.url('/slow')]}))
+            await asyncio.sleep(0.2)  # The batch now holds a Flask thread
+            started = time.monotonic()
+            stats = await client.get('/cache/stats')
+            waited = time.monotonic() - started
+            return (await batch), stats, waited
+
+    batch, stats, waited = asyncio.run(scenario())
+    assert stats.status_code == 200 and batch.status_code == 200
+    assert waited < 0.5
+
+
+def test_profiled_extract_is_served_by_flask(origin, memory_cache):
+    origin.route('/page', body=page('Profiled'))
+
+    async def scenario():
+        async with _client() as client:
+            return await client.post('/extract?profile=1&fresh=1', json={'url': origin.url('/page')})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Profiled'
+    assert response.json()['profile']['interval_ms'] > 0
+
+
+def test_cache_lookups_do_not_block_the_event_loop(origin, memory_cache, monkeypatch):
+    import asgi
+    origin.route('/a', body=page('A'))
+    origin.route('/b', body=page('B'))
+    lookup = asgi.cache_lookup
+
+    def slow_lookup(*args, **kwargs):
+        time.sleep(0.5)  # A busy SQLite cache
+        return lookup(*args, **kwargs)
+
+    monkeypatch.setattr(asgi, 'cache_lookup', slow_lookup)
+
+    async def scenario():
+        async with _client() as client:
+            started = time.monotonic()
+            responses = await asyncio.gather(*(client.post('/extract', json={'url': origin.url(path)})
+                                               for path in ('/a', '/b')))
+            return responses, time.monotonic() - started
+
+    responses, elapsed = asyncio.run(scenario())
+    assert [response.json()['title'] for response in responses] == ['A', 'B']
+    assert elapsed < 0.9
+
+
+def test_cookies_last_for_one_redirect_chain(origin, memory_cache):
+    origin.route('/gate', handler=consent_gate)
+
+    async def scenario():
+        async with _client() as client:
+            return [await client.post('/extract?fresh=1', json={'url': origin.url('/gate')}) for _ in range(2)]
+
+    assert [response.json()['title'] for response in asyncio.run(scenario())] == ['Consented', 'Consented']
+    assert ['Cookie' in headers for _, headers in origin.requests] == [False, True, False, True]
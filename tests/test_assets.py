@@ -0,0 +1,25 @@
+import gzip
+
+from app import app
+from assets import get_asset
+
+
+def test_index_links_versioned_assets_and_revalidates_with_a_304():
+    client = app.test_client()
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert f"/static/app.js?v={get_asset('app.js').digest}" in response.get_data(as_text=True)
+    again = client.get('/', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304 and not again.get_data()
+
+
+def test_assets_are_served_precompressed_and_immutable():
+    response = app.test_client().get('/static/app.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.get_data()) == get_asset('app.css').variants['identity'][0]
+
+
+def test_unknown_assets_are_not_found():
+    assert app.test_client().get('/static/app.py').status_code == 404
@@ -0,0 +1,48 @@
+import gzip
+from xml.etree import ElementTree
+
+from app import app
+from audit import Sitemap, iter_sitemap_urls
+from conftest import page
+from content_coding import PIECE_SIZE
+
+
+def _sitemap(urls):
+    entries = ''.join(f'<url><loc>{url}</loc></url>' for url in urls)
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+
+def test_gzipped_sitemap_is_decoded_in_bounded_pieces(origin, monkeypatch):
+    urls = [f'https://example.com/page/{n}' for n in range(5000)]
+    origin.route('/sitemap.xml.gz', body=gzip.compress(_sitemap(urls)), headers={'Content-Type': 'application/gzip'})
+    fed = []
+
+    class RecordingParser(ElementTree.XMLPullParser):
+        def feed(self, data):
+            fed.append(len(data))
+            super().feed(data)
+
+    monkeypatch.setattr(ElementTree, 'XMLPullParser', RecordingParser)
+    assert list(iter_sitemap_urls(Sitemap(origin.url('/sitemap.xml.gz')))) == urls
+    assert max(fed) <= PIECE_SIZE
+
+
+def test_audit_follows_a_sitemap_index_and_summarizes_the_pages(origin, memory_cache):
+    index = ('<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             f'<sitemap><loc>{origin.url("/pages.xml")}</loc></sitemap></sitemapindex>').encode()
+    origin.route('/index.xml', body=index, headers={'Content-Type': 'application/xml'})
+    origin.route('/pages.xml', body=_sitemap([origin.url(f'/{name}') for name in ('a', 'b', 'missing', 'c')]),
+                 headers={'Content-Type': 'application/xml'})
+    complete = ('<link rel="canonical" href="{}"><meta name="description" content="d">'
+                '<meta property="og:title" content="t"><meta property="og:description" content="d">'
+                '<meta property="og:image" content="i"><meta name="twitter:card" content="summary">')
+    origin.route('/a', body=page('Same', complete.format(origin.url('/a'))))
+    origin.route('/b', body=page('Same', complete.format(origin.url('/elsewhere'))))
+
+    response = app.test_client().post('/audit', json={'sitemap': origin.url('/index.xml'), 'limit': 3})
+    summary = response.get_json()
+    assert (summary['urls'], summary['ok'], summary['failed']) == (3, 2, 1)
+    assert summary['duplicate_titles'] == {'Same': 2}
+    assert summary['canonical_points_elsewhere'] == 1
+    assert summary['missing']['description'] == 0
+    assert '/c' not in [path for path, _ in origin.requests]  # Past the limit
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+
+from app import app
+from batch import iter_batch
+from conftest import page
+
+
+def test_batch_returns_results_in_input_order_with_per_url_errors(origin, memory_cache):
+    origin.route('/slow', body=page('Slow'), delay=0.3)
+    origin.route('/fast', body=page('Fast'))
+    origin.route('/gone', 404, b'gone')
+    urls = [origin.url('/slow'), origin.url('/fast'), origin.url('/gone'), 'http://localhost:abc/']
+    response = app.test_client().post('/extract/batch', json={'urls': urls})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result.get('title') for result in results[:2]] == ['Slow', 'Fast']
+    assert 'error 404' in results[2]['error']
+    assert results[3]['status'] == 400 and 'Invalid URL' in results[3]['error']
+
+
+def test_batch_rejects_too_many_urls(monkeypatch):
+    monkeypatch.setattr('app.BATCH_MAX_URLS', 2)
+    response = app.test_client().post('/extract/batch', json={'urls': ['https://example.com/'] * 3})
+    assert response.status_code == 400
+
+
+def test_batch_limits_concurrent_fetches_per_host(origin, memory_cache):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def handler(request):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        body = page()
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    for n in range(8):
+        origin.route(f'/{n}', handler=handler)
+    results = dict(iter_batch([origin.url(f'/{n}') for n in range(8)], fresh=True, per_host=2, polite=False))
+    assert sorted(results) == list(range(8))
+    assert all('error' not in result for result in results.values())
+    assert peak[0] == 2
+
+
+def test_streamed_batch_sends_one_line_per_url_as_it_finishes(origin, memory_cache):
+    origin.route('/slow', body=page('Slow'), delay=0.3)
+    origin.route('/fast', body=page('Fast'))
+    response = app.test_client().post('/extract/batch?stream=1', json={'urls': [origin.url('/slow'), origin.url('/fast')]})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data().splitlines()]
+    assert [(line['index'], line['title']) for line in lines] == [(1, 'Fast'), (0, 'Slow')]
+
+
+def test_ndjson_is_negotiated_from_the_accept_header(origin, memory_cache):
+    origin.route('/page', body=page())
+    response = app.test_client().post('/extract/batch', json={'urls': [origin.url('/page')]},
+                                      headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert json.loads(response.get_data())['index'] == 0
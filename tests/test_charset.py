@@ -0,0 +1,34 @@
+import codecs
+
+import pytest
+
+from app import app
+import charset
+from charset import prescan_meta_charset, sniff_encoding
+
+
+@pytest.mark.parametrize('prefix, header, expected', [
+    (codecs.BOM_UTF8 + b'<meta charset="latin-1">', 'shift_jis', ('utf-8-sig', 'bom')),
+    (b'<meta charset="shift_jis">', 'iso-8859-1', ('cp1252', 'header')),  # As browsers map latin-1
+    (b'<!-- <meta charset="koi8-r"> --><meta http-equiv="Content-Type" content="text/html; charset=cp1251">',
+     None, ('cp1251', 'meta')),
+    (b'<meta charset="utf-16">', None, ('utf-8', 'meta')),
+    (b'<meta charset="no-such-charset"><title>plain</title>', None, ('utf-8', 'default')),
+    ('<title>Café</title>'.encode('utf-8'), None, ('utf-8', 'detected')),
+])
+def test_encoding_is_picked_in_browser_order(prefix, header, expected):
+    assert sniff_encoding(prefix, header) == expected
+
+
+def test_prescan_only_looks_at_the_first_kilobyte():
+    assert prescan_meta_charset(b' ' * 1024 + b'<meta charset="koi8-r">') is None
+
+
+@pytest.mark.skipif(charset.charset_normalizer is None, reason='needs charset_normalizer')
+def test_undeclared_legacy_encoding_is_detected(origin, memory_cache):
+    text = 'Русская страница о метаданных, заголовок и описание для проверки кодировки'
+    origin.route('/cp1251', body=f'<html><head><title>{text}</title></head></html>'.encode('cp1251'),
+                 headers={'Content-Type': 'text/html'})
+    result = app.test_client().post('/extract', json={'url': origin.url('/cp1251')}).get_json()
+    assert result['title'] == text
+    assert (result['charset'], result['charset_source']) == ('cp1251', 'detected')
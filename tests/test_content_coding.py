@@ -0,0 +1,65 @@
+import gzip
+import tracemalloc
+import zlib
+
+import pytest
+from requests.exceptions import ContentDecodingError
+
+import content_coding
+from conftest import page
+from content_coding import PIECE_SIZE, BoundedDecoder
+from fetcher import fetch_head
+from head_parser import create_extractor
+
+DATA = b'<html><head><title>Compressed</title></head>' + b'x' * 200000
+
+
+def _deflate(data, wbits):
+    compressor = zlib.compressobj(wbits=wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+@pytest.mark.parametrize('coding, body', [
+    ('gzip', gzip.compress(DATA)),
+    ('gzip', gzip.compress(DATA[:1000]) + gzip.compress(DATA[1000:])),  # Two members
+    ('deflate', _deflate(DATA, zlib.MAX_WBITS)),
+    ('deflate', _deflate(DATA, -zlib.MAX_WBITS)),  # Raw deflate, as some servers send
+    ('identity', DATA),
+])
+def test_bodies_decode_in_bounded_pieces(coding, body):
+    decoder = BoundedDecoder(coding)
+    pieces = [piece for start in range(0, len(body), 4096) for piece in decoder.pieces(body[start:start + 4096])]
+    assert b''.join(pieces) == DATA
+    assert max(map(len, pieces)) <= max(PIECE_SIZE, 4096)
+    assert decoder.bytes_in == len(body)
+
+
+@pytest.mark.skipif(content_coding.brotli is None, reason='needs brotli with output limits')
+@pytest.mark.parametrize('chunk_size', [16, 1 << 20])
+def test_brotli_decodes_in_bounded_pieces(chunk_size):
+    body = content_coding.brotli.compress(DATA)
+    decoder = BoundedDecoder('br')
+    pieces = [piece for start in range(0, len(body), chunk_size) for piece in decoder.pieces(body[start:start + chunk_size])]
+    assert b''.join(pieces) == DATA
+    assert max(map(len, pieces)) <= 2 * PIECE_SIZE  # brotli rounds its output limit up to whole buffer blocks
+
+
+def test_unsupported_and_corrupt_bodies_raise_decoding_errors():
+    with pytest.raises(ContentDecodingError):
+        BoundedDecoder('gzip, br')
+    with pytest.raises(ContentDecodingError):
+        list(BoundedDecoder('gzip').pieces(b'\x1f\x8b not really gzip'))
+
+
+def test_a_compressed_page_is_decoded_only_up_to_the_end_of_its_head(origin):
+    bomb = gzip.compress(page('Bomb') + b'\0' * (64 * 1024 * 1024))
+    origin.route('/bomb', body=bomb, headers={'Content-Encoding': 'gzip'})
+    tracemalloc.start()
+    try:
+        _, reader = fetch_head(origin.url('/bomb'), {}, create_extractor(), head_cache=None)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert reader.result()['title'] == 'Bomb'
+    assert peak < 8 * 1024 * 1024
+    assert 'gzip' in origin.requests[-1][1]['Accept-Encoding']
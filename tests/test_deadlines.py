@@ -0,0 +1,143 @@
+import time
+
+import pytest
+import requests
+
+import deadlines
+import fetcher
+from conftest import page
+from deadlines import Deadline, HostLatency
+from fetcher import fetch_head
+from head_parser import create_extractor
+
+
+def _send(request, body, delay=0.0):
+    time.sleep(delay)
+    request.send_response(200)
+    request.send_header('Content-Type', 'text/html')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+
+def test_read_timeouts_adapt_to_a_hosts_recent_latency():
+    latency = HostLatency()
+    assert latency.read_timeout('fast.test') == deadlines.FETCH_READ_TIMEOUT  # Too few samples yet
+    for _ in range(deadlines.LATENCY_MIN_SAMPLES):
+        latency.record('fast.test', 0.1)
+        latency.record('slow.test', 2.0)
+    assert latency.read_timeout('fast.test') == deadlines.ADAPTIVE_TIMEOUT_MIN
+    assert latency.read_timeout('slow.test') == min(2.0 * deadlines.ADAPTIVE_TIMEOUT_FACTOR, deadlines.FETCH_READ_TIMEOUT)
+
+
+def test_a_trickling_body_is_cut_off_at_the_total_deadline(origin):
+    def trickle(request):
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html')
+        request.end_headers()
+        request.wfile.write(b'<html><head><title>Slow</title>')
+        for _ in range(50):
+            request.wfile.write(b'<meta name="x" content="y">')
+            request.wfile.flush()
+            time.sleep(0.1)
+
+    origin.route('/trickle', handler=trickle)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        fetch_head(origin.url('/trickle'), {}, create_extractor(), deadline=Deadline(total=0.5), head_cache=None)
+    assert time.monotonic() - started < 1.5
+
+
+def test_a_slow_fetch_is_hedged_and_the_faster_attempt_wins(origin, monkeypatch):
+    latency = HostLatency()
+    for _ in range(deadlines.LATENCY_MIN_SAMPLES):
+        latency.record('127.0.0.1', 0.01)
+    monkeypatch.setattr(deadlines, 'HEDGE_FETCHES', True)
+    monkeypatch.setattr(fetcher, 'host_latency', latency)
+    attempts = []
+
+    def first_slow(request):
+        attempts.append(time.monotonic())
+        _send(request, page('Hedged'), delay=2.0 if len(attempts) == 1 else 0.0)
+
+    route = origin.route('/page', handler=first_slow)
+    hedged, won = [], []
+    create = fetcher.create_extractor
+    monkeypatch.setattr(fetcher, 'create_extractor', lambda *args: hedged.append(time.monotonic()) or create(*args))
+    hedge_won = fetcher._hedge_won
+    monkeypatch.setattr(fetcher, '_hedge_won', lambda *args: won.append(args[:2]) or hedge_won(*args))
+    started = time.monotonic()
+    _, reader = fetch_head(origin.url('/page'), {}, create_extractor(), head_cache=None)
+    assert reader.result()['title'] == 'Hedged'
+    assert time.monotonic() - started < 1.0
+    assert route.hits == 2
+    assert hedged[0] - started >= deadlines.HEDGE_MIN_DELAY  # Hedged once the delay was up, not sooner
+    assert won == [(1, 2)]
+
+
+def test_retries_never_wait_past_the_deadline(origin):
+    unavailable = origin.route('/busy', 503, b'busy', {'Retry-After': '3'})
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError):
+        # Room for the first backoff (0.3 s), not the second (0.6 s)
+        fetch_head(origin.url('/busy'), {}, create_extractor(), deadline=Deadline(total=0.7), head_cache=None)
+    assert time.monotonic() - started < 0.7
+    assert unavailable.hits == 2
+
+
+def test_failed_connects_are_retried_within_the_deadline(monkeypatch):
+    attempts = []
+    send = requests.adapters.HTTPAdapter.send
+
+    def counting_send(self, *args, **kwargs):
+        attempts.append(time.monotonic())
+        return send(self, *args, **kwargs)
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, 'send', counting_send)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch_head('http://127.0.0.1:9/', {}, create_extractor(), deadline=Deadline(total=5), head_cache=None)
+    assert len(attempts) == fetcher.HTTP_RETRIES + 1
+    assert time.monotonic() - started < 5
+
+
+@pytest.mark.parametrize('stall', ['headers', 'body'])
+def test_the_losing_attempt_gives_its_thread_back(origin, monkeypatch, stall):
+    latency = HostLatency()
+    for _ in range(deadlines.LATENCY_MIN_SAMPLES):
+        latency.record('127.0.0.1', 0.01)
+    monkeypatch.setattr(deadlines, 'HEDGE_FETCHES', True)
+    monkeypatch.setattr(fetcher, 'host_latency', latency)
+    hits = []
+
+    def first_stalls(request):
+        hits.append(request)
+        if len(hits) > 1:
+            _send(request, page('Hedged'))
+        elif stall == 'headers':
+            time.sleep(3)
+        else:
+            request.send_response(200)
+            request.send_header('Content-Type', 'text/html')
+            request.end_headers()
+            request.wfile.write(b'<html><head>')
+            request.wfile.flush()
+            time.sleep(3)
+
+    origin.route('/page', handler=first_stalls)
+    finished = []
+    attempt = fetcher._hedge_attempt
+
+    def timed_attempt(*args):
+        try:
+            return attempt(*args)
+        finally:
+            finished.append(time.monotonic())
+
+    monkeypatch.setattr(fetcher, '_hedge_attempt', timed_attempt)
+    _, reader = fetch_head(origin.url('/page'), {}, create_extractor(), head_cache=None)
+    returned = time.monotonic()
+    assert reader.result()['title'] == 'Hedged'
+    while len(finished) < 2 and time.monotonic() - returned < 2:
+        time.sleep(0.01)
+    assert len(finished) == 2 and max(finished) - returned < 0.5
@@ -0,0 +1,177 @@
+import asyncio
+import gzip
+import time
+import tracemalloc
+
+import httpx
+import pytest
+import requests
+
+import deadlines
+import fetcher
+from app import app
+from conftest import consent_gate, page
+from deadlines import host_latency
+from extractor import describe_error
+from fetcher import HeadResultCache, fetch_head, fetch_head_async
+from head_parser import create_extractor
+
+
+def test_stalled_origin_is_reported_as_a_timeout(origin, monkeypatch, memory_cache):
+    monkeypatch.setattr(deadlines, 'FETCH_READ_TIMEOUT', 0.3)
+    origin.route('/stall', body=page(), delay=2)
+    response = app.test_client().post('/extract', json={'url': origin.url('/stall')})
+    assert response.status_code == 504
+    assert 'timed out' in response.get_json()['error']
+
+
+def test_read_timeout_is_not_retried_and_records_latency(origin, monkeypatch):
+    monkeypatch.setattr(deadlines, 'FETCH_READ_TIMEOUT', 0.3)
+    stall = origin.route('/stall', body=page(), delay=1)
+    samples = len(host_latency._hosts.get('127.0.0.1').samples) if '127.0.0.1' in host_latency._hosts else 0
+    try:
+        fetch_head(origin.url('/stall'), {}, create_extractor(), head_cache=None)
+    except requests.exceptions.Timeout as e:
+        assert describe_error(e, origin.url('/stall'))[1] == 504
+    else:
+        raise AssertionError('expected a timeout')
+    assert stall.hits == 1
+    assert len(host_latency._hosts['127.0.0.1'].samples) == samples + 1
+
+
+def _gzip_bomb_redirect(origin):
+    bomb = gzip.compress(b'\0' * (48 * 1024 * 1024))  # Under REDIRECT_BODY_MAX compressed, 48 MiB decoded
+    origin.route('/bomb', 301, bomb, {'Location': '/page', 'Content-Encoding': 'gzip'})
+    origin.route('/page', body=page('Landed'))
+
+
+def test_redirect_body_is_drained_without_decoding(origin):
+    _gzip_bomb_redirect(origin)
+    tracemalloc.start()
+    try:
+        _, reader = fetch_head(origin.url('/bomb'), {}, create_extractor(), head_cache=None)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert reader.result()['title'] == 'Landed'
+    assert peak < 8 * 1024 * 1024
+
+
+def test_async_redirect_body_is_drained_without_decoding(origin):
+    _gzip_bomb_redirect(origin)
+
+    async def fetch():
+        async with httpx.AsyncClient() as client:
+            return await fetch_head_async(client, origin.url('/bomb'), {}, create_extractor(), head_cache=None)
+
+    tracemalloc.start()
+    try:
+        _, reader = asyncio.run(fetch())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert reader.result()['title'] == 'Landed'
+    assert peak < 8 * 1024 * 1024
+
+
+def test_fetch_stops_reading_at_the_end_of_the_head(origin):
+    origin.route('/long', body=page('Long', body='<p>filler</p>' * 200000))
+    _, reader = fetch_head(origin.url('/long'), {}, create_extractor(), head_cache=None)
+    assert reader.result()['title'] == 'Long'
+    assert not reader.truncated
+    assert reader.bytes_read < 256 * 1024
+
+
+def test_fetch_stops_at_the_byte_cap_when_the_head_never_ends(origin):
+    origin.route('/endless', body=b'<html><head><title>Endless</title>' + b'<meta name="x" content="y">' * 20000)
+    _, reader = fetch_head(origin.url('/endless'), {}, create_extractor(), max_bytes=64 * 1024, head_cache=None)
+    assert reader.truncated
+    assert reader.result()['title'] == 'Endless'
+    assert reader.bytes_read <= 64 * 1024
+
+
+def test_identical_heads_reuse_the_earlier_parse(origin):
+    head_cache = HeadResultCache()
+    head = '<script>var s = "</head><body>";</script><meta name="after-script" content="kept">'
+    origin.route('/one', body=page('Same', head, body='<p>One</p>'))
+    origin.route('/two', body=page('Same', head, body='<p>Two, a different body</p>'))
+    origin.route('/other', body=page('Other', head))
+
+    readers = {}
+    results = {}
+    for path in ('/one', '/two', '/other'):
+        _, readers[path] = fetch_head(origin.url(path), {}, create_extractor(), head_cache=head_cache)
+        results[path] = readers[path].result()  # Caches the parse
+    assert [readers[path].parse_skipped for path in ('/one', '/two', '/other')] == [False, True, False]
+    assert results['/two'] == results['/one']
+    assert results['/one']['metadata'][-1]['attributes']['name'] == 'after-script'
+    assert results['/other']['title'] == 'Other'
+
+
+def test_fetches_reuse_keep_alive_connections(origin):
+    origin.route('/old', 301, b'moved', {'Location': '/page'})
+    origin.route('/page', body=page('Landed'))
+    for _ in range(3):
+        fetch_head(origin.url('/old'), {}, create_extractor(), head_cache=None)
+    assert len(origin.requests) == 6
+    assert origin.connections == 1
+
+
+def test_cookies_last_for_one_redirect_chain(origin):
+    origin.route('/gate', handler=consent_gate)
+    for _ in range(2):
+        _, reader = fetch_head(origin.url('/gate'), {}, create_extractor(), head_cache=None)
+        assert reader.result()['title'] == 'Consented'
+    # Each fetch starts without cookies: the second one was redirected through the gate again
+    assert ['Cookie' in headers for _, headers in origin.requests] == [False, True, False, True]
+
+
+def test_retry_after_is_not_honoured(origin):
+    unavailable = origin.route('/busy', 503, b'busy', {'Retry-After': '3'})
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch_head(origin.url('/busy'), {}, create_extractor(), head_cache=None)
+    assert time.monotonic() - started < 2
+    assert unavailable.hits == fetcher.HTTP_RETRIES + 1
+
+
+def test_a_body_cut_short_is_a_fetch_error(origin, memory_cache):
+    def short(request):
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html')
+        request.send_header('Content-Length', '100000')
+        request.end_headers()
+        request.wfile.write(b'<html><head><title>Short')
+        request.close_connection = True
+
+    origin.route('/short', handler=short)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        fetch_head(origin.url('/short'), {}, create_extractor(), head_cache=None)
+    response = app.test_client().post('/extract', json={'url': origin.url('/short')})
+    assert response.status_code == 500
+    assert response.get_json()['error'].startswith(f"Could not fetch or process URL: {origin.url('/short')}")
+
+
+def test_a_head_cache_of_size_zero_is_not_used(origin):
+    origin.route('/page', body=page('Same'))
+    head_cache = HeadResultCache(max_entries=0)
+    for _ in range(2):
+        _, reader = fetch_head(origin.url('/page'), {}, create_extractor(), head_cache=head_cache)
+        assert reader.result()['title'] == 'Same' and not reader.parse_skipped
+    assert head_cache.stats()['head_hash_misses'] == 0
+
+
+@pytest.mark.parametrize('codec, content_type', [
+    ('utf-16', 'text/html'),  # Byte order mark
+    ('utf-16-be', 'text/html; charset=utf-16be'),
+    ('utf-32-le', 'text/html; charset=utf-32le'),
+])
+def test_wide_encodings_stop_at_the_end_of_the_head(origin, codec, content_type):
+    html = page('Wide', '<script>var s = "</head><body>";</script>', 'x' * 200000).decode()
+    body = html.encode(codec)
+    origin.route('/wide', body=body, headers={'Content-Type': content_type})
+    head_cache = HeadResultCache()
+    for skipped in (False, True):
+        _, reader = fetch_head(origin.url('/wide'), {}, create_extractor(), head_cache=head_cache)
+        assert reader.result()['title'] == 'Wide' and reader.parse_skipped is skipped
+        assert reader.bytes_read < len(body) // 2 and not reader.truncated
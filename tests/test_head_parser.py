@@ -0,0 +1,49 @@
+import pytest
+
+from head_parser import create_extractor, extract_head
+from projection import Fields
+
+BACKENDS = ('html.parser', 'lxml')
+
+HEAD = ('<!doctype html><html><head><meta charset="utf-8"><title> A &amp; B </title>'
+        '<meta property="og:title" content="OG"><meta name="description" content="Desc">'
+        '<link rel="alternate canonical" href=" https://example.com/a ">'
+        '<script>document.write("</head><body><meta name=late>")</script></head>'
+        '<body><meta name="in-body" content="no"><title>Not this</title></body></html>')
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extracts_title_meta_and_canonical_from_the_head_only(backend):
+    result = extract_head(HEAD, backend)
+    assert result['title'] == 'A & B'
+    assert result['canonical'] == 'https://example.com/a'
+    assert [tag['attributes'] for tag in result['metadata']] == [
+        {'charset': 'utf-8'},
+        {'property': 'og:title', 'content': 'OG'},
+        {'name': 'description', 'content': 'Desc'},
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_stops_at_the_end_of_the_head_while_fed_in_pieces(backend):
+    extractor = create_extractor(backend)
+    for start in range(0, len(HEAD), 7):
+        extractor.feed(HEAD[start:start + 7])
+        if extractor.done:
+            break
+    assert extractor.done
+    assert HEAD.index('</script></head>') <= start + 7 <= HEAD.index('in-body')
+    extractor.close()
+    assert extractor.result()['title'] == 'A & B'
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_projection_skips_unselected_meta_tags(backend):
+    extractor = create_extractor(backend, fields=Fields.parse('og:*'))
+    extractor.feed(HEAD)
+    extractor.close()
+    assert [tag['attributes'] for tag in extractor.result()['metadata']] == [{'property': 'og:title', 'content': 'OG'}]
+
+
+def test_unterminated_title_is_kept():
+    assert extract_head('<head><title>Cut off')['title'] == 'Cut off'
@@ -0,0 +1,40 @@
+import threading
+
+from history import HistoryStore, snapshot_hash
+
+
+def _result(title, image):
+    return {'title': title, 'canonical': None, 'metadata': [
+        {'attributes': {'name': 'description', 'content': 'About'}},
+        {'attributes': {'property': 'og:image', 'content': image}},
+    ]}
+
+
+def test_snapshot_hash_ignores_meta_order():
+    result = _result('Page', 'a.png')
+    reordered = {**result, 'metadata': result['metadata'][::-1]}
+    assert snapshot_hash(result) == snapshot_hash(reordered)
+
+
+def test_unchanged_pages_share_a_snapshot_and_changes_are_diffed(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    url = 'https://example.com/'
+    assert store.record(url, _result('Page', 'a.png'), 'miss', 0.1) is True
+    assert store.record(url, _result('Page', 'a.png'), 'miss', 0.1) is False
+    assert store.record(url, _result('Page', 'b.png'), 'miss', 0.1) is True
+
+    conn = store._db.connect()
+    assert conn.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0] == 2
+    [change] = store.changes(url)
+    assert change['diff'] == {'metadata': {'changed': {'property=og:image': {'from': 'a.png', 'to': 'b.png'}}}}
+    assert store.summary(url)['checks'] == 3
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(store._db.connect()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not store._db.connect()
+    assert store._db.connect() is store._db.connect()
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import time
+
+import app
+import jobs
+from conftest import page
+from jobs import JobRunner, JobStore
+
+
+def test_importing_the_app_starts_no_job_runner(tmp_path):
+    path = tmp_path / 'jobs.sqlite3'
+    code = 'import app, jobs, threading; print(jobs._runner, sorted(t.name for t in threading.enumerate()))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)), check=True,
+                            env={**os.environ, 'JOBS_DB_PATH': str(path)}, capture_output=True, text=True).stdout
+    assert output.strip() == "None ['MainThread']"
+    assert not path.exists()
+
+
+def test_job_runner_starts_on_a_workers_first_request(monkeypatch):
+    monkeypatch.setattr(jobs, '_runner', jobs._runner)  # Restored afterwards
+    monkeypatch.setattr(jobs, '_runner_pid', -1)  # As if started in the parent, before a fork
+    monkeypatch.setattr(jobs, 'JobRunner', lambda store: type('Runner', (), {'start': lambda self: None})())
+    app.app.test_client().get('/cache/stats')
+    assert jobs._runner_pid == os.getpid()
+
+
+def test_orphaned_job_resumes_with_the_urls_not_yet_done(origin, tmp_path, memory_cache):
+    first = origin.route('/first', body=page('First'))
+    second = origin.route('/second', body=page('Second'))
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create('batch', {'fresh': True}, [origin.url('/first'), origin.url('/second')])
+    store.claim()
+    store.record(job_id, 0, {'url': origin.url('/first'), 'title': 'First'})
+    # The worker running the job died: no heartbeat since long ago
+    store._db.connect().execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time() - 3600, job_id))
+
+    job = store.claim()
+    assert job['id'] == job_id
+    JobRunner(store)._run(job)
+
+    assert (first.hits, second.hits) == (0, 1)
+    finished = store.get(job_id)
+    assert (finished['status'], finished['completed'], finished['failed']) == ('done', 2, 0)
+    titles = [result['title'] for _, _, result in store.iter_results(job_id)]
+    assert titles == ['First', 'Second']
+
+
+def test_submitted_jobs_run_in_the_background_and_page_their_results(origin, memory_cache):
+    for name in ('a', 'b', 'c'):
+        origin.route(f'/{name}', body=page(name.upper()))
+    client = app.app.test_client()
+    response = client.post('/jobs', json={'urls': [origin.url(f'/{name}') for name in ('a', 'b', 'c')]})
+    assert response.status_code == 202
+    job_url = response.headers['Location']
+
+    deadline = time.monotonic() + 10
+    while client.get(job_url).get_json()['status'] != 'done':
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    first = client.get(f'{job_url}/results?limit=2').get_json()
+    rest = client.get(f"{job_url}/results?after={first['next_after']}").get_json()
+    titles = {result['index']: result['title'] for result in first['results'] + rest['results']}
+    assert titles == {0: 'A', 1: 'B', 2: 'C'}
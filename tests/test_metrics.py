@@ -0,0 +1,72 @@
+import re
+
+import pytest
+
+from app import app
+from conftest import page
+
+
+def _value(text, name, **labels):
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{re.escape(name)}(?:\{{{re.escape(wanted)}\}})? (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_metrics_count_requests_phases_and_errors(origin, memory_cache):
+    origin.route('/page', body=page())
+    client = app.test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+    client.post('/extract?fresh=1', json={'url': origin.url('/page')})
+    client.post('/extract', json={'url': 'http://localhost:abc/'})
+    after = client.get('/metrics').get_data(as_text=True)
+
+    def delta(name, **labels):
+        return _value(after, name, **labels) - _value(before, name, **labels)
+
+    assert delta('metaverifier_http_requests_total', endpoint='extract_meta', status='200') == 1
+    assert delta('metaverifier_http_requests_total', endpoint='extract_meta', status='400') == 1
+    assert delta('metaverifier_errors_total', category='invalid_url') == 1
+    for phase in ('connect', 'ttfb', 'parse', 'serialize'):
+        assert delta('metaverifier_extraction_phase_seconds_count', phase=phase) == 1
+    assert delta('metaverifier_bytes_fetched_total') > 0
+    assert '# TYPE metaverifier_extraction_seconds histogram' in after
+
+
+def test_timings_break_down_the_request_and_every_redirect_hop(origin, memory_cache):
+    origin.route('/old', 301, b'', {'Location': '/new'})
+    origin.route('/new', body=page('Moved'))
+    response = app.test_client().post('/extract?timings=1&fresh=1', json={'url': origin.url('/old')})
+    timings = response.get_json()['timings']
+    assert [(hop['url'], hop['status']) for hop in timings['hops']] == [(origin.url('/old'), 301), (origin.url('/new'), 200)]
+    assert {'total_ms', 'fetch_ms', 'parse_ms', 'serialize_ms'} <= set(timings)
+    assert {'connect_ms', 'ttfb_ms'} <= set(timings['phases'])
+    server_timing = response.headers['Server-Timing']
+    assert server_timing.startswith(f"total;dur={timings['total_ms']}")
+    assert 'parse;dur=' in server_timing
+
+
+def test_timings_are_left_out_unless_asked_for(origin, memory_cache):
+    origin.route('/page', body=page())
+    response = app.test_client().post('/extract', json={'url': origin.url('/page')})
+    assert 'timings' not in response.get_json() and 'Server-Timing' not in response.headers
+
+
+@pytest.mark.parametrize('propagate', [False, True])
+def test_an_unhandled_error_is_counted_once(monkeypatch, propagate):
+    import app as app_module
+
+    def broken():
+        raise RuntimeError('broken cache')
+
+    monkeypatch.setattr(app_module, 'get_cache', broken)
+    monkeypatch.setitem(app.config, 'PROPAGATE_EXCEPTIONS', propagate)
+    client = app.test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.get('/cache/stats')
+    else:
+        assert client.get('/cache/stats').status_code == 500
+    after = client.get('/metrics').get_data(as_text=True)
+    name, labels = 'metaverifier_http_requests_total', {'endpoint': 'cache_stats', 'status': '500'}
+    assert _value(after, name, **labels) - _value(before, name, **labels) == 1
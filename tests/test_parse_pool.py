@@ -0,0 +1,49 @@
+import pytest
+
+import parse_pool
+from conftest import page
+from fetcher import HeadResultCache, fetch_head
+from head_parser import create_extractor
+
+META = ''.join(f'<meta name="tag-{n}" content="value {n}">' for n in range(200))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(parse_pool, 'PARSE_POOL_SIZE', 1)
+    monkeypatch.setattr(parse_pool, 'PARSE_OFFLOAD_BYTES', 1024)
+    yield
+    if parse_pool._pool is not None:
+        parse_pool._pool.shutdown()
+        parse_pool._pool = None
+
+
+def _fetch(origin, path, head_cache=None):
+    # Offloading applies when the head is read one boundary candidate at a time, i.e. with a head cache
+    _, reader = fetch_head(origin.url(path), {}, create_extractor(), head_cache=head_cache)
+    return reader
+
+
+def test_large_heads_are_parsed_in_the_pool_with_the_same_result(origin, pool):
+    origin.route('/big', body=page('Big', META))
+    offloaded = _fetch(origin, '/big', head_cache=HeadResultCache())
+    assert offloaded._offloaded is not None
+    assert offloaded.result() == _fetch(origin, '/big').result()
+    assert len(offloaded.result()['metadata']) == 200
+
+
+def test_a_false_head_end_in_the_pool_is_finished_inline(origin, pool):
+    origin.route('/script', body=page('Script', META + '<script>"</head>"</script><meta name="last">'))
+    reader = _fetch(origin, '/script', head_cache=HeadResultCache())
+    assert reader._offloaded is None
+    assert reader.result()['title'] == 'Script' and len(reader.result()['metadata']) == 201
+
+
+def test_a_failed_pool_falls_back_to_parsing_inline(origin, pool, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('pool is gone')
+
+    monkeypatch.setattr(parse_pool, '_submit', broken)
+    origin.route('/big', body=page('Big', META))
+    reader = _fetch(origin, '/big', head_cache=HeadResultCache())
+    assert reader.result()['title'] == 'Big' and len(reader.result()['metadata']) == 200
@@ -0,0 +1,76 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+import payloads
+from app import app
+from conftest import page
+from payloads import columnar, gzip_body
+from projection import Fields, InvalidFieldsError
+
+HEAD = ('<link rel="canonical" href="https://example.com/"><meta property="og:title" content="OG">'
+        '<meta property="og:image" content="img.png"><meta name="twitter:card" content="summary">'
+        '<meta name="Description" content="Desc">')
+
+
+def test_fields_parse_into_a_canonical_projection():
+    fields = Fields.parse(' og:* ,title,DESCRIPTION,title')
+    assert fields.key == 'description,og:*,title'
+    assert Fields.parse(['title']).key == 'title'
+    assert Fields.parse('') is None and Fields.parse(None) is None
+    assert fields.keeps_meta(['og:image']) and fields.keeps_meta([None, 'Description'])
+    assert not fields.keeps_meta(['twitter:card'])
+    for bad in ({'title': 1}, [1], ','.join(f'f{n}' for n in range(101))):
+        with pytest.raises(InvalidFieldsError):
+            Fields.parse(bad)
+
+
+def test_projected_extraction_keeps_only_the_selected_parts(origin, memory_cache):
+    origin.route('/page', body=page('Projected', HEAD))
+    client = app.test_client()
+    result = client.post('/extract?fields=title,og:*', json={'url': origin.url('/page')}).get_json()
+    assert set(result) == {'title', 'metadata', 'cache'}
+    assert [tag['attributes']['property'] for tag in result['metadata']] == ['og:title', 'og:image']
+    # A cached full result is projected rather than fetched again
+    client.post('/extract', json={'url': origin.url('/page')})
+    hit = client.post('/extract', json={'url': origin.url('/page'), 'fields': ['canonical']}).get_json()
+    assert hit == {'canonical': 'https://example.com/', 'cache': 'hit'}
+    assert client.post('/extract', json={'url': origin.url('/page'), 'fields': 7}).status_code == 400
+
+
+def test_columnar_encoding_shares_attribute_names():
+    results = [
+        {'url': 'a', 'title': 'A', 'metadata': [{'attributes': {'name': 'description', 'content': 'x'}}]},
+        {'url': 'b', 'error': 'failed', 'status': 400},
+    ]
+    encoded = columnar(results)
+    assert encoded['count'] == 2 and encoded['attributes'] == ['name', 'content']
+    assert encoded['columns']['title'] == ['A', None]
+    assert encoded['columns']['metadata'] == [[[0, 'description', 1, 'x']], None]
+    assert encoded['columns']['status'] == [None, 400]
+
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it(origin, memory_cache):
+    assert gzip_body(b'x' * 10, 'gzip') == (b'x' * 10, False)
+    body, compressed = gzip_body(b'x' * payloads.GZIP_MIN_BYTES, 'br;q=1, gzip;q=0.5')
+    assert compressed and gzip.decompress(body) == b'x' * payloads.GZIP_MIN_BYTES
+    assert gzip_body(b'x' * payloads.GZIP_MIN_BYTES, 'gzip;q=0')[1] is False
+
+    origin.route('/page', body=page('Big', HEAD * 50))
+    response = app.test_client().post('/extract', json={'url': origin.url('/page')}, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data()))['title'] == 'Big'
+
+
+def test_streamed_lines_are_compressed_one_flush_at_a_time(origin, memory_cache):
+    for name in ('a', 'b'):
+        origin.route(f'/{name}', body=page(name))
+    response = app.test_client().post('/extract/batch?stream=1', json={'urls': [origin.url('/a'), origin.url('/b')]},
+                                      headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    first = decompressor.decompress(next(iter(response.response)))
+    assert first.endswith(b'\n') and json.loads(first)['index'] in (0, 1)  # A whole line, before the stream ends
+    response.close()
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import politeness
+from politeness import HostPoliteness, RobotsDisallowed, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert 0 < bucket.reserve() <= 0.1
+
+
+def test_robots_rules_are_fetched_once_and_enforced(origin):
+    robots = origin.route('/robots.txt', body=b'User-agent: *\nDisallow: /private\n', headers={'Content-Type': 'text/plain'})
+    polite = HostPoliteness()
+    polite.check(origin.url('/public'))
+    with pytest.raises(RobotsDisallowed):
+        polite.check(origin.url('/private/page'))
+    assert robots.hits == 1
+
+
+def test_unreachable_robots_disallows_everything_for_a_short_while(origin):
+    robots = origin.route('/robots.txt', 503, b'down', {'Content-Type': 'text/plain'})
+    polite = HostPoliteness(robots_retry_interval=0.2)
+    for _ in range(2):
+        with pytest.raises(RobotsDisallowed):
+            polite.check(origin.url('/page'))
+    assert robots.hits == 1
+    time.sleep(0.2)
+    robots.status, robots.body = 200, b'User-agent: *\nDisallow:\n'
+    polite.check(origin.url('/page'))
+    assert robots.hits == 2
+
+
+def test_a_robots_fetch_that_fails_is_handled_like_a_server_error():
+    polite = HostPoliteness()
+    with pytest.raises(RobotsDisallowed):
+        polite.check('http://127.0.0.1:9/page')  # Nothing listens there
+    assert polite._robots['http://127.0.0.1:9'][0] < time.time() + politeness.ROBOTS_RETRY_INTERVAL + 1
+
+
+def test_robots_cache_keeps_only_the_most_recent_hosts(monkeypatch):
+    monkeypatch.setattr(politeness, 'MAX_TRACKED_HOSTS', 2)
+    polite = HostPoliteness()
+    for port in (1, 2, 1, 3):
+        polite._rules_for(f'http://127.0.0.1:{port}')  # Nothing listens there: cached as unreachable
+    assert list(polite._robots) == ['http://127.0.0.1:1', 'http://127.0.0.1:3']
+
+
+def test_crawl_delay_applies_from_a_hosts_first_requests(origin):
+    origin.route('/robots.txt', body=b'User-agent: *\nCrawl-delay: 10\n', headers={'Content-Type': 'text/plain'})
+    polite = HostPoliteness()
+    host = origin.url('').split('//')[1]
+    assert polite.reserve(host) == 0  # This request fetches robots.txt first
+    assert polite.reserve(host) == politeness.ROBOTS_POLL_INTERVAL  # The rest wait for it
+    polite.check(origin.url('/page'))
+    assert polite.reserve(host) > 9  # Crawl-delay now paces the host; no burst
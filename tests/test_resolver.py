@@ -0,0 +1,69 @@
+import socket
+import time
+
+import pytest
+
+import resolver
+from app import app
+from resolver import DNSCache
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Replaces the system resolver: example.test resolves to 127.0.0.1, anything else fails."""
+    calls = []
+
+    def getaddrinfo(host):
+        calls.append(host)
+        time.sleep(0.05)
+        if host != 'example.test':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return ['127.0.0.1']
+
+    monkeypatch.setattr(resolver, '_getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(resolver, 'dns', None)  # No TTL lookups
+    return calls
+
+
+def test_answers_are_cached_case_insensitively(lookups):
+    cache = DNSCache()
+    assert cache.resolve('example.test') == ['127.0.0.1']
+    assert cache.resolve('EXAMPLE.test') == ['127.0.0.1']
+    assert cache.resolve('127.0.0.2') == ['127.0.0.2']  # Literals are never looked up
+    assert lookups == ['example.test']
+
+
+def test_failures_are_cached_until_the_negative_ttl_runs_out(lookups, monkeypatch):
+    cache = DNSCache()
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            cache.resolve('dead.test')
+    assert lookups == ['dead.test']
+    monkeypatch.setattr(resolver, 'DNS_NEGATIVE_TTL', 0)
+    cache._entries.clear()
+    with pytest.raises(socket.gaierror):
+        cache.resolve('dead.test')
+    with pytest.raises(socket.gaierror):
+        cache.resolve('dead.test')
+    assert lookups == ['dead.test'] * 3
+
+
+def test_prefetch_resolves_in_the_background(lookups):
+    cache = DNSCache()
+    assert cache.cached('example.test') is None
+    cache.prefetch('example.test:8080')
+    deadline = time.monotonic() + 5
+    while cache.cached('example.test') is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    cache.prefetch('example.test')  # Already cached: no second lookup
+    assert lookups == ['example.test']
+
+
+def test_an_unresolvable_host_is_reported_as_a_dns_error(lookups, memory_cache):
+    client = app.test_client()
+    for _ in range(2):
+        response = client.post('/extract', json={'url': 'http://unresolvable-host-for-tests.test/'})
+        assert response.status_code == 400
+        assert 'resolve the host name' in response.get_json()['error']
+    assert lookups.count('unresolvable-host-for-tests.test') == 1
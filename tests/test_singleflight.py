@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import page
+from extractor import extract
+from singleflight import AsyncSingleFlight, SingleFlight, shared_lock
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'result'
+
+    with ThreadPoolExecutor(5) as pool:
+        outcomes = list(pool.map(lambda _: flight.do('key', slow), range(5)))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+    assert {result for result, _ in outcomes} == {'result'}
+
+
+def test_the_leaders_error_reaches_every_follower():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, 'key', failing)
+        started.wait()
+        follower = pool.submit(flight.do, 'key', failing)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_async_callers_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'result'
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do('key', slow) for _ in range(3)))
+
+    assert [shared for _, shared in asyncio.run(scenario())] == [False, True, True]
+    assert len(calls) == 1
+
+
+def test_identical_extractions_are_fetched_once(origin, memory_cache):
+    route = origin.route('/page', body=page('Shared'), delay=0.3)
+    with ThreadPoolExecutor(4) as pool:
+        outcomes = list(pool.map(lambda _: extract(origin.url('/page')), range(4)))
+    assert route.hits == 1
+    assert sorted(status for _, status in outcomes) == ['coalesced', 'coalesced', 'coalesced', 'miss']
+
+
+def test_shared_lock_is_held_by_one_holder_at_a_time():
+    with shared_lock('https://example.com/') as first:
+        assert first is True
+        with shared_lock('https://example.com/', timeout=0.1) as second:
+            assert second is False  # Another holder (as another worker would be) has it
+    with shared_lock('https://example.com/', timeout=0.1) as again:
+        assert again is True
+    with shared_lock('https://example.com/', enabled=False) as disabled:
+        assert disabled is False